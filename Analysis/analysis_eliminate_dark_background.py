@@ -1,5 +1,16 @@
 import os
-import pandas as pd
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from batch_executor import default_workers, run_groups
+from folder_watcher import FolderWatcher, snapshot_csv_tree
+from spectrum_sets import load_group, write_set
+from profiling import profiled
+from settings import apply_settings
+from spectrum_cube import has_group, list_groups, list_spectrum_files, open_cube, read_spectrum
+from wavelength_grid import get_grid
 
 # --- Please replace with your own paths ---
 
@@ -12,82 +23,256 @@ main_sample_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110-modified/600s/s
 # 3. Main Output folder (result output)
 main_output_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110-modified/600s/analysis'
 
-# Ensure the main output folder exists
-os.makedirs(main_output_folder, exist_ok=True)
+# 4. Optional: binary spectrum cubes built from the two folders above with
+#    `python spectrum_cube.py <folder> <cube folder>`. When set, spectra are sliced
+#    from the memory-mapped cube instead of parsing the CSV files (None = read CSVs)
+background_cube_folder = None
+sample_cube_folder = None
+
+# 5. Number of worker processes; subfolder groups are processed in parallel
+#    (1 = process the groups one after another in this process)
+n_workers = default_workers()
+
+# 6. Watch mode: keep running and subtract only new or changed Sample/Background pairs
+#    as they arrive (stop with Ctrl+C). Reads the CSV folders; the cube settings are ignored
+watch_mode = False
+watch_interval = 0.2  # seconds between folder scans
+
+# 7. Master dark: average the Background spectra of each group once and subtract that mean
+#    from every Sample spectrum of the group in one step (one dark series serves the whole
+#    group, so Sample files need no Background file of the same name). Not used in watch mode
+master_dark = False
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
 
 # ----------------------------
 
-# 1. Get all subfolder names in the main Sample folder
-# Use the Sample subfolder list as the reference for processing
-subfolders_to_process = [
-    d for d in os.listdir(main_sample_folder)
-    if os.path.isdir(os.path.join(main_sample_folder, d))
-]
 
-print(f"--- 🚀 Found {len(subfolders_to_process)} subfolder groups to process ---")
+def subtract_pair(subfolder_name, filename, main_background_folder, main_sample_folder, output_folder,
+                  background_cube=None, sample_cube=None):
+    # Sample - Background for one file of one group; returns True if the net spectrum was written
+    import pandas as pd
 
-# 2. Iterate over each subfolder name
-for subfolder_name in subfolders_to_process:
-    # Construct full paths for the current subfolder group
-    folder1 = os.path.join(main_background_folder, subfolder_name)  # Background (minuend)
-    folder2 = os.path.join(main_sample_folder, subfolder_name)      # Sample (subtrahend)
-    output_folder = os.path.join(main_output_folder, subfolder_name)  # NetSample (output)
+    background = read_spectrum(main_background_folder, subfolder_name, filename, background_cube)
+    sample = read_spectrum(main_sample_folder, subfolder_name, filename, sample_cube)
+
+    # Ensure both Background and Sample files exist
+    if background is None or sample is None:
+        print(f"⚠️ Missing corresponding file: {filename} (in Background or Sample)")
+        return False
+
+    # Background recorded on a different wavelength grid is resampled onto the Sample grid
+    # (grids are fingerprinted once, see wavelength_grid.py) instead of skipping the file
+    sample_grid = get_grid(sample.wavelengths)
+    background_grid = get_grid(background.wavelengths)
+    background_values = background_grid.resample(background.values, sample_grid)
+    if background_grid is not sample_grid:
+        print(f"ℹ️ Background resampled onto the Sample wavelength grid: {filename}")
+
+    # Subtraction: Sample second column (index 1) minus Background second column
+    diff = sample.values - background_values
+
+    # Set negative values to 0 (original logic)
+    diff[diff < 0] = 0
+
+    # Copy wavelength / first column and add the result as the new second column
+    result_df = pd.DataFrame({sample.wavelength_column: sample.wavelengths, sample.value_column: diff})
+
+    # Save file
+    output_path = os.path.join(output_folder, filename)
+    with profiled('writing', written=[output_path]):
+        result_df.to_csv(output_path, index=False)
+    # print(f"  > Generated: {filename}")
+    return True
+
+
+def subtract_master_dark(subfolder_name, filenames, main_background_folder, main_sample_folder, output_folder,
+                         background_cube=None, sample_cube=None):
+    # Sample - master dark for the given files of one group; returns the number of files written
+    background_set = load_group(main_background_folder, subfolder_name, background_cube)
+    sample_set = load_group(main_sample_folder, subfolder_name, sample_cube, filenames)
+    if background_set is None or sample_set is None:
+        return 0
+
+    # Master dark: mean of the group's Background spectra, computed and resampled onto the
+    # Sample grid once, then subtracted from the whole (files x pixels) matrix by broadcasting
+    master = get_grid(background_set.wavelengths).resample(background_set.values.mean(axis=0),
+                                                            get_grid(sample_set.wavelengths))
+    print(f"  > Master dark of {len(background_set.filenames)} Background spectra")
+    diff = sample_set.values - master
+    np.maximum(diff, 0, out=diff)
+    write_set(sample_set._replace(values=diff), output_folder)
+    return len(sample_set.filenames)
+
+
+# === Pairing: both trees are listed once and joined with set operations ===
+
+PairIndex = namedtuple('PairIndex', ['paired', 'sample_only', 'background_only', 'missing_groups'])
+
+
+def index_tree(folder, groups, cube=None):
+    # {group: set of CSV filenames} for the groups present in one tree (one listing per group)
+    return {group: set(list_spectrum_files(folder, group, cube))
+            for group in groups if has_group(folder, group, cube)}
 
-    # Check whether the Background folder exists (ensure a complete group)
-    if not os.path.exists(folder1):
-        print(f"\n⚠️ Warning: Background folder '{subfolder_name}' is missing. Skipping this group.")
-        continue
 
-    # Ensure the current output subfolder exists
+def pair_files(groups, main_background_folder, main_sample_folder, background_cube=None, sample_cube=None,
+               master_dark=False):
+    """Pair the Sample and Background files of `groups` (Sample subfolder names).
+
+    paired: {group: sorted Sample filenames to process} for every group with a Background
+    folder - files present in both trees, or, with master_dark, every Sample file of a group
+    that has Background spectra. sample_only / background_only: [(group, filename)] without a
+    partner. missing_groups: groups without a Background folder.
+    """
+    samples = index_tree(main_sample_folder, groups, sample_cube)
+    backgrounds = index_tree(main_background_folder, groups, background_cube)
+    paired, sample_only, background_only = {}, [], []
+    for group in groups:
+        if group not in backgrounds:
+            continue
+        sample_files = samples.get(group, set())
+        background_files = backgrounds[group]
+        if master_dark:
+            matched = sample_files if background_files else set()
+        else:
+            matched = sample_files & background_files
+            background_only.extend((group, f) for f in sorted(background_files - sample_files))
+        paired[group] = sorted(matched)
+        sample_only.extend((group, f) for f in sorted(sample_files - matched))
+    missing_groups = [group for group in groups if group not in backgrounds]
+    return PairIndex(paired, sample_only, background_only, missing_groups)
+
+
+def print_unpaired(index, limit=20):
+    # One summary of everything that could not be paired, instead of a warning per file
+    if index.missing_groups:
+        print(f"⚠️ {len(index.missing_groups)} groups without a Background folder (skipped): "
+              f"{', '.join(index.missing_groups)}")
+    for label, keys in (('Sample files without a Background file', index.sample_only),
+                        ('Background files without a Sample file', index.background_only)):
+        if keys:
+            shown = ', '.join(f"{group}/{filename}" for group, filename in keys[:limit])
+            more = f", ... (+{len(keys) - limit} more)" if len(keys) > limit else ''
+            print(f"⚠️ {len(keys)} {label}: {shown}{more}")
+    if not (index.missing_groups or index.sample_only or index.background_only):
+        print("✅ Every Sample file has a Background partner.")
+
+
+def process_group(subfolder_name, main_background_folder, main_sample_folder, main_output_folder,
+                  background_cube_folder=None, sample_cube_folder=None, pairs=None, master_dark=False):
+    # Dark subtraction for one subfolder group; `pairs` is PairIndex.paired from pair_files()
+    # (None = pair this group here). Returns the number of files generated (None if the group
+    # is skipped). Runs in a worker process, see batch_executor.py
+    background_cube = open_cube(background_cube_folder)
+    sample_cube = open_cube(sample_cube_folder)
+
+    if pairs is None:
+        index = pair_files([subfolder_name], main_background_folder, main_sample_folder,
+                           background_cube, sample_cube, master_dark)
+        print_unpaired(index)
+        pairs = index.paired
+
+    # Groups without a Background folder are skipped (and listed in the unpaired summary)
+    if subfolder_name not in pairs:
+        return None
+
+    # Construct the output path for the current subfolder group and ensure it exists
+    output_folder = os.path.join(main_output_folder, subfolder_name)  # NetSample (output)
     os.makedirs(output_folder, exist_ok=True)
     print(f"\n✅ Processing folder group: **{subfolder_name}**")
 
-    # 3. Iterate over all CSV files in folder2 (Sample)
+    # 3. Subtract the paired CSV files of the Sample group
+    filenames = pairs[subfolder_name]
+    if master_dark:
+        processed_count = subtract_master_dark(subfolder_name, filenames, main_background_folder,
+                                               main_sample_folder, output_folder, background_cube, sample_cube)
+        print(f"🎉 Group '{subfolder_name}' processing complete. {processed_count} files generated.")
+        return processed_count
+
     processed_count = 0
-    for filename in os.listdir(folder2):
-        if filename.endswith('.csv'):
-            file1_path = os.path.join(folder1, filename)  # Background file
-            file2_path = os.path.join(folder2, filename)  # Sample file
-
-            # Ensure both Background and Sample files exist
-            if os.path.exists(file1_path) and os.path.exists(file2_path):
-                try:
-                    df1 = pd.read_csv(file1_path)
-                    df2 = pd.read_csv(file2_path)
-
-                    # Check whether both files have at least two columns
-                    if df1.shape[1] < 2 or df2.shape[1] < 2:
-                        print(f"⚠️ Fewer than 2 columns detected, skipping: {filename}")
-                        continue
-
-                    # Check whether data lengths match (recommended to avoid row mismatch issues)
-                    if len(df1) != len(df2):
-                        print(f"⚠️ Row count mismatch ({len(df1)} vs {len(df2)}), skipping: {filename}")
-                        continue
-
-                    # Copy wavelength / first column
-                    result_df = df2.iloc[:, [0]].copy()
-
-                    # Subtraction: Sample second column (index 1) minus Background second column
-                    diff = df2.iloc[:, 1] - df1.iloc[:, 1]
-
-                    # Set negative values to 0 (original logic)
-                    diff[diff < 0] = 0
-
-                    # Add result as the new second column
-                    result_df[df2.columns[1]] = diff
-
-                    # Save file
-                    output_path = os.path.join(output_folder, filename)
-                    result_df.to_csv(output_path, index=False)
-                    # print(f"  > Generated: {filename}")
-                    processed_count += 1
-                except Exception as e:
-                    print(f"❌ Error while processing file {filename}: {e}")
-                    continue
-            else:
-                print(f"⚠️ Missing corresponding file: {filename} (in Background or Sample)")
+    for filename in filenames:
+        try:
+            if subtract_pair(subfolder_name, filename, main_background_folder, main_sample_folder,
+                             output_folder, background_cube, sample_cube):
+                processed_count += 1
+        except Exception as e:
+            print(f"❌ Error while processing file {filename}: {e}")
+            continue
 
     print(f"🎉 Group '{subfolder_name}' processing complete. {processed_count} files generated.")
+    return processed_count
+
+
+def watch_and_subtract(main_background_folder, main_sample_folder, main_output_folder, interval=0.2):
+    # Long-running incremental mode: poll both trees and subtract only the pairs whose Sample
+    # or Background file is new or changed; a pair is processed once both files exist
+    watcher = FolderWatcher([main_sample_folder, main_background_folder], interval)
+    total = 0
+
+    def subtract_keys(keys):
+        nonlocal total
+        for subfolder_name, filename in keys:
+            sample_path = os.path.join(main_sample_folder, subfolder_name, filename)
+            background_path = os.path.join(main_background_folder, subfolder_name, filename)
+            try:
+                acquired = max(os.stat(sample_path).st_mtime, os.stat(background_path).st_mtime)
+            except FileNotFoundError:
+                continue  # the other file of the pair has not arrived yet
+            output_folder = os.path.join(main_output_folder, subfolder_name)
+            os.makedirs(output_folder, exist_ok=True)
+            try:
+                if subtract_pair(subfolder_name, filename, main_background_folder, main_sample_folder, output_folder):
+                    total += 1
+                    latency = time.time() - acquired
+                    print(f"  > {subfolder_name}/{filename} ({latency * 1000:.0f} ms after acquisition)")
+            except Exception as e:
+                print(f"❌ Error while processing file {subfolder_name}/{filename}: {e}")
+
+    # Catch up first: pairs with no net spectrum yet, or one older than its inputs
+    snapshots = [snapshot_csv_tree(folder) for folder in watcher.root_folders]
+    watcher.mark_handled(snapshots)
+    sample_files, background_files = snapshots
+    stale = []
+    for key, (mtime_ns, _) in sample_files.items():
+        if key not in background_files:
+            continue
+        output_path = os.path.join(main_output_folder, *key)
+        newest = max(mtime_ns, background_files[key][0])
+        if not os.path.exists(output_path) or os.stat(output_path).st_mtime_ns < newest:
+            stale.append(key)
+    print(f"--- 🚀 {len(stale)} pairs without an up-to-date net spectrum ---")
+    subtract_keys(sorted(stale))
+
+    print(f"\n👀 Watching '{main_sample_folder}' and '{main_background_folder}' (Ctrl+C to stop)")
+    watcher.watch(subtract_keys)
+    print(f"\n=== ✨ Watch mode stopped. {total} net spectra generated. ===")
+
+
+if __name__ == '__main__':
+    # Ensure the main output folder exists
+    os.makedirs(main_output_folder, exist_ok=True)
+
+    if watch_mode:
+        watch_and_subtract(main_background_folder, main_sample_folder, main_output_folder, watch_interval)
+    else:
+        # 1. Get all subfolder names in the main Sample folder
+        # Use the Sample subfolder list as the reference for processing
+        sample_cube = open_cube(sample_cube_folder)
+        subfolders_to_process = list_groups(main_sample_folder, sample_cube)
+
+        # 2. Pair the Sample and Background files of all groups at once
+        index = pair_files(subfolders_to_process, main_background_folder, main_sample_folder,
+                           open_cube(background_cube_folder), sample_cube, master_dark)
+        n_pairs = sum(len(filenames) for filenames in index.paired.values())
+        mode = 'master dark' if master_dark else 'file pairs'
+        print(f"--- 🚀 Found {len(subfolders_to_process)} subfolder groups, {n_pairs} Sample files to process ({mode}) ---")
+        print_unpaired(index)
+
+        # 3. Process each paired subfolder group (in parallel); messages are reported in group order
+        run_groups(process_group, list(index.paired),
+                   args=(main_background_folder, main_sample_folder, main_output_folder,
+                         background_cube_folder, sample_cube_folder, index.paired, master_dark),
+                   workers=n_workers)
 
-print("\n=== ✨ All subfolder groups have been processed! ===")
+        print("\n=== ✨ All subfolder groups have been processed! ===")
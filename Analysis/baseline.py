@@ -0,0 +1,115 @@
+import functools
+
+import numpy as np
+
+from wavelength_grid import get_grid
+
+# Baseline estimation for plot_normalization.py. All functions take a batch of spectra
+# (spectra x pixels, or a single spectrum) sharing one wavelength axis.
+#
+#   'window_mean'  mean intensity inside [low, high] nm, subtracted as a constant offset
+#                  (the original correction; fine for flat baselines)
+#   'als'          asymmetric least squares (Eilers & Boelens): the smooth curve z that
+#                  minimises  sum w (y - z)^2 + lam * sum (second difference of z)^2,
+#                  with weight p for points above z and 1 - p below, re-weighted a few
+#                  times. Follows sloping / curved baselines such as the scattering of
+#                  MOF suspensions. The system is pentadiagonal, so each solve is one
+#                  O(pixels) banded Cholesky (scipy.linalg.solveh_banded), a few ms per
+#                  3648-pixel spectrum
+#   'polynomial'   iterative polynomial fit (modified polyfit): points above the fitted
+#                  polynomial are clipped to it and the fit is repeated, so the curve
+#                  settles under the peaks; one least-squares solve for the whole batch
+#
+# lam sets the stiffness in units of pixels^4: the baseline must not follow bands that are
+# a few hundred pixels wide (a 12 nm band on the CCS100), hence lam ~ 1e8 - 1e10 there;
+# p is the asymmetry (typically 0.001 - 0.01).
+
+BASELINE_MODES = ('window_mean', 'als', 'polynomial')
+
+
+def window_mean_baseline(wavelengths, values, low, high):
+    # (spectra, 1) mean of every spectrum inside [low, high] nm
+    mask = get_grid(wavelengths).mask(low, high)
+    return np.atleast_2d(values)[:, mask].mean(axis=1, keepdims=True)
+
+
+@functools.lru_cache(maxsize=16)
+def _penalty_bands(n_pixels, lam):
+    # lam * D'D (D = second difference) in the upper banded form of solveh_banded:
+    # rows = 2nd superdiagonal, 1st superdiagonal, diagonal
+    rows = np.ones(n_pixels - 2)
+    bands = np.zeros((3, n_pixels))
+    bands[0, 2:] = 1.0
+    bands[1, 1:] = np.convolve(rows, [-2.0, -2.0])
+    bands[2] = np.convolve(rows, [1.0, 4.0, 1.0])
+    bands *= lam
+    bands.flags.writeable = False
+    return bands
+
+
+def als_baseline(values, lam=1e9, p=0.001, n_iter=10):
+    """Asymmetric least squares baseline of every spectrum (pixels in wavelength order)."""
+    from scipy.linalg import solveh_banded
+
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    n_pixels = y.shape[1]
+    if n_pixels < 3:
+        return y.copy()
+    penalty = _penalty_bands(n_pixels, float(lam))
+    baseline = np.empty_like(y)
+    bands = penalty.copy()
+    for i, spectrum in enumerate(y):
+        w = np.ones(n_pixels)
+        for _ in range(n_iter):
+            bands[2] = penalty[2] + w
+            z = solveh_banded(bands, w * spectrum, check_finite=False)
+            new_w = np.where(spectrum > z, p, 1.0 - p)
+            if np.array_equal(new_w, w):
+                break
+            w = new_w
+        baseline[i] = z
+    return baseline
+
+
+def polynomial_baseline(wavelengths, values, degree=3, n_iter=100, tol=1e-3):
+    """Iterative (modified) polynomial baseline of every spectrum."""
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    # Scaled to [-1, 1] so high degrees stay well conditioned
+    span = (wavelengths.max() - wavelengths.min()) / 2 or 1.0
+    vander = np.vander((wavelengths - wavelengths.mean()) / span, degree + 1)
+    projection = np.linalg.pinv(vander)
+    clipped = y.copy()
+    for _ in range(n_iter):
+        fit = (clipped @ projection.T) @ vander.T
+        new = np.minimum(clipped, fit)
+        change = np.linalg.norm(new - clipped, axis=1) / np.maximum(np.linalg.norm(clipped, axis=1), 1e-300)
+        clipped = new
+        if change.max() < tol:
+            break
+    return fit
+
+
+def estimate_baseline(wavelengths, values, mode='window_mean', window=(570, 740),
+                      lam=1e9, p=0.001, n_iter=10, degree=3):
+    """Baseline of (spectra x pixels) values, broadcastable against values.
+
+    window is only used by 'window_mean'; lam, p and n_iter by 'als'; degree by 'polynomial'.
+    """
+    if mode == 'window_mean':
+        return window_mean_baseline(wavelengths, values, *window)
+    if mode not in BASELINE_MODES:
+        raise ValueError(f"Unknown baseline mode '{mode}', expected one of {BASELINE_MODES}")
+
+    # The curve fits need the pixels in wavelength order
+    grid = get_grid(wavelengths)
+    y = grid.sort(np.atleast_2d(values))
+    if mode == 'als':
+        baseline = als_baseline(y, lam, p, n_iter)
+    else:
+        baseline = polynomial_baseline(grid.sorted_wavelengths, y, degree)
+    if not grid.is_sorted:
+        unsorted = np.empty_like(baseline)
+        unsorted[:, grid.order] = baseline
+        baseline = unsorted
+    return baseline
@@ -0,0 +1,84 @@
+import contextlib
+import io
+import os
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import profiling
+
+# Shared batch executor for the Analysis scripts.
+#
+# Each subfolder group (or chunk of files) is independent, so the scripts hand one
+# function call per group to a process pool. Everything the group function prints
+# (progress lines, ⚠️ warnings, ❌ errors) is captured and reported together with its
+# result, always in the order the groups were given, whatever order they finish in.
+#
+# The group function must be a module-level function (so it can be pickled), and the
+# calling script must keep its top-level work under `if __name__ == '__main__':`,
+# because worker processes import the script module again on macOS/Windows.
+
+# Chunks of files sized to a memory budget come from memory_budget.py.
+
+# profile: per-group record when profiling is enabled (see profiling.py), else None
+GroupResult = namedtuple('GroupResult', ['group', 'result', 'output', 'error', 'profile'], defaults=(None,))
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _run_group(func, group, args):
+    buffer = io.StringIO()
+    result, error, profile = None, None, None
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.redirect_stdout(buffer))
+        if profiling.enabled():
+            profile = stack.enter_context(profiling.group_profile(group))
+        try:
+            result = func(group, *args)
+        except Exception:
+            error = traceback.format_exc()
+    return GroupResult(group, result, buffer.getvalue(), error, profile)
+
+
+def run_groups(func, groups, args=(), workers=None, report=True):
+    """Call func(group, *args) for every group, using a pool of `workers` processes.
+
+    Returns a list of GroupResult in the order of `groups`. With report=True the captured
+    output of each group (and the traceback of a failed group) is printed in that order
+    as soon as the group and all groups before it are finished.
+    workers=None uses every core; workers=1 runs in this process without a pool.
+    """
+    groups = list(groups)
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(groups)))
+
+    results = []
+    if workers == 1:
+        outcomes = (_run_group(func, group, args) for group in groups)
+        results = _collect(outcomes, report)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields in submission order, which gives the fixed report order
+            outcomes = pool.map(_run_group, [func] * len(groups), groups, [args] * len(groups))
+            results = _collect(outcomes, report)
+    return results
+
+
+def _collect(outcomes, report):
+    results = []
+    for outcome in outcomes:
+        profiling.add_group_record(outcome.profile)
+        if report:
+            print_group_result(outcome)
+        results.append(outcome)
+    return results
+
+
+def print_group_result(group_result):
+    if group_result.output:
+        print(group_result.output, end='')
+    if group_result.error:
+        print(f"❌ Error while processing group '{group_result.group}':\n{group_result.error}", end='')
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from baseline import BASELINE_MODES, estimate_baseline  # noqa: E402
+from synthetic_data import ccs100_wavelengths, molar_absorptivity  # noqa: E402
+
+# Benchmark: the baseline modes of plot_normalization.py (see baseline.py) on synthetic
+# 3648-pixel absorbance spectra with a scattering baseline (offset + slope + lambda^-4 term,
+# different for every spectrum) under the absorption peaks of synthetic_data.py.
+#
+# Reports the time per spectrum and the RMS error of the corrected spectra against the
+# true peak-only spectra, overall and at the 410 nm peak.
+
+# ======== Settings ========
+batch_sizes = [1, 100, 1000]   # spectra per folder
+n_pixels = 3648
+window = (570, 740)            # 'window_mean' range, as in plot_normalization.py
+als_options = dict(lam=1e9, p=0.001, n_iter=10)
+polynomial_degree = 3
+seed = 0
+
+
+def synthetic_absorbances(n_spectra, n_pixels, seed=0):
+    # (wavelengths, measured spectra, true peak-only spectra)
+    rng = np.random.default_rng(seed)
+    wavelengths = ccs100_wavelengths(n_pixels)
+    peaks = rng.uniform(10, 100, (n_spectra, 1)) * molar_absorptivity(wavelengths)
+    x = (wavelengths - 350.0) / 350.0
+    offset = rng.uniform(-0.05, 0.05, (n_spectra, 1))
+    slope = rng.uniform(-0.2, 0.2, (n_spectra, 1))
+    scattering = rng.uniform(0.0, 0.3, (n_spectra, 1)) * (350.0 / wavelengths) ** 4
+    noise = 0.002 * rng.standard_normal((n_spectra, n_pixels))
+    return wavelengths, peaks + offset + slope * x + scattering + noise, peaks
+
+
+def time_mode(wavelengths, values, mode):
+    options = dict(als_options, degree=polynomial_degree)
+    start = time.perf_counter()
+    baseline = estimate_baseline(wavelengths, values, mode, window, **options)
+    return time.perf_counter() - start, values - baseline
+
+
+if __name__ == '__main__':
+    print(f"{'spectra':>8} {'mode':>12} {'ms/spectrum':>12} {'spectra/s':>10} {'RMS error':>10} {'error @410 nm':>14}")
+    for n_spectra in batch_sizes:
+        wavelengths, values, truth = synthetic_absorbances(n_spectra, n_pixels, seed)
+        peak = np.argmin(np.abs(wavelengths - 410.0))
+        for mode in BASELINE_MODES:
+            time_mode(wavelengths, values[:1], mode)  # warm-up: imports scipy, builds the ALS penalty
+            elapsed, corrected = time_mode(wavelengths, values, mode)
+            rms = np.sqrt(np.mean((corrected - truth) ** 2))
+            peak_error = np.sqrt(np.mean((corrected[:, peak] - truth[:, peak]) ** 2))
+            print(f"{n_spectra:>8} {mode:>12} {1000 * elapsed / n_spectra:>12.3f} {n_spectra / elapsed:>10.0f} "
+                  f"{rms:>10.4f} {peak_error:>14.4f}")
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spectrum_reader import read_spectra  # noqa: E402
+
+# Benchmark: spectrum_reader.read_spectra() vs one pd.read_csv() per file,
+# on folders of synthetic 3648-pixel CCS100 spectra.
+
+# ======== Settings ========
+folder_sizes = [1000, 10000]   # number of spectra per folder
+n_pixels = 3648
+work_folder = None             # None = temporary folder (deleted afterwards)
+
+
+def write_synthetic_folder(folder, n_files, n_pixels, seed=0):
+    # Two-column CSVs in the CCS100 export layout; a few distinct spectra are written cyclically
+    rng = np.random.default_rng(seed)
+    wavelengths = np.round(np.linspace(200, 1000, n_pixels), 3)
+    templates = []
+    for _ in range(16):
+        intensity = np.round(1000 + 50 * rng.standard_normal(n_pixels), 4)
+        lines = [f"{w},{v}" for w, v in zip(wavelengths, intensity)]
+        templates.append(("Wavelength (nm),Intensity (a.u.)\n" + "\n".join(lines) + "\n").encode())
+    os.makedirs(folder, exist_ok=True)
+    for i in range(n_files):
+        with open(os.path.join(folder, f"{i}.csv"), 'wb') as f:
+            f.write(templates[i % len(templates)])
+
+
+def time_pandas(paths):
+    start = time.perf_counter()
+    values = np.array([pd.read_csv(p).iloc[:, 1].to_numpy() for p in paths])
+    return time.perf_counter() - start, values
+
+
+def time_reader(paths):
+    start = time.perf_counter()
+    batch = read_spectra(paths)
+    return time.perf_counter() - start, batch.values
+
+
+if __name__ == '__main__':
+    root = work_folder or tempfile.mkdtemp(prefix='uvvis_bench_')
+    try:
+        print(f"{'spectra':>8} {'pd.read_csv':>14} {'read_spectra':>14} {'speed-up':>9}")
+        for n_files in folder_sizes:
+            folder = os.path.join(root, f"{n_files}")
+            write_synthetic_folder(folder, n_files, n_pixels)
+            paths = [os.path.join(folder, f"{i}.csv") for i in range(n_files)]
+
+            t_pandas, expected = time_pandas(paths)
+            t_reader, values = time_reader(paths)
+            assert np.array_equal(expected, values), "read_spectra() differs from pd.read_csv()"
+
+            print(f"{n_files:>8} {n_files / t_pandas:>10.0f} /s {n_files / t_reader:>10.0f} /s "
+                  f"{t_pandas / t_reader:>8.1f}x")
+            shutil.rmtree(folder)
+    finally:
+        if work_folder is None:
+            shutil.rmtree(root, ignore_errors=True)
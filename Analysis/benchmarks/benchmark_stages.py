@@ -0,0 +1,149 @@
+import contextlib
+import csv
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analysis_eliminate_dark_background  # noqa: E402
+import data_avg  # noqa: E402
+import log_calculation  # noqa: E402
+import plot_normalization  # noqa: E402
+from calibration import fit_calibration  # noqa: E402
+from settings import apply_settings  # noqa: E402
+from spectrum_reader import read_spectra  # noqa: E402
+from synthetic_data import generate_dataset  # noqa: E402
+
+# Benchmark suite: times every analysis stage on synthetic CCS100 datasets (see
+# synthetic_data.py) of several sizes and reports the throughput in spectra per second.
+#
+#   dark_subtraction  analysis_eliminate_dark_background.process_group, every replicate
+#   average           data_avg.average_files over all replicates
+#   absorbance        log_calculation.process_subfolder, every replicate
+#   normalization     plot_normalization.process_subfolder, every replicate
+#   fit               read + closed-form fit of every wavelength, as in linear_fit.py
+#
+# Stages run in this process (no worker pool) with their console output suppressed.
+# Every run is appended to results_file; a stage that got slower than the last recorded
+# run of the same size by more than regression_tolerance is flagged.
+
+# ======== Settings ========
+dataset_sizes = [(3, 20), (3, 100), (3, 400)]   # (replicates, concentrations)
+n_pixels = 3648
+work_folder = None             # None = temporary folder (deleted afterwards)
+results_file = 'benchmark_stages_results.csv'  # in the current folder (None = not recorded)
+regression_tolerance = 0.2     # flag throughput drops of more than 20%
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+RESULT_COLUMNS = ['timestamp', 'commit', 'stage', 'replicates', 'concentrations', 'spectra', 'seconds',
+                  'spectra_per_s']
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def timed(func, *args):
+    # Wall time of func(*args), console output discarded
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+
+def run_stages(root, replicates):
+    # {stage: (seconds, spectra processed)} for one generated dataset
+    back, sample = os.path.join(root, 'back'), os.path.join(root, 'sample')
+    net, avg = os.path.join(root, 'analysis'), os.path.join(root, 'average')
+    absorbance, normalized = os.path.join(root, 'absorbance'), os.path.join(root, 'normalized')
+    os.makedirs(avg, exist_ok=True)
+    filenames = sorted(os.listdir(os.path.join(sample, replicates[0])))
+    n_spectra = len(replicates) * len(filenames)
+
+    def dark_subtraction():
+        for rep in replicates:
+            analysis_eliminate_dark_background.process_group(rep, back, sample, net)
+
+    def average():
+        data_avg.average_files(filenames, net, avg, replicates)
+
+    def log_absorbance():
+        for rep in replicates:
+            log_calculation.process_subfolder(rep, net, absorbance, None, True)
+
+    def normalization():
+        for rep in replicates:
+            plot_normalization.process_subfolder(rep, absorbance, normalized, 570, 740)
+
+    def fit():
+        for rep in replicates:
+            paths = [os.path.join(absorbance, rep, f) for f in filenames]
+            batch = read_spectra(paths)
+            concentrations = np.array([float(os.path.splitext(os.path.basename(p))[0]) for p in batch.paths])
+            fit_calibration(concentrations, batch.values)
+
+    return {
+        'dark_subtraction': (timed(dark_subtraction), n_spectra),
+        'average': (timed(average), n_spectra),
+        'absorbance': (timed(log_absorbance), n_spectra),
+        'normalization': (timed(normalization), n_spectra),
+        'fit': (timed(fit), n_spectra),
+    }
+
+
+def last_results(path):
+    # {(stage, replicates, concentrations): spectra_per_s} of the most recent recorded run
+    previous = {}
+    if path and os.path.exists(path):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                previous[(row['stage'], int(row['replicates']), int(row['concentrations']))] = float(row['spectra_per_s'])
+    return previous
+
+
+if __name__ == '__main__':
+    root = work_folder or tempfile.mkdtemp(prefix='uvvis_bench_')
+    previous = last_results(results_file)
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    commit = current_commit()
+    rows = []
+    try:
+        print(f"{'dataset':>10} {'stage':>17} {'seconds':>9} {'spectra/s':>10}")
+        for n_replicates, n_concentrations in dataset_sizes:
+            folder = os.path.join(root, f"{n_replicates}x{n_concentrations}")
+            generate_dataset(folder, n_replicates, n_concentrations, n_pixels=n_pixels)
+            replicates = [str(r) for r in range(1, n_replicates + 1)]
+
+            for stage, (seconds, n_spectra) in run_stages(folder, replicates).items():
+                throughput = n_spectra / seconds
+                flag = ''
+                before = previous.get((stage, n_replicates, n_concentrations))
+                if before and throughput < before * (1 - regression_tolerance):
+                    flag = f"  ⚠️ regression: {before:.0f} -> {throughput:.0f} spectra/s"
+                print(f"{n_replicates:>4}x{n_concentrations:<5} {stage:>17} {seconds:>9.3f} {throughput:>10.0f}{flag}")
+                rows.append([timestamp, commit, stage, n_replicates, n_concentrations, n_spectra,
+                             f"{seconds:.4f}", f"{throughput:.1f}"])
+            shutil.rmtree(folder)
+    finally:
+        if work_folder is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if results_file:
+        new_file = not os.path.exists(results_file)
+        with open(results_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(RESULT_COLUMNS)
+            writer.writerows(rows)
+        print(f"✅ Results appended to {results_file}")
@@ -0,0 +1,166 @@
+from collections import namedtuple
+
+import numpy as np
+
+from memory_budget import column_windows
+
+# Closed-form calibration engine used by linear_fit.py.
+# Every wavelength (column of the absorbance matrix) is fitted at once instead of
+# running one sklearn LinearRegression per pixel. The columns are independent, so a
+# campaign with many spectra is fitted one wavelength window at a time, sized to the
+# memory budget (see memory_budget.py).
+
+# (samples x wavelengths) float arrays alive at once while a window is fitted
+_FIT_COPIES = 10
+
+# NumPy sums a single column pairwise but several columns row by row, so windows have at
+# least 2 columns: every wavelength is then reduced in the same order as in one window
+# over all columns, and the results do not depend on the memory budget
+_MIN_WINDOW_COLUMNS = 2
+
+CalibrationResult = namedtuple(
+    'CalibrationResult',
+    ['slope', 'intercept', 'r2', 'n_inliers', 'mean_abs', 'inlier_mask']
+)
+
+
+def _masked_linear_fit(x, Y, mask):
+    # Ordinary least squares y = slope * x + intercept for every column of Y,
+    # using only the rows selected by the boolean mask of that column
+    w = mask.astype(float)
+    n = w.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (w * x[:, None]).sum(axis=0) / n
+        y_mean = (w * Y).sum(axis=0) / n
+        # Corrected two-pass means: without the rounding error of the first pass a constant
+        # column has exactly zero residuals, as with LinearRegression, so its points stay inliers
+        x_mean += (w * (x[:, None] - x_mean)).sum(axis=0) / n
+        y_mean += (w * (Y - y_mean)).sum(axis=0) / n
+        dx = (x[:, None] - x_mean) * w
+        dy = (Y - y_mean) * w
+        sxx = (dx * dx).sum(axis=0)
+        sxy = (dx * dy).sum(axis=0)
+        # A constant x column has no defined slope; LinearRegression returns 0 there
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+    intercept = y_mean - slope * x_mean
+    return slope, intercept, n, y_mean
+
+
+def _masked_r2(x, Y, mask, slope, intercept, y_mean):
+    # Same definition as LinearRegression.score(): 1 - SS_res / SS_tot,
+    # with 1.0 for a perfect fit of a constant and 0.0 for an imperfect one
+    residuals = np.where(mask, Y - (slope * x[:, None] + intercept), 0.0)
+    ss_res = (residuals ** 2).sum(axis=0)
+    ss_tot = (np.where(mask, Y - y_mean, 0.0) ** 2).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(ss_tot != 0, 1.0 - ss_res / ss_tot, np.where(ss_res == 0, 1.0, 0.0))
+    return r2
+
+
+def fit_calibration(concentrations, abs_matrix, columns=None, sigma=2.0, memory_budget_mb=None):
+    """Two-pass residual-filtered linear fit of absorbance vs concentration for every wavelength.
+
+    concentrations: (n_samples,) array, abs_matrix: (n_samples, n_wavelengths) array
+    (may be a np.memmap: only one window of columns is read at a time).
+    columns: optional boolean mask / index array of wavelengths to fit; the others are
+    reported as slope = intercept = NaN and R² = mean absorbance = inlier count = 0.
+    memory_budget_mb: MB of working arrays per wavelength window (None = the default budget).
+    """
+    x = np.asarray(concentrations, dtype=float)
+    if not isinstance(abs_matrix, np.ndarray):
+        abs_matrix = np.asarray(abs_matrix, dtype=float)
+    n_samples, n_wavelengths = abs_matrix.shape
+
+    selected = np.ones(n_wavelengths, dtype=bool)
+    if columns is not None:
+        selected = np.zeros(n_wavelengths, dtype=bool)
+        selected[columns] = True
+
+    slope = np.full(n_wavelengths, np.nan)
+    intercept = np.full(n_wavelengths, np.nan)
+    r2 = np.zeros(n_wavelengths)
+    n_inliers = np.zeros(n_wavelengths, dtype=int)
+    mean_abs = np.zeros(n_wavelengths)
+    inlier_mask = np.zeros((n_samples, n_wavelengths), dtype=bool)
+
+    # At least 2 points are needed for a line
+    if n_samples < 2 or not selected.any():
+        return CalibrationResult(slope, intercept, r2, n_inliers, mean_abs, inlier_mask)
+
+    all_cols = np.flatnonzero(selected)
+    for window in column_windows(len(all_cols), _FIT_COPIES * 8 * n_samples, memory_budget_mb,
+                                 _MIN_WINDOW_COLUMNS):
+        cols = all_cols[window]
+        Y = np.asarray(abs_matrix[:, cols], dtype=float)
+
+        # First fit (all data points)
+        all_rows = np.ones(Y.shape, dtype=bool)
+        slope1, intercept1, _, _ = _masked_linear_fit(x, Y, all_rows)
+        residuals = Y - (slope1 * x[:, None] + intercept1)
+        std_res = residuals.std(axis=0)
+
+        # Residual filtering as a boolean (samples x wavelengths) matrix
+        mask = np.abs(residuals) <= sigma * std_res
+
+        # Second fit (inliers only)
+        slope2, intercept2, n2, y_mean2 = _masked_linear_fit(x, Y, mask)
+        r2_2 = _masked_r2(x, Y, mask, slope2, intercept2, y_mean2)
+
+        # Wavelengths left with fewer than 2 inliers are treated as not fitted
+        ok = n2 >= 2
+        slope[cols[ok]] = slope2[ok]
+        intercept[cols[ok]] = intercept2[ok]
+        r2[cols[ok]] = r2_2[ok]
+        n_inliers[cols[ok]] = n2[ok]
+        mean_abs[cols[ok]] = y_mean2[ok]
+        inlier_mask[:, cols[ok]] = mask[:, ok]
+
+    return CalibrationResult(slope, intercept, r2, n_inliers, mean_abs, inlier_mask)
+
+
+# === Persisted fit results (see calibration_explorer.py) ===
+# The fitted wavelengths of a run, in ascending order, with the data points needed to plot
+# any of them again: wavelengths are looked up with a binary search and nothing is refitted.
+
+FitResults = namedtuple(
+    'FitResults',
+    ['wavelengths', 'concentrations', 'abs_matrix', 'slope', 'intercept', 'r2', 'n_inliers', 'mean_abs',
+     'inlier_mask', 'best_index']
+)
+
+
+def window_results(wavelengths, concentrations, abs_matrix, fit, columns, best_index=-1):
+    # FitResults of the fitted columns only (wavelengths must be ascending);
+    # best_index is an index of the full wavelength array (-1 = none)
+    columns = np.flatnonzero(np.asarray(columns)) if np.asarray(columns).dtype == bool else np.asarray(columns)
+    best = np.searchsorted(columns, best_index) if best_index in columns else -1
+    return FitResults(np.asarray(wavelengths, dtype=float)[columns], np.asarray(concentrations, dtype=float),
+                      np.asarray(abs_matrix, dtype=float)[:, columns], fit.slope[columns], fit.intercept[columns],
+                      fit.r2[columns], fit.n_inliers[columns], fit.mean_abs[columns], fit.inlier_mask[:, columns],
+                      int(best))
+
+
+def save_fit_results(results, path):
+    # One uncompressed .npz; the boolean inlier masks are bit-packed
+    fields = results._asdict()
+    mask = fields.pop('inlier_mask')
+    np.savez(path, inlier_bits=np.packbits(mask, axis=None), inlier_shape=np.array(mask.shape), **fields)
+
+
+def load_fit_results(path):
+    with np.load(path) as data:
+        shape = tuple(data['inlier_shape'])
+        mask = np.unpackbits(data['inlier_bits'], count=int(np.prod(shape))).astype(bool).reshape(shape)
+        fields = {name: data[name] for name in FitResults._fields if name != 'inlier_mask'}
+    fields['best_index'] = int(fields['best_index'])
+    return FitResults(inlier_mask=mask, **fields)
+
+
+def nearest_index(wavelengths, wavelength):
+    # Index of the wavelength closest to `wavelength` in an ascending array (binary search)
+    i = int(np.searchsorted(wavelengths, wavelength))
+    if i == 0:
+        return 0
+    if i == len(wavelengths):
+        return len(wavelengths) - 1
+    return i if wavelengths[i] - wavelength < wavelength - wavelengths[i - 1] else i - 1
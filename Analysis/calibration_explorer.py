@@ -0,0 +1,26 @@
+from calibration import load_fit_results
+from calibration_plots import explore, plot_fit
+from settings import apply_settings
+
+# Explorer for the per-wavelength fit results saved by linear_fit.py (fit_results_file).
+# Opens the file, shows the best wavelength and then plots the fit at any wavelength you
+# enter, without reading the spectra or refitting anything.
+
+# === Fit results written by linear_fit.py ===
+fit_results_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/calibration_fit.npz'
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+if __name__ == '__main__':
+    results = load_fit_results(fit_results_file)
+    print("Loaded fit results: {} wavelengths, {:.3f}-{:.3f} nm, {} samples".format(
+        len(results.wavelengths), results.wavelengths[0], results.wavelengths[-1], len(results.concentrations)))
+
+    if results.best_index >= 0:
+        best = results.best_index
+        print("Best wavelength: {:.3f} nm".format(results.wavelengths[best]))
+        print("R² = {:.4f}, Avg absorbance = {:.4f}".format(results.r2[best], results.mean_abs[best]))
+        plot_fit(results, best)
+
+    explore(results)
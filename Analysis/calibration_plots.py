@@ -0,0 +1,75 @@
+import numpy as np
+
+from calibration import nearest_index
+
+# Plots of saved per-wavelength fit results (calibration.FitResults), shared by linear_fit.py
+# and calibration_explorer.py.
+
+
+def plot_fit(results, idx, value_label='Absorbance'):
+    # Inlier points and fitted line at wavelength index idx of the results (value_label: y axis,
+    # e.g. '1st derivative of absorbance' for derivative spectra)
+    import matplotlib.pyplot as plt
+
+    inliers = results.inlier_mask[:, idx]
+    X = results.concentrations[inliers]
+    y = results.abs_matrix[inliers, idx]
+    if len(X) == 0:
+        print("No valid data for this wavelength.")
+        return
+
+    # Locate the (0,0) point
+    is_zero_zero = (X == 0) & (y == 0)
+
+    # Separate the (0,0) point from other points
+    X_zero = X[is_zero_zero]
+    y_zero = y[is_zero_zero]
+    X_other = X[~is_zero_zero]
+    y_other = y[~is_zero_zero]
+
+    slope = results.slope[idx]
+    intercept = results.intercept[idx]
+    r2 = results.r2[idx]
+
+    X_for_predict = np.linspace(X.min(), X.max(), 100)
+    y_pred = slope * X_for_predict + intercept
+
+    plt.figure(figsize=(8, 6))
+
+    # Plot non-(0,0) points
+    plt.scatter(X_other, y_other, color='blue', label='Data Points (Non-Zero)')
+    # Highlight the (0,0) point
+    if len(X_zero) > 0:
+        plt.scatter(X_zero, y_zero, color='green', marker='D', s=80, label='(0, 0) Point')
+
+    plt.plot(X_for_predict, y_pred, color='red',
+             label='y = {:.4f}x + {:.4f}\nR² = {:.4f}'.format(slope, intercept, r2))
+    plt.xlabel('Concentration (µM)')
+    plt.ylabel(value_label)
+    plt.title('Linear Fit at {:.3f} nm'.format(results.wavelengths[idx]))
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+
+def explore(results, low=None, high=None, value_label='Absorbance'):
+    # Interactive inspection of other wavelengths (within [low, high], default: the saved range)
+    low = results.wavelengths[0] if low is None else low
+    high = results.wavelengths[-1] if high is None else high
+    while True:
+        user_input = input("\nEnter another wavelength to view (or press Enter to exit): ").strip()
+        if not user_input:
+            print("Exit.")
+            break
+        try:
+            target_wl = float(user_input)
+        except ValueError:
+            print("Invalid input. Try again.")
+            continue
+        if not (low <= target_wl <= high):
+            print("Wavelength {:.3f} nm is outside the specified range.".format(target_wl))
+            continue
+        closest_idx = nearest_index(results.wavelengths, target_wl)
+        print("Closest wavelength: {:.3f} nm".format(results.wavelengths[closest_idx]))
+        plot_fit(results, closest_idx, value_label)
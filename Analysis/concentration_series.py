@@ -0,0 +1,86 @@
+import os
+import re
+
+import numpy as np
+
+from multivariate_calibration import predict
+from profiling import profiled
+from smoothing import smooth, smoothing_setting
+from spectrum_cube import list_groups, list_spectrum_files, read_spectrum
+from spectrum_reader import print_malformed, read_spectra
+
+# Concentrations of a time-point folder tree, for predict_concentrations.py,
+# concentration_vs_time_plot.py and kinetics.py:
+#   absorbance_root/<time point>/<replicate>.csv      e.g. 30s/1.csv, 30s/2.csv, 360s/1.csv ...
+# The spectra are filtered with the smoothing stored with the calibration before they are
+# converted (see multivariate_calibration.py).
+
+
+def time_point_key(name):
+    # Sort time points by their numeric part ('30s' < '360s' < '900s'), then by name
+    match = re.search(r'[0-9]+(?:\.[0-9]+)?', name)
+    return (float(match.group()) if match else float('inf'), name)
+
+
+def preprocess(wavelengths, values, smoothing=None):
+    # Spectra as the calibration saw them: (window length, polynomial order, derivative order)
+    # Savitzky-Golay filter, or unchanged for smoothing=None
+    return values if smoothing is None else smooth(wavelengths, values, *smoothing)
+
+
+def calibration_smoothing(model, smoothing=None):
+    # Smoothing to predict with: the one stored with the calibration. A `smoothing` setting
+    # that disagrees with it would give meaningless concentrations, so it is an error
+    if smoothing is not None and smoothing_setting(smoothing) != model.smoothing:
+        raise ValueError(f"smoothing = {tuple(smoothing)} does not match the calibration, which was fitted "
+                         f"with smoothing = {model.smoothing}; remove the setting or refit the calibration")
+    return model.smoothing
+
+
+def predict_folder(folder, model):
+    # {replicate name: concentration} for every spectrum CSV of one folder, filtered with the
+    # calibration's smoothing
+    smoothing = model.smoothing
+    filenames = sorted(list_spectrum_files(folder))
+    batch = read_spectra([os.path.join(folder, f) for f in filenames])
+    names = [os.path.splitext(os.path.basename(p))[0] for p in batch.paths]
+    concentrations = {}
+    if batch.paths:
+        values = preprocess(batch.wavelengths, batch.values, smoothing)
+        concentrations = dict(zip(names, predict(model, values, batch.wavelengths)))
+
+    # Files outside the batch layout (e.g. another wavelength grid) are converted one by one
+    malformed = []
+    for path, reason in batch.malformed:
+        try:
+            spectrum = read_spectrum(folder, '', os.path.basename(path))
+            concentrations[os.path.splitext(os.path.basename(path))[0]] = float(
+                predict(model, preprocess(spectrum.wavelengths, spectrum.values, smoothing), spectrum.wavelengths))
+        except Exception:
+            malformed.append((path, reason))
+    print_malformed(malformed)
+    return concentrations
+
+
+def predict_time_series(absorbance_root, model, smoothing=None):
+    """Time x replicate concentration table (DataFrame, one column per time point).
+
+    smoothing: optional check, must match the smoothing stored with the model (None = use it).
+    """
+    import pandas as pd
+
+    calibration_smoothing(model, smoothing)
+
+    with profiled('listing'):
+        time_points = sorted(list_groups(absorbance_root), key=time_point_key)
+    columns = {}
+    for time_point in time_points:
+        concentrations = predict_folder(os.path.join(absorbance_root, time_point), model)
+        if not concentrations:
+            print(f"⚠️ No spectra found for time point '{time_point}', skipping.")
+            continue
+        columns[time_point] = pd.Series(concentrations)
+        print(f"✅ {time_point}: {len(concentrations)} spectra, mean concentration = "
+              f"{np.mean(list(concentrations.values())):.3f}")
+    # Replicates become rows; time points with fewer replicates are padded with NaN
+    return pd.DataFrame(columns)
@@ -1,28 +1,46 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import stats
+
+from confidence_intervals import confidence_interval
+from multivariate_calibration import load_calibration
+from concentration_series import predict_time_series
+from settings import apply_settings
 
 # ======== Path settings ========
 input_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/analysis/NH2_3_time-conc-2.csv'  # Change to your concentration data file path
 unit = 'μM'
 
+# ======== Optional: predict the concentrations directly from the spectra ========
+# Time-point folder tree of absorbance spectra and a stored calibration (see
+# predict_concentrations.py); None = read the time x replicate table from input_file
+absorbance_root = None
+calibration_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/best_wavelength.csv'
+smoothing = None  # optional check of the smoothing stored with the calibration (None = use the stored one)
+
+# ======== Confidence intervals (see confidence_intervals.py) ========
+ci_method = 't'            # 't' (Student t, right for a few replicates) or 'bootstrap' (percentile)
+bootstrap_resamples = 10000
+bootstrap_seed = 0         # fixed seed: the same bootstrap intervals on every run (None = random)
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
 # ======== Read data ========
-df = pd.read_csv(input_file)
+if absorbance_root is not None:
+    df = predict_time_series(absorbance_root, load_calibration(calibration_file), smoothing)
+else:
+    df = pd.read_csv(input_file)
 time_points = df.columns  # e.g. ['30s', '360s', '900s']
 
 # ======== Calculate mean values and 95% confidence intervals ========
-means = []
-ci_95 = []
-
-for col in df.columns:
-    data = df[col].dropna().astype(float)
-    mean_val = data.mean()
-    sem = stats.sem(data)
-    ci = 1.96 * sem  # 95% confidence interval
-    means.append(mean_val)
-    ci95.append(ci)
-    print(f"{col}: Mean concentration = {mean_val:.3f} {unit}, 95% CI = ±{ci:.3f}")
+# One row per time point, one column per replicate (NaN = missing), all time points at once
+ci = confidence_interval(df.to_numpy(dtype=float).T, ci_method, 0.95,
+                         n_resamples=bootstrap_resamples, seed=bootstrap_seed)
+means = ci.center
+ci_95 = [means - ci.lower, ci.upper - means]  # (possibly asymmetric) error bar lengths
+
+for col, mean_val, low, high in zip(df.columns, means, ci.lower, ci.upper):
+    print(f"{col}: Mean concentration = {mean_val:.3f} {unit}, 95% CI = [{low:.3f}, {high:.3f}]")
 
 # ======== Plotting ========
 x = np.arange(len(time_points))  # x-axis indices
@@ -35,7 +53,7 @@ for i, col in enumerate(df.columns):
     plt.scatter(np.full(len(y), x[i]), y, color='black', alpha=0.7, s=40, label='_nolegend_')
 
 # Plot mean values with red error bars
-plt.errorbar(x, means, yerr=ci95, fmt='o', capsize=5, elinewidth=2,
+plt.errorbar(x, means, yerr=ci_95, fmt='o', capsize=5, elinewidth=2,
              markerfacecolor='red', color='red', ecolor='red', label='Mean ± 95% CI')
 
 # ======== Style adjustments ========
@@ -1,5 +1,16 @@
 import os
-import pandas as pd
+import zlib
+
+import numpy as np
+
+from batch_executor import default_workers, run_groups
+from confidence_intervals import CI_METHODS, bootstrap_interval
+from memory_budget import chunk_by_budget, chunk_list
+from profiling import profiled
+from replicate_stats import RunningStats, combine_replicates
+from settings import apply_settings
+from spectrum_cube import list_groups, list_spectrum_files, open_cube, read_spectrum
+from wavelength_grid import get_grid
 
 # === Modify paths ===
 # Base folder path containing multiple subfolders
@@ -7,46 +18,186 @@ base_folder = '/Users/yang/Desktop/EPoN Spectrometer/CCS100 Spectrum Data_R110+c
 
 # Output folder
 output_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110+Citric/100000'
-os.makedirs(output_folder, exist_ok=True)
 
-# Get all subfolders (exclude hidden folders)
-subfolders = [os.path.join(base_folder, d) for d in os.listdir(base_folder)
-              if os.path.isdir(os.path.join(base_folder, d)) and not d.startswith('.')]
+# Optional: binary spectrum cube built from base_folder with
+# `python spectrum_cube.py <base_folder> <cube folder>` (None = read the CSV files)
+base_cube_folder = None
+
+# How replicates are combined per pixel:
+#   'mean'       - streaming mean with std, n and 95% CI columns (constant memory)
+#   'median', 'sigma_clip' (iterative sigma-clipped mean) or 'mad' (MAD-clipped mean) -
+#   robust modes for runs with a saturated or contaminated replicate; they stack the
+#   replicates of a chunk of files in memory and add a per-pixel rejected count column
+combine_method = 'mean'
+clip_sigma = 3.0
+
+# 95% CI columns of the 'mean' mode (see confidence_intervals.py):
+#   't'         - t-based half-width column, from the running statistics
+#   'bootstrap' - per-pixel percentile bounds (low / high columns); keeps the replicates of
+#                 one file in memory. A fixed seed gives the same intervals on every run
+#                 (None = random)
+ci_method = 't'
+bootstrap_resamples = 2000
+bootstrap_seed = 0
+
+# Number of worker processes; the CSV filenames are split into one chunk per worker
+# (1 = average all files in this process)
+n_workers = default_workers()
+
+# Memory budget (MB) of the robust modes: the files are split into chunks whose replicate
+# stacks fit the budget on all workers together (see memory_budget.py; None = default budget)
+memory_budget_mb = None
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+# Compute the average for each CSV filename of one chunk (runs in a worker process, see batch_executor.py).
+# Replicates are streamed one at a time into a running mean / variance (see replicate_stats.py),
+# so memory does not depend on the number of subfolders
+def average_files(csv_files, base_folder, output_folder, subfolders, base_cube_folder=None,
+                  ci_method='t', bootstrap_resamples=2000, bootstrap_seed=0):
+    import pandas as pd
+
+    base_cube = open_cube(base_cube_folder)
+
+    for fname in csv_files:
+        stats = RunningStats()
+        grid = None
+        replicates = []  # only kept for bootstrap CIs
+        for sub in subfolders:
+            spectrum = read_spectrum(base_folder, sub, fname, base_cube)
+            if spectrum is None:
+                print(f"Warning: {fname} not found in {os.path.join(base_folder, sub)}")
+                continue
+
+            # Assume the first column is Wavelength and the second column is Intensity;
+            # replicates on another wavelength grid are resampled onto the first one
+            spectrum_grid = get_grid(spectrum.wavelengths)
+            if grid is None:
+                grid = spectrum_grid
+            values = spectrum_grid.resample(spectrum.values, grid)
+            stats.add(values)
+            if ci_method == 'bootstrap':
+                replicates.append(values)
+
+        # Only process if the file exists in at least one subfolder
+        if grid is not None:
+            # Create the output DataFrame: mean, sample std, replicate count and 95% CI per pixel
+            avg_df = pd.DataFrame({
+                'Wavelength (nm)': grid.wavelengths,
+                'Mean Intensity (a.u.)': stats.result_mean(),
+                'Std Intensity (a.u.)': stats.std(),
+                'n': stats.n,
+            })
+            if ci_method == 'bootstrap':
+                # Pixels are the groups: (pixels x replicates). Every file gets its own seed,
+                # derived from bootstrap_seed and the filename, so files do not share resamples
+                # and a file's intervals do not depend on the chunk or worker it ran in
+                seed = None if bootstrap_seed is None else np.random.SeedSequence(
+                    [bootstrap_seed, zlib.crc32(fname.encode())])
+                ci = bootstrap_interval(np.array(replicates).T, 0.95, bootstrap_resamples, seed=seed)
+                avg_df['95% CI low (a.u.)'] = ci.lower
+                avg_df['95% CI high (a.u.)'] = ci.upper
+            else:
+                avg_df['95% CI (a.u.)'] = stats.ci95()
+
+            # Save the result
+            save_path = os.path.join(output_folder, fname)
+            with profiled('writing', written=[save_path]):
+                avg_df.to_csv(save_path, index=False)
+
+            print(f"Saved averaged file: {save_path}")
 
-# Get the list of CSV filenames from the first subfolder
-reference_folder = subfolders[0]
-csv_files = [f for f in os.listdir(reference_folder) if f.endswith('.csv')]
+    return len(csv_files)
 
-# Compute the average for each CSV filename
-for fname in csv_files:
-    dfs = []
+
+def spectrum_pixels(base_folder, subfolders, fname, base_cube=None):
+    # Pixel count of the first replicate of fname (0 if no replicate has it)
+    for sub in subfolders:
+        spectrum = read_spectrum(base_folder, sub, fname, base_cube)
+        if spectrum is not None:
+            return len(spectrum.values)
+    return 0
+
+
+# Robust combination for each CSV filename of one chunk: the chunk's replicates are stacked
+# into a (replicates x files x pixels) array and combined in one vectorized call
+def robust_combine_files(csv_files, base_folder, output_folder, subfolders, method, sigma,
+                         base_cube_folder=None):
+    import pandas as pd
+
+    base_cube = open_cube(base_cube_folder)
+
+    grids = {}
+    rows = {}
     for sub in subfolders:
-        fpath = os.path.join(sub, fname)
-        if os.path.exists(fpath):
-            df = pd.read_csv(fpath)
-            dfs.append(df)
-        else:
-            print(f"Warning: {fname} not found in {sub}")
-
-    # Only process if the file exists in at least one subfolder
-    if dfs:
-        # Assume the first column is Wavelength and the second column is Intensity
-        wavelength = dfs[0].iloc[:, 0]
-        intensities = [df.iloc[:, 1] for df in dfs]
-
-        # Calculate the mean
-        mean_intensity = pd.concat(intensities, axis=1).mean(axis=1)
-
-        # Create the output DataFrame
+        for fname in csv_files:
+            spectrum = read_spectrum(base_folder, sub, fname, base_cube)
+            if spectrum is None:
+                print(f"Warning: {fname} not found in {os.path.join(base_folder, sub)}")
+                continue
+            # Replicates on another wavelength grid are resampled onto the first one of the file
+            spectrum_grid = get_grid(spectrum.wavelengths)
+            grid = grids.setdefault(fname, spectrum_grid)
+            rows[(sub, fname)] = spectrum_grid.resample(spectrum.values, grid)
+
+    found = [fname for fname in csv_files if fname in grids]
+    if not found:
+        return 0
+    n_pixels = max(len(grids[fname]) for fname in found)
+
+    # Missing replicates (and shorter grids) are NaN, which combine_replicates ignores
+    stack = np.full((len(subfolders), len(found), n_pixels), np.nan)
+    for r, sub in enumerate(subfolders):
+        for f, fname in enumerate(found):
+            if (sub, fname) in rows:
+                stack[r, f, :len(rows[(sub, fname)])] = rows[(sub, fname)]
+    result = combine_replicates(stack, method, sigma=sigma)
+
+    labels = {'median': 'Median', 'sigma_clip': 'Sigma-clipped Mean', 'mad': 'MAD-clipped Mean'}
+    for f, fname in enumerate(found):
+        n = len(grids[fname])
         avg_df = pd.DataFrame({
-            'Wavelength (nm)': wavelength,
-            'Mean Intensity (a.u.)': mean_intensity
+            'Wavelength (nm)': grids[fname].wavelengths,
+            f'{labels[method]} Intensity (a.u.)': result.combined[f, :n],
+            'n': result.n_used[f, :n],
+            'Rejected': result.rejected[f, :n],
         })
-
-        # Save the result
         save_path = os.path.join(output_folder, fname)
-        avg_df.to_csv(save_path, index=False)
+        with profiled('writing', written=[save_path]):
+            avg_df.to_csv(save_path, index=False)
+        print(f"Saved {method} combined file: {save_path} ({int(result.rejected[f, :n].sum())} values rejected)")
+
+    return len(found)
+
+
+if __name__ == '__main__':
+    if ci_method not in CI_METHODS:
+        raise SystemExit(f"❌ Unknown ci_method '{ci_method}', expected one of {CI_METHODS}")
+    os.makedirs(output_folder, exist_ok=True)
+    base_cube = open_cube(base_cube_folder)
+
+    # Get all subfolders (exclude hidden folders)
+    subfolders = list_groups(base_folder, base_cube)
+
+    # Union of the CSV filenames of all subfolders (first-seen order)
+    csv_files = list(dict.fromkeys(
+        fname for sub in subfolders for fname in list_spectrum_files(base_folder, sub, base_cube)
+    ))
 
-        print(f"Saved averaged file: {save_path}")
+    # Average the files chunk by chunk (in parallel); messages are reported in file order
+    if combine_method == 'mean':
+        run_groups(average_files, chunk_list(csv_files, n_workers),
+                   args=(base_folder, output_folder, subfolders, base_cube_folder,
+                         ci_method, bootstrap_resamples, bootstrap_seed),
+                   workers=n_workers)
+    else:
+        # Chunks are sized so the in-memory replicate stacks fit the memory budget: per file
+        # the stack, its sorted copy, prefix sums and deviations (~6 copies)
+        n_pixels = spectrum_pixels(base_folder, subfolders, csv_files[0], base_cube) if csv_files else 0
+        file_bytes = 6 * 8 * len(subfolders) * n_pixels
+        run_groups(robust_combine_files, chunk_by_budget(csv_files, file_bytes, memory_budget_mb, n_workers),
+                   args=(base_folder, output_folder, subfolders, combine_method, clip_sigma, base_cube_folder),
+                   workers=n_workers)
 
-print("✅ Averaging completed!")
+    print("✅ Averaging completed!")
@@ -0,0 +1,82 @@
+import os
+import time
+
+# Polling watcher for folder trees of CSV spectra (no extra dependency).
+#
+# The watched layout is the one the scripts expect: <root>/<group>/<file>.csv.
+# A file is reported once it is new or changed AND its size/mtime was the same on two
+# consecutive polls, so files the spectrometer software is still writing are not read
+# half-finished. With the default 0.2 s interval a new file is reported ~0.2-0.4 s
+# after it is written.
+
+
+def snapshot_csv_tree(root_folder):
+    # {(group, filename): (mtime_ns, size)} for every CSV one level below root_folder
+    snapshot = {}
+    try:
+        groups = [e for e in os.scandir(root_folder) if e.is_dir() and not e.name.startswith('.')]
+    except FileNotFoundError:
+        return snapshot
+    for group in groups:
+        try:
+            entries = list(os.scandir(group.path))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.endswith('.csv') and entry.is_file():
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[(group.name, entry.name)] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+class FolderWatcher:
+    """Reports new or changed CSVs of one or more folder trees, keyed by (group, filename)."""
+
+    def __init__(self, root_folders, interval=0.2):
+        self.root_folders = list(root_folders)
+        self.interval = interval
+        self._handled = [{} for _ in self.root_folders]   # stat of the last reported version
+        self._pending = [{} for _ in self.root_folders]   # stat seen on the previous poll
+
+    def mark_handled(self, snapshots=None):
+        # Treat the current content of the folders as already processed
+        if snapshots is None:
+            snapshots = [snapshot_csv_tree(root) for root in self.root_folders]
+        self._handled = [dict(s) for s in snapshots]
+        self._pending = [{} for _ in self.root_folders]
+
+    def poll(self):
+        # Set of (group, filename) keys that changed (and settled) in any of the folders
+        ready = set()
+        for i, root in enumerate(self.root_folders):
+            current = snapshot_csv_tree(root)
+            handled, pending = self._handled[i], self._pending[i]
+            new_pending = {}
+            for key, stat in current.items():
+                if handled.get(key) == stat:
+                    continue
+                if pending.get(key) == stat:
+                    handled[key] = stat
+                    ready.add(key)
+                else:
+                    new_pending[key] = stat
+            # Deleted files are forgotten, so a re-created file is reported again
+            for key in set(handled) - set(current):
+                del handled[key]
+            self._pending[i] = new_pending
+        return ready
+
+    def watch(self, callback):
+        # Call callback(sorted list of keys) for every poll with changes, until Ctrl+C
+        try:
+            while True:
+                started = time.monotonic()
+                ready = self.poll()
+                if ready:
+                    callback(sorted(ready))
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,287 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import profiled
+from settings import apply_settings
+
+# Rate constants of concentration (or absorbance) vs time traces, many traces at once: the
+# replicate runs of predict_concentrations.py, or every wavelength of a time series of
+# absorbance spectra.
+#
+# Models for a signal y(t) (y0 = y(0), y_inf = y(t -> infinity), k the rate constant):
+#   order 0   y = y0 + k t                                   k in signal units / time
+#   order 1   y = y_inf + (y0 - y_inf) exp(-k t)             k in 1 / time
+#   order 2   y = y_inf + (y0 - y_inf) / (1 + kappa t)       kappa = k |y0 - y_inf|, so for
+#             concentrations k is the second-order rate constant (1 / (concentration time))
+#
+# Order 0 is a closed-form straight line. For orders 1 and 2 the model is linear in y0 and
+# y_inf once k is fixed: the residual of every trace is evaluated in closed form on a
+# log-spaced grid of k (one matrix multiply for all traces), and the best grid point is
+# refined by a batched Levenberg-Marquardt fit of (y0, y_inf, log k). Uncertainties are the
+# standard errors from the covariance s^2 (J^T J)^-1 at the solution. Missing points (NaN)
+# are ignored per trace; a trace left with fewer points than the model has parameters gets
+# NaN results (orders 1 and 2 need 3 points).
+
+# ======== Input (one of the two) ========
+# Time x replicate table written by predict_concentrations.py (one column per time point,
+# one row per replicate run); every replicate is fitted as one trace
+input_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/analysis/NH2_3_time-conc.csv'
+# Time-point tree of absorbance spectra (absorbance_root/<time point>/<replicate>.csv);
+# the replicate mean at every wavelength is fitted as one trace (None = use input_file)
+absorbance_root = None
+
+# ======== Fit settings ========
+orders = [0, 1, 2]
+output_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/analysis/NH2_3_rates.csv'
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+# One fitted model per trace: every field except order is a (traces,) array
+KineticsFit = namedtuple('KineticsFit', ['order', 'k', 'k_err', 'y0', 'y0_err', 'y_inf', 'y_inf_err',
+                                         'r2', 'rmse', 'aic', 'n_points', 'converged'])
+
+ORDERS = (0, 1, 2)
+
+
+def _shape(order, t, k):
+    # g(t; k) with g(0) = 0 and g -> 1 (orders 1, 2), and d g / d log k; t (times,), k (traces, 1)
+    kt = k * t
+    if order == 1:
+        e = np.exp(-kt)
+        return 1.0 - e, kt * e
+    return kt / (1.0 + kt), kt / (1.0 + kt) ** 2
+
+
+def _masked(t, values):
+    t = np.asarray(t, dtype=float)
+    Y = np.atleast_2d(np.asarray(values, dtype=float))
+    W = np.isfinite(Y) & np.isfinite(t)
+    return np.where(np.isfinite(t), t, 0.0), np.where(W, Y, 0.0), W.astype(float)
+
+
+def _fit_zero_order(t, Y, W):
+    n = W.sum(axis=1)
+    St, Sy = W @ t, Y.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_t, mean_y = St / n, Sy / n
+        var_t = W @ t ** 2 - St * mean_t
+        var_y = (Y ** 2).sum(axis=1) - Sy * mean_y
+        cov = Y @ t - St * mean_y
+        k = cov / var_t
+        y0 = mean_y - k * mean_t
+        sse = np.maximum(var_y - k * cov, 0.0)
+        s2 = sse / (n - 2)
+        k_err = np.sqrt(s2 / var_t)
+        y0_err = np.sqrt(s2 * (1.0 / n + mean_t ** 2 / var_t))
+    nan = np.full(len(Y), np.nan)
+    return k, k_err, y0, y0_err, nan, nan, sse, var_y, n, 2, np.isfinite(k)
+
+
+def _grid_start(order, t, Y, W, n_grid):
+    # Best k of a log-spaced grid for every trace, with the matching (y0, amplitude)
+    # k t_max from 0.01 (almost linear) to 1000 (a step)
+    k_grid = np.logspace(-2, 3, n_grid) / np.nanmax(np.abs(t))
+    G, _ = _shape(order, t, k_grid[:, None])            # (grid, times)
+    n, Sy, Syy = W.sum(axis=1), Y.sum(axis=1), (Y ** 2).sum(axis=1)
+    Sg, Sgg, Sgy = W @ G.T, W @ (G ** 2).T, Y @ G.T     # (traces, grid)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_g = Sgg - Sg ** 2 / n[:, None]
+        cov = Sgy - Sg * (Sy / n)[:, None]
+        sse = (Syy - Sy ** 2 / n)[:, None] - cov ** 2 / var_g
+    sse = np.where(var_g > 1e-12 * n[:, None], sse, np.inf)
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(len(Y))
+    b = cov[rows, best] / var_g[rows, best]
+    a = (Sy - b * Sg[rows, best]) / n
+    return np.column_stack([a, b, np.log(k_grid[best])])
+
+
+def _sse(order, t, Y, W, theta):
+    g, _ = _shape(order, t, np.exp(theta[:, 2:3]))
+    r = W * (Y - theta[:, :1] - theta[:, 1:2] * g)
+    return (r ** 2).sum(axis=1)
+
+
+def _fit_nonlinear(order, t, Y, W, n_grid=100, max_iter=50, tol=1e-10):
+    # Traces with fewer points than the 3 parameters have no fit (nor a meaningful error):
+    # they are left out and get NaN results with converged = False
+    n = W.sum(axis=1)
+    fitted = n >= 3
+    results = [np.full(len(Y), np.nan) for _ in range(8)]
+    converged = np.zeros(len(Y), dtype=bool)
+    if fitted.any():
+        *values, converged[fitted] = _fit_traces(order, t, Y[fitted], W[fitted], n_grid, max_iter, tol)
+        for result, value in zip(results, values):
+            result[fitted] = value
+    return (*results, n, 3, converged)
+
+
+def _fit_traces(order, t, Y, W, n_grid, max_iter, tol):
+    # Grid start and batched Levenberg-Marquardt refinement of traces with >= 3 points each
+    theta = _grid_start(order, t, Y, W, n_grid)
+    sse = _sse(order, t, Y, W, theta)
+    damping = np.full(len(Y), 1e-3)
+    active = np.isfinite(sse)
+    converged = np.zeros(len(Y), dtype=bool)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        th, w, y = theta[idx], W[idx], Y[idx]
+        g, dg = _shape(order, t, np.exp(th[:, 2:3]))
+        r = w * (y - th[:, :1] - th[:, 1:2] * g)
+        J = w[..., None] * np.stack([np.ones_like(g), g, th[:, 1:2] * dg], axis=-1)
+        JTJ = np.einsum('nti,ntj->nij', J, J)
+        JTr = np.einsum('nti,nt->ni', J, r)
+        diag = np.einsum('nii->ni', JTJ)
+        A = JTJ + (damping[idx, None] * np.maximum(diag, 1e-12))[..., None] * np.eye(3)
+        delta = (np.linalg.pinv(A) @ JTr[..., None])[..., 0]
+        trial = th + delta
+        trial_sse = _sse(order, t, y, w, trial)
+        better = trial_sse <= sse[idx]
+        theta[idx[better]] = trial[better]
+        small = np.abs(sse[idx] - trial_sse) <= tol * np.maximum(sse[idx], 1e-300)
+        sse[idx[better]] = trial_sse[better]
+        damping[idx] = np.where(better, damping[idx] / 10, damping[idx] * 10)
+        done = (better & small) | (damping[idx] > 1e10)
+        converged[idx[done & (damping[idx] <= 1e10)]] = True
+        active[idx[done]] = False
+
+    # Standard errors from the covariance at the solution
+    g, dg = _shape(order, t, np.exp(theta[:, 2:3]))
+    J = W[..., None] * np.stack([np.ones_like(g), g, theta[:, 1:2] * dg], axis=-1)
+    n = W.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = np.linalg.pinv(np.einsum('nti,ntj->nij', J, J)) * (sse / (n - 3))[:, None, None]
+    a, b, log_k = theta.T
+    var_a, var_b, var_log_k = cov[:, 0, 0], cov[:, 1, 1], cov[:, 2, 2]
+    y_inf, y_inf_var = a + b, var_a + var_b + 2 * cov[:, 0, 1]
+    k = np.exp(log_k)
+    if order == 2:
+        # k = kappa / |y_inf - y0|:  var(log k) = var(log kappa) + var(b) / b^2 - 2 cov(log kappa, b) / b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var_log_k = var_log_k + var_b / b ** 2 - 2 * cov[:, 1, 2] / b
+            k = k / np.abs(b)
+    mean_y = Y.sum(axis=1) / n
+    var_y = ((W * (Y - mean_y[:, None])) ** 2).sum(axis=1)
+    return (k, k * np.sqrt(np.maximum(var_log_k, 0)), a, np.sqrt(np.maximum(var_a, 0)), y_inf,
+            np.sqrt(np.maximum(y_inf_var, 0)), sse, var_y, converged)
+
+
+def fit_kinetics(t, values, order=1):
+    """Fit one kinetic order to every trace of values (traces x times, or one trace).
+
+    t: (times,) shared time axis; NaN values are left out of their trace. Returns a
+    KineticsFit of (traces,) arrays.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown kinetic order {order}, expected one of {ORDERS}")
+    t, Y, W = _masked(t, values)
+    if order == 0:
+        k, k_err, y0, y0_err, y_inf, y_inf_err, sse, var_y, n, n_params, converged = _fit_zero_order(t, Y, W)
+    else:
+        k, k_err, y0, y0_err, y_inf, y_inf_err, sse, var_y, n, n_params, converged = _fit_nonlinear(order, t, Y, W)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r2 = 1.0 - sse / var_y
+        rmse = np.sqrt(sse / n)
+        aic = n * np.log(np.maximum(sse, 1e-300) / n) + 2 * n_params
+    return KineticsFit(order, k, k_err, y0, y0_err, y_inf, y_inf_err, r2, rmse, aic, n.astype(int), converged)
+
+
+def fit_orders(t, values, orders=ORDERS):
+    # {order: KineticsFit} plus the order with the lowest AIC for every trace
+    fits = {order: fit_kinetics(t, values, order) for order in orders}
+    aic = np.array([fits[order].aic for order in orders])
+    best = np.array(orders)[np.argmin(np.where(np.isfinite(aic), aic, np.inf), axis=0)]
+    return fits, best
+
+
+def model_curve(fit, t, trace=0):
+    # Fitted y(t) of one trace, e.g. to draw it over the data
+    t = np.asarray(t, dtype=float)
+    y0, k = fit.y0[trace], fit.k[trace]
+    if fit.order == 0:
+        return y0 + k * t
+    amplitude = fit.y_inf[trace] - y0
+    if fit.order == 1:
+        return y0 + amplitude * (1.0 - np.exp(-k * t))
+    kappa = k * abs(amplitude)
+    return y0 + amplitude * kappa * t / (1.0 + kappa * t)
+
+
+def time_table_traces(path):
+    # (times, trace names, traces x times) from a time x replicate table (predict_concentrations.py)
+    import pandas as pd
+
+    from concentration_series import time_point_key
+
+    df = pd.read_csv(path)
+    times = np.array([time_point_key(str(c))[0] for c in df.columns])
+    return times, [f"replicate {i + 1}" for i in range(len(df))], df.to_numpy(dtype=float)
+
+
+def absorbance_traces(absorbance_root):
+    # (times, wavelengths as names, wavelengths x times) replicate-mean absorbance of a time-point tree
+    from concentration_series import time_point_key
+    from spectrum_cube import list_groups
+    from spectrum_reader import print_malformed, read_spectrum_folder
+    from wavelength_grid import get_grid
+
+    with profiled('listing'):
+        time_points = sorted(list_groups(absorbance_root), key=time_point_key)
+    columns, times, grid = [], [], None
+    for time_point in time_points:
+        batch = read_spectrum_folder(os.path.join(absorbance_root, time_point))
+        print_malformed(batch.malformed)
+        if not batch.paths:
+            print(f"⚠️ No spectra found for time point '{time_point}', skipping.")
+            continue
+        batch_grid = get_grid(batch.wavelengths)
+        grid = grid or batch_grid
+        columns.append(batch_grid.resample(batch.values, grid).mean(axis=0))
+        times.append(time_point_key(time_point)[0])
+    if grid is None:
+        return np.empty(0), [], np.empty((0, 0))
+    return np.array(times), [f"{w:.3f} nm" for w in grid.wavelengths], np.array(columns).T
+
+
+def fits_table(names, fits, best):
+    # One row per trace and order
+    import pandas as pd
+
+    rows = []
+    for order, fit in fits.items():
+        for i, name in enumerate(names):
+            rows.append({'Trace': name, 'Order': order, 'k': fit.k[i], 'k error': fit.k_err[i],
+                         'y0': fit.y0[i], 'y0 error': fit.y0_err[i], 'y_inf': fit.y_inf[i],
+                         'y_inf error': fit.y_inf_err[i], 'R2': fit.r2[i], 'RMSE': fit.rmse[i],
+                         'AIC': fit.aic[i], 'Points': fit.n_points[i], 'Converged': bool(fit.converged[i]),
+                         'Best order': bool(best[i] == order)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    if absorbance_root is not None:
+        times, names, traces = absorbance_traces(absorbance_root)
+    else:
+        times, names, traces = time_table_traces(input_file)
+    print(f"--- 🚀 Fitting orders {list(orders)} to {len(names)} traces x {len(times)} time points ---")
+
+    fits, best = fit_orders(times, traces, tuple(orders))
+    if len(names) <= 20:
+        for i, name in enumerate(names):
+            fit = fits[best[i]]
+            print(f"✅ {name}: order {best[i]}, k = {fit.k[i]:.4g} ± {fit.k_err[i]:.2g}, R² = {fit.r2[i]:.4f}")
+    for order, fit in fits.items():
+        r2 = fit.r2[np.isfinite(fit.r2)]  # traces with too few points have no R²
+        print(f"📈 Order {order}: best for {np.sum(best == order)} traces, "
+              f"median R² = {np.median(r2) if len(r2) else np.nan:.4f}, "
+              f"{np.sum(~fit.converged)} not converged")
+
+    table = fits_table(names, fits, best)
+    with profiled('writing', written=[output_file]):
+        table.to_csv(output_file, index=False)
+    print(f"🎉 Rate constants saved: {output_file}")
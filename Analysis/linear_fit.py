@@ -1,9 +1,20 @@
 import os
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 import matplotlib.pyplot as plt
 
+from calibration import fit_calibration, save_fit_results, window_results
+from calibration_plots import explore, plot_fit
+from manifest import spectrum_digests
+from memory_budget import chunk_by_budget
+from multivariate_calibration import best_wavelength_column, cross_validate, fit_model, predict, save_model
+from profiling import profiled
+from result_cache import cached, open_result_cache, read_group_cached, stage_key
+from settings import apply_settings
+from smoothing import smooth, smoothing_setting, value_label
+from spectrum_cube import list_spectrum_files, open_cube
+from wavelength_grid import get_grid
+
 # === Set paths ===
 data_folder = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/UiO_66-1'
 output_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/best_wavelength.csv'
@@ -11,6 +22,43 @@ output_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Cali
 # === Manually set wavelength range for calculation ===
 target_range = (400, 420)  # Search for the best wavelength only within this range
 
+# === Optional Savitzky-Golay smoothing / derivative spectra (see smoothing.py) ===
+# (window length, polynomial order, derivative order), e.g. (21, 2, 0) to smooth noisy
+# low-concentration spectra; None = raw spectra. The setting is saved with the calibration
+# and applied again when predicting
+smoothing = None
+
+# === Per-wavelength fit results for calibration_explorer.py (.npz; None = not saved) ===
+fit_results_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/calibration_fit.npz'
+
+# === Calibration mode ===
+# 'best_wavelength': linear fit at the single best wavelength inside target_range
+# 'cls' / 'pls':     one full-spectrum model over the whole target_range window
+#                    (see multivariate_calibration.py), saved to model_file (.npz)
+calibration_mode = 'best_wavelength'
+pls_components = 3
+model_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/calibration_model.npz'
+
+# === Optional: binary spectrum cube built from data_folder ===
+# (`python spectrum_cube.py <data_folder> <cube folder>`; None = read the CSV files)
+data_cube_folder = None
+
+# === Optional result cache (see result_cache.py; None = no cache) ===
+# Parsed spectra and fit results are cached by content and settings: a rerun with another
+# target_range reuses the parsed spectra and only refits
+result_cache_folder = None
+
+# === Memory budget (MB) for large campaigns (see memory_budget.py) ===
+# Spectra are read and smoothed in chunks that fit the budget, and only the target_range
+# columns are kept; the fit then runs one wavelength window at a time. None = default budget
+memory_budget_mb = None
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+smoothing = smoothing_setting(smoothing)
+signal = value_label(smoothing)  # 'Absorbance', or e.g. '1st derivative of absorbance'
+data_cube = open_cube(data_cube_folder)
+result_cache = open_result_cache(result_cache_folder)
+
 # === Step 1: Get all sample files and concentrations, and add the (0, 0) data point ===
 # === Step 1: Get all sample files and concentrations, and add the (0, 0) data point ===
 
@@ -24,218 +72,188 @@ def is_number(s):
 
 # Filter: filenames must be numeric
 sample_files = sorted(
-    [f for f in os.listdir(data_folder) if f.endswith('.csv') and is_number(os.path.splitext(f)[0])],
+    [f for f in list_spectrum_files(data_folder, '', data_cube) if is_number(os.path.splitext(f)[0])],
     key=lambda x: float(os.path.splitext(x)[0])
 )
 
+if len(sample_files) == 0:
+    raise RuntimeError("No spectra with a numeric filename (the concentration, e.g. 10.csv) in {}".format(data_folder))
+
 # Original concentrations (float)
 concentrations_original = np.array([float(os.path.splitext(f)[0]) for f in sample_files])
 
-# Add zero concentration
-concentrations_all = np.insert(concentrations_original, 0, 0.0)
-
-abs_matrix = []
-wavelengths = None
-
-for file in sample_files:
-    path = os.path.join(data_folder, file)
-    df = pd.read_csv(path)
-    df = df.sort_values(by=df.columns[0]).reset_index(drop=True)
+# The fit depends on the content of the files, not on how they are read: its cache input is
+# the list of files with their content hashes (only computed when there is a cache)
+digests = spectrum_digests(data_folder, '', sample_files, data_cube) if result_cache is not None else None
 
-    if wavelengths is None:
-        wavelengths = df.iloc[:, 0].values  # wavelength
+# Files sharing a wavelength grid reuse one precomputed sort order; a file recorded on a
+# different grid is resampled onto the grid of the first readable file, read on its own
+# before the others (see wavelength_grid.py)
+for first, file in enumerate(sample_files):
+    _, reference_set = read_group_cached(result_cache, data_folder, '', [file], data_cube, digests)
+    if reference_set is not None:
+        break
+else:
+    raise RuntimeError("None of the {} spectra in {} could be read".format(len(sample_files), data_folder))
+reference_grid = get_grid(reference_set.wavelengths)
+wavelengths = reference_grid.sorted_wavelengths  # wavelength
+
+# Only the target_range columns are fitted, so only those are kept (smoothing still sees
+# the whole spectrum of every file)
+kept = (wavelengths >= target_range[0]) & (wavelengths <= target_range[1])
+abs_matrix_original = np.empty((len(sample_files), int(kept.sum())))
+read = np.zeros(len(sample_files), dtype=bool)
+file_index = {f: i for i, f in enumerate(sample_files)}
+
+
+def store_rows(spectrum_set):
+    # The spectra of a set on the reference grid, sorted and smoothed, as their rows of
+    # abs_matrix_original
+    grid = get_grid(spectrum_set.wavelengths)
+    if grid is not reference_grid:
+        print("Resampled onto the reference wavelength grid: {}".format(', '.join(spectrum_set.filenames)))
+    rows = reference_grid.sort(grid.resample(spectrum_set.values, reference_grid))
+    if smoothing is not None:
+        rows = smooth(wavelengths, rows, *smoothing)
+    index = [file_index[f] for f in spectrum_set.filenames]
+    abs_matrix_original[index] = rows[:, kept]
+    read[index] = True
+
+
+# The other files are read chunk by chunk within the memory budget (parsed, resampled,
+# sorted and smoothed copies of every spectrum of a chunk)
+store_rows(reference_set)
+for chunk in chunk_by_budget(range(first + 1, len(sample_files)), 4 * 8 * len(reference_grid), memory_budget_mb):
+    _, spectrum_set = read_group_cached(result_cache, data_folder, '', [sample_files[i] for i in chunk],
+                                        data_cube, digests)
+    if spectrum_set is not None:
+        store_rows(spectrum_set)
+    del spectrum_set
+
+# Unreadable files (reported above) are left out together with their concentrations
+abs_matrix_original = abs_matrix_original[read]
 
-    abs_matrix.append(df.iloc[:, 1].values)
+# Add zero concentration
+concentrations_all = np.insert(concentrations_original[read], 0, 0.0)
 
-abs_matrix_original = np.array(abs_matrix)
+wavelengths = wavelengths[kept]
 
 # For each wavelength, insert a row of zeros at the beginning of the absorbance matrix
 # (representing zero absorbance at zero concentration)
 abs_matrix = np.insert(abs_matrix_original, 0, 0, axis=0)
 wavelengths = np.array(wavelengths)
 
-# === Step 2: Residual-based linear fitting (restricted wavelength range) ===
-r2_scores = []
-mean_abs = []
-valid_conc_list = []
-valid_abs_list = []
-models = []
-
-# Get indices corresponding to the wavelength range
-wl_mask = (wavelengths >= target_range[0]) & (wavelengths <= target_range[1])
-indices_to_check = np.where(wl_mask)[0]
-
-# Note: since (0, 0) has already been added, filtering abs_values > 0 is no longer needed
-
-for i in range(len(wavelengths)):
-    if i not in indices_to_check:
-        r2_scores.append(0)
-        mean_abs.append(0)
-        valid_conc_list.append([])
-        valid_abs_list.append([])
-        models.append(None)
-        continue
-
-    # abs_matrix[:, i] now includes the (0, 0) data point
-    abs_values = abs_matrix[:, i]
-    conc_values = concentrations_all
-
-    # In this modified version, absorbance <= 0 points are not filtered
-    abs_valid = abs_values
-    conc_valid = conc_values
-
-    # Although (0,0) ensures at least one point, keep a minimum of 2 points for safety
-    if len(abs_valid) < 2:
-        r2_scores.append(0)
-        mean_abs.append(0)
-        valid_conc_list.append([])
-        valid_abs_list.append([])
-        models.append(None)
-        continue
-
-    X = conc_valid.reshape(-1, 1)
-    y = abs_valid.reshape(-1, 1)
-
-    # First fit (including all data, including (0,0))
-    model = LinearRegression().fit(X, y)
-    y_pred = model.predict(X)
-    residuals = (y - y_pred).flatten()
-    std_res = np.std(residuals)
-
-    # Residual filtering ((0,0) also participates in residual calculation and filtering)
-    inlier_mask = np.abs(residuals) <= 2 * std_res
-    X_inliers = X[inlier_mask]
-    y_inliers = y[inlier_mask]
-
-    if len(y_inliers) < 2:
-        r2_scores.append(0)
-        mean_abs.append(0)
-        valid_conc_list.append([])
-        valid_abs_list.append([])
-        models.append(None)
-        continue
-
-    # Second fit (inliers only, including (0,0) if it is an inlier)
-    model2 = LinearRegression().fit(X_inliers, y_inliers)
-    r2_scores.append(model2.score(X_inliers, y_inliers))
-    mean_abs.append(np.mean(y_inliers))
-    valid_conc_list.append(X_inliers.flatten())
-    valid_abs_list.append(y_inliers.flatten())
-    models.append(model2)
-
-r2_array = np.array(r2_scores)
-mean_abs_array = np.array(mean_abs)
-
-# === Step 3: Find the best wavelength ===
-# (Logic unchanged, but candidate data now include (0,0) or its residual-filtered version)
-min_r2_threshold = 0.9
-threshold_abs_min = 0.00
-threshold_abs_max = 2.0
-
-candidates = [
-    (i, wavelengths[i], r2_array[i], mean_abs_array[i], len(valid_conc_list[i]))
-    for i in indices_to_check
-    if (
-            r2_array[i] >= min_r2_threshold and
-            threshold_abs_min < mean_abs_array[i] < threshold_abs_max and
-            len(valid_conc_list[i]) >= 5
+if calibration_mode == 'best_wavelength':
+    # === Step 2: Residual-based linear fitting (restricted wavelength range) ===
+    # Both fitting passes run in closed form for every wavelength in the range at once
+    # (see calibration.py); wavelengths outside the range get R² = 0 and no inliers
+
+    # Get the mask corresponding to the wavelength range
+    wl_mask = (wavelengths >= target_range[0]) & (wavelengths <= target_range[1])
+
+    # Note: since (0, 0) has already been added, filtering abs_values > 0 is no longer needed
+    _, fit = cached(result_cache, 'calibration_fit', {'target_range': target_range, 'smoothing': smoothing},
+                    lambda: [stage_key('read_spectra', None, [(f, digests[f]) for f in sample_files])],
+                    lambda: fit_calibration(concentrations_all, abs_matrix, columns=wl_mask,
+                                            memory_budget_mb=memory_budget_mb))
+
+    r2_array = fit.r2
+    mean_abs_array = fit.mean_abs
+
+    # === Step 3: Find the best wavelength ===
+    # (Logic unchanged, but candidate data now include (0,0) or its residual-filtered version)
+    min_r2_threshold = 0.9
+    threshold_abs_min = 0.00
+    threshold_abs_max = 2.0
+
+    # Derivative spectra are signed, so their bands are judged by magnitude
+    signal_level = np.abs(mean_abs_array) if smoothing is not None and smoothing[2] > 0 else mean_abs_array
+    candidate_mask = (
+            wl_mask &
+            (r2_array >= min_r2_threshold) &
+            (threshold_abs_min < signal_level) & (signal_level < threshold_abs_max) &
+            (fit.n_inliers >= 5)
     )
-]
-
-if not candidates:
-    raise RuntimeError("No wavelength meets all conditions in the specified range.")
-
-# Best wavelength selection logic: maximize sample count first, then maximize R²
-best_idx, best_wavelength, best_r2, best_mean_abs, _ = max(
-    candidates, key=lambda x: (x[4], x[2])
-)
+    candidates = np.flatnonzero(candidate_mask)
+
+    if len(candidates) == 0:
+        raise RuntimeError("No wavelength meets all conditions in the specified range.")
+
+    # Best wavelength selection logic: maximize sample count first, then maximize R²
+    # (ties keep the shortest wavelength)
+    order = np.lexsort((-candidates, r2_array[candidates], fit.n_inliers[candidates]))
+    best_idx = candidates[order[-1]]
+    best_wavelength = wavelengths[best_idx]
+    best_r2 = r2_array[best_idx]
+    best_mean_abs = mean_abs_array[best_idx]
+    best_mask = fit.inlier_mask[:, best_idx]
+
+    # === Step 4: Save the best result ===
+    # (the column name also records the smoothing, see multivariate_calibration.py)
+    col_name = best_wavelength_column(best_wavelength, smoothing)
+    df_out = pd.DataFrame({
+        'Concentration (µg/mL)': concentrations_all[best_mask],
+        col_name: abs_matrix[best_mask, best_idx]
+    })
+    with profiled('writing', written=[output_file]):
+        df_out.to_csv(output_file, index=False)
+
+    print("Best wavelength: {:.3f} nm".format(best_wavelength))
+    print("R² = {:.4f}, Avg {} = {:.4f}".format(best_r2, signal.lower(), best_mean_abs))
+    print("Result saved: {}".format(output_file))
+    print("Number of valid samples = {}".format(fit.n_inliers[best_idx]))
+
+    # Per-wavelength results of the range, saved for calibration_explorer.py
+    results = window_results(wavelengths, concentrations_all, abs_matrix, fit, wl_mask, best_idx)
+    if fit_results_file:
+        save_fit_results(results, fit_results_file)
+        print("Fit results saved: {}".format(fit_results_file))
+
+    # === Step 5: Plot R² distribution (only wavelengths within the range) ===
+    plt.figure(figsize=(10, 6))
+    plt.plot(wavelengths[wl_mask], r2_array[wl_mask], label='R² vs Wavelength')
+    plt.axvline(best_wavelength, color='red', linestyle='--', label='Best λ')
+    plt.xlim(target_range[0], target_range[1])
+    plt.xlabel('Wavelength (nm)')
+    plt.ylabel('R²')
+    plt.title('Linearity after Residual Filtering (Specified Range)')
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
 
-# === Step 4: Save the best result ===
-col_name = 'Absorbance at {:.3f} nm'.format(best_wavelength)
-df_out = pd.DataFrame({
-    'Concentration (µg/mL)': valid_conc_list[best_idx],
-    col_name: valid_abs_list[best_idx]
-})
-df_out.to_csv(output_file, index=False)
-
-print("Best wavelength: {:.3f} nm".format(best_wavelength))
-print("R² = {:.4f}, Avg absorbance = {:.4f}".format(best_r2, best_mean_abs))
-print("Result saved: {}".format(output_file))
-print("Number of valid samples = {}".format(len(valid_conc_list[best_idx])))
-
-# === Step 5: Plot R² distribution (only wavelengths within the range) ===
-plt.figure(figsize=(10, 6))
-plt.plot(wavelengths[wl_mask], r2_array[wl_mask], label='R² vs Wavelength')
-plt.axvline(best_wavelength, color='red', linestyle='--', label='Best λ')
-plt.xlim(target_range[0], target_range[1])
-plt.xlabel('Wavelength (nm)')
-plt.ylabel('R²')
-plt.title('Linearity after Residual Filtering (Specified Range)')
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-
-# === Step 6: Plot best-wavelength fit (scatter plot) ===
-def plot_fit(idx):
-    X = valid_conc_list[idx]
-    y = valid_abs_list[idx]
-    model = models[idx]
-    if model is None or len(X) == 0:
-        print("No valid data for this wavelength.")
-        return
-
-    # Locate the (0,0) point
-    is_zero_zero = (X == 0) & (y == 0)
-
-    # Separate the (0,0) point from other points
-    X_zero = X[is_zero_zero]
-    y_zero = y[is_zero_zero]
-    X_other = X[~is_zero_zero]
-    y_other = y[~is_zero_zero]
-
-    X_for_predict = np.linspace(X.min(), X.max(), 100).reshape(-1, 1)
-    y_pred = model.predict(X_for_predict)
-
-    slope = model.coef_[0][0]
-    intercept = model.intercept_[0]
-    r2 = model.score(X.reshape(-1, 1), y)
+    # === Step 6: Plot best-wavelength fit (scatter plot) ===
+    plot_fit(results, results.best_index, signal)
+
+    # === Step 7: Interactive inspection of other wavelengths (within range only) ===
+    explore(results, *target_range, value_label=signal)
+
+else:
+    # === Step 2 (cls / pls mode): full-spectrum model over the target_range window ===
+    model = fit_model(concentrations_all, abs_matrix, wavelengths, target_range,
+                      method=calibration_mode, n_components=pls_components, smoothing=smoothing)
+    save_model(model, model_file)
+
+    fitted = predict(model, abs_matrix, wavelengths)
+    loo = cross_validate(concentrations_all, abs_matrix, wavelengths, target_range,
+                         method=calibration_mode, n_components=pls_components)
+    rmsec = np.sqrt(np.mean((fitted - concentrations_all) ** 2))
+    rmsecv = np.sqrt(np.mean((loo - concentrations_all) ** 2))
+    print("Model: {} ({} wavelengths, {:.3f}-{:.3f} nm{})".format(
+        model.method.upper(), len(model.wavelengths), model.wavelengths[0], model.wavelengths[-1],
+        ", {} components".format(model.n_components) if model.method == 'pls' else ''))
+    print("RMSE of calibration = {:.4f}, leave-one-out RMSE = {:.4f}".format(rmsec, rmsecv))
+    print("Model saved: {}".format(model_file))
 
     plt.figure(figsize=(8, 6))
-
-    # Plot non-(0,0) points
-    plt.scatter(X_other, y_other, color='blue', label='Data Points (Non-Zero)')
-    # Highlight the (0,0) point
-    if len(X_zero) > 0:
-        plt.scatter(X_zero, y_zero, color='green', marker='D', s=80, label='(0, 0) Point')
-
-    plt.plot(X_for_predict, y_pred, color='red',
-             label='y = {:.4f}x + {:.4f}\nR² = {:.4f}'.format(slope, intercept, r2))
+    plt.scatter(concentrations_all, fitted, color='blue', label='Fitted')
+    plt.scatter(concentrations_all, loo, color='orange', marker='x', label='Leave-one-out')
+    plt.plot([concentrations_all.min(), concentrations_all.max()],
+             [concentrations_all.min(), concentrations_all.max()], color='red', linestyle='--', label='y = x')
     plt.xlabel('Concentration (µM)')
-    plt.ylabel('Absorbance')
-    plt.title('Linear Fit at {:.3f} nm'.format(wavelengths[idx]))
+    plt.ylabel('Predicted concentration (µM)')
+    plt.title('{} calibration, {:.0f}-{:.0f} nm'.format(model.method.upper(), *target_range))
     plt.legend()
     plt.grid(True)
     plt.tight_layout()
     plt.show()
-
-
-plot_fit(best_idx)
-
-# === Step 7: Interactive inspection of other wavelengths (within range only) ===
-while True:
-    user_input = input("\nEnter another wavelength to view (or press Enter to exit): ").strip()
-    if not user_input:
-        print("Exit.")
-        break
-    try:
-        target_wl = float(user_input)
-        closest_idx = np.argmin(np.abs(wavelengths - target_wl))
-        if not (target_range[0] <= wavelengths[closest_idx] <= target_range[1]):
-            print("Wavelength {:.3f} nm is outside the specified range.".format(wavelengths[closest_idx]))
-            continue
-        print("Closest wavelength: {:.3f} nm".format(wavelengths[closest_idx]))
-        plot_fit(closest_idx)
-    except ValueError:
-        print("Invalid input. Try again.")
@@ -0,0 +1,250 @@
+import abc
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from spectrum_sets import log_ratio
+from profiling import profiled
+from settings import apply_settings
+from synthetic_data import ccs100_wavelengths, lamp_spectrum, molar_absorptivity
+
+# Live absorbance kinetics while the reaction runs, instead of after a batch of CSV exports.
+#
+#   device  --read_frame()-->  RingBuffer  --new frames-->  AbsorbanceMonitor  --> table / CSV
+#
+# The acquisition task awaits one frame at a time from a SpectrometerDevice and copies it into
+# a fixed-size preallocated RingBuffer (no allocation per frame; when a consumer falls more
+# than `ring_capacity` frames behind, the oldest frames are overwritten and counted as
+# dropped). Consumers wake up on every new frame and process only the frames they have not
+# seen yet, with the same math as the batch scripts:
+#   net spectrum = max(sample - dark, 0)              (analysis_eliminate_dark_background.py)
+#   absorbance   = log10(net reference / net sample)  (log_calculation.py, invalid ratios -> 0)
+# at the pixels nearest to watch_wavelengths. The latency of every frame (end of its
+# acquisition -> absorbance available) is recorded and summarized at the end.
+#
+# SimulatedCCS100 is a local stand-in for the spectrometer (the synthetic_data.py model with a
+# product that forms during the run). A real instrument is plugged in by subclassing
+# SpectrometerDevice; blocking vendor driver calls should run in a thread
+# (await asyncio.to_thread(...)) so the consumers keep running during an acquisition.
+
+# ======== Acquisition ========
+device_name = 'simulated'      # key of DEVICES
+duration = 10.0                # seconds of kinetics after the reaction starts
+n_dark_frames = 20             # frames averaged for the dark spectrum (shutter closed)
+n_reference_frames = 20        # frames averaged for the reference (blank, before the reaction)
+ring_capacity = 512            # frames held in the ring buffer
+
+# ======== Output ========
+watch_wavelengths = [410.0, 520.0]   # nm; absorbance is reported at the nearest pixels
+print_interval = 1.0                 # seconds between live status lines
+output_file = None                   # CSV of time, absorbance and latency per frame (None = not saved)
+
+# ======== Device settings (keyword arguments of the device class) ========
+# Simulated CCS100: first-order formation of the product, c(t) = max_concentration * (1 - exp(-t / time_constant))
+device_options = {'integration_time': 0.01, 'max_concentration': 60.0, 'time_constant': 3.0,
+                  'noise': 0.002, 'seed': 0}
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+class SpectrometerDevice(abc.ABC):
+    """Interface of an acquisition backend; subclasses must implement read_frame().
+
+    wavelengths: (pixels,) axis of every frame.
+    """
+
+    wavelengths = None
+    shutter_open = True
+
+    @abc.abstractmethod
+    async def read_frame(self):
+        """Coroutine returning (timestamp, values) for the next frame, with the
+        time.perf_counter() timestamp of the end of its integration."""
+
+    def close(self):
+        pass
+
+
+class SimulatedCCS100(SpectrometerDevice):
+    """CCS100 stand-in: lamp * 10^(-c(t) * epsilon) + dark + noise, paced by the integration time."""
+
+    def __init__(self, integration_time=0.01, max_concentration=60.0, time_constant=3.0,
+                 dark_level=0.01, noise=0.002, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.wavelengths = ccs100_wavelengths()
+        self.integration_time = integration_time
+        self.max_concentration = max_concentration
+        self.time_constant = time_constant
+        self.noise = noise
+        self._lamp = lamp_spectrum(self.wavelengths)
+        self._epsilon = molar_absorptivity(self.wavelengths)
+        self._dark = dark_level * (1.0 + 0.2 * self.rng.standard_normal(len(self.wavelengths)))
+        self._reaction_start = None
+
+    def start_reaction(self):
+        self._reaction_start = time.perf_counter()
+
+    def concentration(self, now):
+        if self._reaction_start is None:
+            return 0.0
+        return self.max_concentration * (1.0 - np.exp(-(now - self._reaction_start) / self.time_constant))
+
+    async def read_frame(self):
+        await asyncio.sleep(self.integration_time)
+        now = time.perf_counter()
+        values = self._dark + self.noise * self.rng.standard_normal(len(self.wavelengths))
+        if self.shutter_open:
+            values += self._lamp * 10.0 ** (-self.concentration(now) * self._epsilon)
+        return now, values
+
+
+# device_name -> SpectrometerDevice subclass
+DEVICES = {'simulated': SimulatedCCS100}
+
+
+class RingBuffer:
+    """Fixed-size, preallocated store of the most recent `capacity` frames."""
+
+    def __init__(self, capacity, n_pixels, dtype=np.float64):
+        self.capacity = capacity
+        self.frames = np.empty((capacity, n_pixels), dtype=dtype)
+        self.timestamps = np.empty(capacity)
+        self.count = 0  # frames written so far; frame i is in slot i % capacity
+
+    def append(self, values, timestamp):
+        slot = self.count % self.capacity
+        self.frames[slot] = values
+        self.timestamps[slot] = timestamp
+        self.count += 1
+
+    def read(self, start, columns=None):
+        # (first frame index, frames, timestamps) of the frames from `start` on that are still
+        # in the buffer (first > start when older frames were overwritten); copies, restricted
+        # to `columns` (pixel indices) when given
+        first = max(start, self.count - self.capacity)
+        slots = np.arange(first, self.count) % self.capacity
+        frames = self.frames[slots] if columns is None else self.frames[np.ix_(slots, columns)]
+        return first, frames, self.timestamps[slots]
+
+
+class AbsorbanceMonitor:
+    """Incremental dark subtraction + absorbance at a few wavelengths."""
+
+    def __init__(self, wavelengths, dark, reference, watch_wavelengths, start_time=0.0):
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        self.pixels = np.array([np.argmin(np.abs(wavelengths - w)) for w in watch_wavelengths])
+        self.wavelengths = wavelengths[self.pixels]
+        self.dark = np.asarray(dark, dtype=float)[self.pixels]
+        self.reference = np.maximum(np.asarray(reference, dtype=float)[self.pixels] - self.dark, 0)
+        self.start_time = start_time
+        self.next_frame = 0
+        self.dropped = 0
+        self.times, self.absorbance, self.latencies = [], [], []
+
+    def update(self, ring):
+        # Process the frames not seen yet; returns their absorbances (frames x wavelengths)
+        first, frames, timestamps = ring.read(self.next_frame, self.pixels)
+        self.dropped += first - self.next_frame
+        self.next_frame = ring.count
+        net = np.maximum(frames - self.dark, 0)
+        absorbance = log_ratio(self.reference, net)
+        done = time.perf_counter()
+        self.times.extend(timestamps - self.start_time)
+        self.absorbance.extend(absorbance)
+        self.latencies.extend(done - timestamps)
+        return absorbance
+
+    def latency_summary(self):
+        latencies = np.array(self.latencies) * 1000
+        if not len(latencies):
+            return "no frames"
+        return (f"{len(latencies)} frames, latency mean {latencies.mean():.2f} ms, "
+                f"p95 {np.percentile(latencies, 95):.2f} ms, max {latencies.max():.2f} ms, "
+                f"{self.dropped} dropped")
+
+
+async def average_frames(device, n_frames):
+    # Mean of the next n_frames frames (dark or reference spectrum)
+    frames = [(await device.read_frame())[1] for _ in range(n_frames)]
+    return np.mean(frames, axis=0)
+
+
+async def acquire(device, ring, new_frame, stopped, stop_time):
+    # Producer: frames into the ring buffer until stop_time (perf_counter); every frame wakes
+    # the consumers, the last one also sets `stopped`
+    while not stopped.is_set():
+        timestamp, values = await device.read_frame()
+        ring.append(values, timestamp)
+        if timestamp >= stop_time:
+            stopped.set()
+        async with new_frame:
+            new_frame.notify_all()
+    return ring.count
+
+
+async def consume(ring, monitor, new_frame, stopped, print_interval=1.0):
+    # Consumer: process new frames as they arrive, print a status line every print_interval seconds
+    next_print = 0.0
+    while True:
+        async with new_frame:
+            await new_frame.wait_for(lambda: ring.count > monitor.next_frame or stopped.is_set())
+        if ring.count > monitor.next_frame:
+            absorbance = monitor.update(ring)
+            if monitor.times[-1] >= next_print:
+                values = ', '.join(f"A({w:.1f} nm) = {a:.4f}" for w, a in zip(monitor.wavelengths, absorbance[-1]))
+                print(f"  t = {monitor.times[-1]:6.2f} s | {values} | "
+                      f"latency {monitor.latencies[-1] * 1000:.2f} ms")
+                next_print = monitor.times[-1] + print_interval
+        elif stopped.is_set():
+            return
+
+
+async def run_kinetics(device, watch_wavelengths, duration, n_dark_frames=20, n_reference_frames=20,
+                       ring_capacity=512, print_interval=1.0):
+    """Dark, reference, then `duration` seconds of live absorbance. Returns the AbsorbanceMonitor."""
+    device.shutter_open = False
+    dark = await average_frames(device, n_dark_frames)
+    device.shutter_open = True
+    reference = await average_frames(device, n_reference_frames)
+    print(f"✅ Dark ({n_dark_frames} frames) and reference ({n_reference_frames} frames) recorded")
+
+    if hasattr(device, 'start_reaction'):
+        device.start_reaction()
+    start = time.perf_counter()
+    ring = RingBuffer(ring_capacity, len(device.wavelengths))
+    monitor = AbsorbanceMonitor(device.wavelengths, dark, reference, watch_wavelengths, start)
+    new_frame, stopped = asyncio.Condition(), asyncio.Event()
+    await asyncio.gather(acquire(device, ring, new_frame, stopped, start + duration),
+                         consume(ring, monitor, new_frame, stopped, print_interval))
+    return monitor
+
+
+def write_kinetics(monitor, path):
+    import pandas as pd
+
+    columns = {'Time (s)': monitor.times}
+    for i, w in enumerate(monitor.wavelengths):
+        columns[f'Absorbance at {w:.3f} nm'] = [a[i] for a in monitor.absorbance]
+    columns['Latency (ms)'] = np.array(monitor.latencies) * 1000
+    with profiled('writing', written=[path]):
+        pd.DataFrame(columns).to_csv(path, index=False)
+
+
+if __name__ == '__main__':
+    if device_name not in DEVICES:
+        raise SystemExit(f"❌ Unknown device '{device_name}', expected one of {sorted(DEVICES)}")
+    device = DEVICES[device_name](**device_options)
+    print(f"--- 🚀 Live acquisition: {device_name} for {duration:g} s ---")
+    try:
+        monitor = asyncio.run(run_kinetics(device, watch_wavelengths, duration, n_dark_frames,
+                                           n_reference_frames, ring_capacity, print_interval))
+    finally:
+        device.close()
+
+    print(f"📊 {monitor.latency_summary()}")
+    if output_file:
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        write_kinetics(monitor, output_file)
+        print(f"🎉 Kinetics saved: {output_file}")
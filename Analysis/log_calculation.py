@@ -1,113 +1,171 @@
 import os
-import pandas as pd
 import numpy as np
 
+from batch_executor import default_workers, run_groups
+from manifest import load_manifest, save_manifest, spectrum_digests
+from spectrum_sets import log_ratio
+from profiling import profiled
+from settings import apply_settings
+from spectrum_cube import Spectrum, list_groups, list_spectrum_files, open_cube, read_spectrum
+from spectrum_reader import read_spectra
+from wavelength_grid import get_grid
+
 # --- Please replace with your own paths ---
 
 # Main data folder: parent folder containing all subfolders (e.g., DMNP-30s/NetSample/)
 main_data_folder = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/analysis/15min'
 
+# Output folder: absorbances are written to <output_data_folder>/<subfolder>/<file>.csv
+# (same layout as the input); the input spectra are never modified
+output_data_folder = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/absorbance/15min'
+
 # Define the reference file name
 REFERENCE_FILENAME = '0.csv'
 
+# Optional: binary spectrum cube built from main_data_folder with
+# `python spectrum_cube.py <main_data_folder> <cube folder>`. Spectra are then sliced from
+# the cube (None = read the CSV files)
+main_data_cube_folder = None
+
+# Reruns only process spectra whose content (or whose group's reference) changed since the
+# last run, using the .manifest.json kept in every output subfolder. True = redo everything
+force_recompute = False
+
+# Number of worker processes; subfolders are processed in parallel
+# (1 = process the subfolders one after another in this process)
+n_workers = default_workers()
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
 # ----------------------------
 
-# 1. Iterate over all items in the main folder
-for subfolder_name in os.listdir(main_data_folder):
-    # Construct the full path of the current subfolder
-    subfolder_path = os.path.join(main_data_folder, subfolder_name)
 
-    # Check whether the current item is a folder
-    if not os.path.isdir(subfolder_path):
-        continue  # Skip files or other non-folder items
+def read_samples(main_data_folder, subfolder_name, filenames, main_data_cube=None):
+    # Sample spectra of one subfolder as a list of (filenames, Spectrum with a (files x pixels)
+    # values matrix), one entry per wavelength axis / column layout found
+    if main_data_cube is not None:
+        rows = [main_data_cube.row(subfolder_name, f) for f in filenames]
+        spectrum = read_spectrum(main_data_folder, subfolder_name, filenames[0], main_data_cube)
+        return [(list(filenames), spectrum._replace(values=main_data_cube.spectra[rows]))]
+
+    batch = read_spectra([os.path.join(main_data_folder, subfolder_name, f) for f in filenames])
+    blocks = []
+    if batch.paths:
+        blocks.append(([os.path.basename(p) for p in batch.paths],
+                       Spectrum(batch.wavelength_column, batch.value_column, batch.wavelengths, batch.values)))
+    # Files that do not fit the batch layout (e.g. another wavelength grid) are read one by one
+    for path, reason in batch.malformed:
+        filename = os.path.basename(path)
+        try:
+            sample = read_spectrum(main_data_folder, subfolder_name, filename)
+        except Exception as e:
+            print(f"❌ Error while reading file {filename}: {e}")
+            continue
+        blocks.append(([filename], sample._replace(values=np.atleast_2d(sample.values))))
+    return blocks
 
-    print(f"\n--- 🚀 Processing folder: **{subfolder_name}** ---")
 
-    # 2. Construct the reference file path for the current group
-    reference_file_path = os.path.join(subfolder_path, REFERENCE_FILENAME)
+def process_subfolder(subfolder_name, main_data_folder, output_data_folder, main_data_cube_folder=None,
+                      force_recompute=False):
+    # log10(reference / sample) for every new or changed sample file of one subfolder, written to
+    # the output tree; returns the number of files written (None if skipped).
+    # Runs in a worker process, see batch_executor.py
+    import pandas as pd
 
-    # Check whether the reference file exists
-    if not os.path.exists(reference_file_path):
-        print(f"⚠️ Warning: Reference file '{REFERENCE_FILENAME}' not found in folder '{subfolder_name}'. Skipping this folder.")
-        continue
+    main_data_cube = open_cube(main_data_cube_folder)
+
+    output_folder = os.path.join(output_data_folder, subfolder_name)
+
+    print(f"\n--- 🚀 Processing folder: **{subfolder_name}** ---")
 
-    # 3. Read the reference file (used only to obtain row count and column information)
+    # 2. Content hash of every input spectrum of the group
+    filenames = sorted(list_spectrum_files(main_data_folder, subfolder_name, main_data_cube))
+    if REFERENCE_FILENAME not in filenames:
+        print(f"⚠️ Warning: Reference file '{REFERENCE_FILENAME}' not found in folder '{subfolder_name}'. Skipping this folder.")
+        return None
+    digests = spectrum_digests(main_data_folder, subfolder_name, filenames, main_data_cube)
+
+    # 3. Compare with the manifest of the last run: a changed reference invalidates the whole group
+    manifest = {} if force_recompute else load_manifest(output_folder)
+    reference_entry = {'filename': REFERENCE_FILENAME, 'digest': digests[REFERENCE_FILENAME]}
+    done = manifest.get('files', {}) if manifest.get('reference') == reference_entry else {}
+    samples = [f for f in filenames if f != REFERENCE_FILENAME]
+    stale = [f for f in samples
+             if done.get(f) != digests[f] or not os.path.exists(os.path.join(output_folder, f))]
+    reference_stale = (manifest.get('reference') != reference_entry
+                       or not os.path.exists(os.path.join(output_folder, REFERENCE_FILENAME)))
+
+    # Outputs of inputs that were deleted since the last run are removed as well
+    os.makedirs(output_folder, exist_ok=True)
+    for filename in set(manifest.get('files', {})) - set(samples):
+        if os.path.exists(os.path.join(output_folder, filename)):
+            os.remove(os.path.join(output_folder, filename))
+            print(f"  🗑️ Removed output of deleted input: {filename}")
+
+    if not stale and not reference_stale:
+        print(f"✅ Folder '{subfolder_name}' is up to date ({len(samples)} sample files unchanged).")
+        save_manifest(output_folder, {'reference': reference_entry, 'files': {f: digests[f] for f in samples}})
+        return 0
+
+    # 4. Read the reference once for the whole group
     try:
-        reference_df = pd.read_csv(reference_file_path)
-        if reference_df.shape[1] < 2:
-            print(f"⚠️ Warning: {REFERENCE_FILENAME} has fewer than 2 columns. Skipping this folder.")
-            continue
-        col2_name = reference_df.columns[1]
-        # Extract reference column values for subsequent sample file calculations
-        ref_values = reference_df.iloc[:, 1].to_numpy()
-        print(f"✅ Reference file loaded: {REFERENCE_FILENAME}, reference column name: {col2_name}")
+        reference = read_spectrum(main_data_folder, subfolder_name, REFERENCE_FILENAME, main_data_cube)
+        ref_values = np.asarray(reference.values, dtype=float)
+        reference_grid = get_grid(reference.wavelengths)
+        print(f"✅ Reference file loaded: {REFERENCE_FILENAME}, reference column name: {reference.value_column}")
     except Exception as e:
         print(f"❌ Error while reading reference file {REFERENCE_FILENAME}: {e}. Skipping this folder.")
-        continue
+        return None
 
-    # 4. Iterate over all CSV files in the subfolder
+    # 5. Read the stale samples and compute their absorbances as one matrix operation
+    files = {f: digests[f] for f in samples if f not in stale}
     processed_count = 0
-    for filename in os.listdir(subfolder_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(subfolder_path, filename)
-
-            # Skip the reference file itself; it will be handled separately after the loop
-            if filename == REFERENCE_FILENAME:
-                continue
-
-            # Read the current sample file
-            try:
-                sample_df = pd.read_csv(file_path)
-            except Exception as e:
-                print(f"❌ Error while reading file {filename}: {e}")
-                continue
-
-            # Check whether column structure and row count are consistent
-            if list(reference_df.columns) != list(sample_df.columns):
-                print(f"⚠️ Skipping {filename}: column names do not match")
-                continue
-            if len(reference_df) != len(sample_df):
-                print(f"⚠️ Skipping {filename}: row count mismatch ({len(reference_df)} vs {len(sample_df)})")
-                continue
-
-            # Get current sample values (second column)
-            sample_values = sample_df.iloc[:, 1].to_numpy()
-
-            # Initialize result array
-            result = np.zeros_like(ref_values, dtype=float)
-
-            # Compute the ratio and take log10 (consistent with original logic)
-            with np.errstate(divide='ignore', invalid='ignore'):
-                ratio = ref_values / sample_values
-                valid = (sample_values != 0) & (ratio > 0)
-                result[valid] = np.log10(ratio[valid])
-
-            # Replace the second column of the sample file
-            sample_df.iloc[:, 1] = result
-
-            # Save (overwrite)
-            sample_df.to_csv(file_path, index=False)
-            print(f"  > Processed and overwritten: {filename}")
-            processed_count += 1
-
-    # 5. [New step] Process the 0.csv file
-    try:
-        # Re-read 0.csv
-        ref_df_to_update = pd.read_csv(reference_file_path)
+    for block_files, block in (read_samples(main_data_folder, subfolder_name, stale, main_data_cube) if stale else []):
+        # Check whether the column structure is consistent
+        if (reference.wavelength_column, reference.value_column) != (block.wavelength_column, block.value_column):
+            print(f"⚠️ Skipping {', '.join(block_files)}: column names do not match")
+            continue
 
-        # Replace all values in the second column with 0
-        ref_df_to_update.iloc[:, 1] = 0.0
+        # Samples recorded on a different wavelength grid are resampled onto the reference grid
+        block_grid = get_grid(block.wavelengths)
+        if block_grid is not reference_grid:
+            print(f"  ℹ️ {', '.join(block_files)}: resampled onto the wavelength grid of {REFERENCE_FILENAME}")
+        result = log_ratio(ref_values, block_grid.resample(block.values, reference_grid))
+
+        for filename, values in zip(block_files, result):
+            sample_df = pd.DataFrame({block.wavelength_column: reference.wavelengths, block.value_column: values})
+            save_path = os.path.join(output_folder, filename)
+            with profiled('writing', written=[save_path]):
+                sample_df.to_csv(save_path, index=False)
+            files[filename] = digests[filename]
+            processed_count += 1
+            print(f"  > Processed: {filename}")
 
-        # Save (overwrite)
-        ref_df_to_update.to_csv(reference_file_path, index=False)
-        print(f"🎉 Successfully set all values in the second column of '{REFERENCE_FILENAME}' to 0.")
+    # 6. The reference itself becomes an all-zero absorbance spectrum
+    if reference_stale:
+        save_path = os.path.join(output_folder, REFERENCE_FILENAME)
+        with profiled('writing', written=[save_path]):
+            pd.DataFrame({reference.wavelength_column: reference.wavelengths,
+                          reference.value_column: np.zeros(len(ref_values))}).to_csv(save_path, index=False)
+        print(f"🎉 Wrote '{REFERENCE_FILENAME}' with all values in the second column set to 0.")
 
-    except Exception as e:
-        print(f"❌ Warning: Unable to process or overwrite {REFERENCE_FILENAME}: {e}")
+    save_manifest(output_folder, {'reference': reference_entry, 'files': files})
 
     if processed_count == 0:
-        print(f"👉 No additional files were processed in folder '{subfolder_name}'.")
+        print(f"👉 No sample files were processed in folder '{subfolder_name}'.")
     else:
-        print(f"🎉 Folder '{subfolder_name}' processing complete. {processed_count} sample files overwritten.")
+        print(f"🎉 Folder '{subfolder_name}' processing complete. {processed_count} sample files written "
+              f"({len(samples) - len(stale)} unchanged).")
+    return processed_count
+
+
+if __name__ == '__main__':
+    if os.path.abspath(output_data_folder) == os.path.abspath(main_data_folder):
+        raise SystemExit("❌ output_data_folder must differ from main_data_folder (inputs are never overwritten)")
+
+    # 1. Process all subfolders in the main folder (in parallel); messages are reported in folder order
+    run_groups(process_subfolder, list_groups(main_data_folder, open_cube(main_data_cube_folder)),
+               args=(main_data_folder, output_data_folder, main_data_cube_folder, force_recompute),
+               workers=n_workers)
 
-print("\n=== ✨ All subfolders have been processed! ===")
+    print("\n=== ✨ All subfolders have been processed! ===")
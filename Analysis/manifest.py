@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Content hashes of the input spectra a script has already processed.
+#
+# A manifest is a small JSON file stored next to the outputs it describes. Scripts compare
+# the current hash of every input with the one recorded in the manifest and only redo the
+# work for inputs that are new or changed, so reruns over an unchanged folder are cheap and
+# never touch their own outputs twice.
+
+MANIFEST_FILE = '.manifest.json'
+
+
+def file_digest(path, block_size=1 << 20):
+    # Content hash of one file
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def array_digest(values):
+    # Content hash of an array (e.g. one row of a spectrum cube)
+    data = np.ascontiguousarray(values)
+    return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest() + f"-{data.dtype.str}"
+
+
+def spectrum_digests(folder, group, filenames, cube=None):
+    # {filename: content hash} for spectra of one group, from the CSV files or the cube rows
+    if cube is not None:
+        return {f: array_digest(cube.spectrum(group, f)) for f in filenames}
+    return {f: file_digest(os.path.join(folder, group, f)) for f in filenames}
+
+
+def load_manifest(folder):
+    # {} when the folder has no (readable) manifest yet
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(folder, manifest):
+    # Written to a temporary file first, so an interrupted run never leaves half a manifest
+    path = os.path.join(folder, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
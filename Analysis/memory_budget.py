@@ -0,0 +1,53 @@
+# Chunking of large campaigns, shared by the Analysis scripts; no dependencies beyond the
+# standard library, so library modules such as calibration.py can use it.
+#
+# Large campaigns do not fit in memory at once. The helpers below split the work into
+# chunks whose working arrays stay below a budget in MB (the `memory_budget_mb` setting of
+# the scripts): chunk_by_budget() for stages that stream spectra (files), and
+# column_windows() for stages that need every spectrum at once, such as fitting across
+# concentrations, which then run one wavelength window after another.
+
+# MB of working arrays per process when a script does not set memory_budget_mb
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+
+def chunk_list(items, n_chunks):
+    # Split a list into at most n_chunks contiguous, non-empty chunks
+    n_chunks = max(1, min(n_chunks, len(items)))
+    size, extra = divmod(len(items), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        stop = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:stop])
+        start = stop
+    return [c for c in chunks if c]
+
+
+def budget_items(item_bytes, memory_budget_mb=None, workers=1):
+    # Number of items of item_bytes each that fit in the budget of one of `workers` processes (>= 1)
+    if memory_budget_mb is None:
+        memory_budget_mb = DEFAULT_MEMORY_BUDGET_MB
+    budget = memory_budget_mb * 1024 ** 2 / max(workers, 1)
+    return max(1, int(budget // max(item_bytes, 1)))
+
+
+def chunk_by_budget(items, item_bytes, memory_budget_mb=None, workers=1):
+    """Split items into contiguous chunks of at most budget_items() items.
+
+    item_bytes: memory one item needs while it is processed (all its working copies).
+    There are at least `workers` chunks (when there are that many items), so every worker
+    process gets work and together they stay within the budget.
+    """
+    items = list(items)
+    per_chunk = budget_items(item_bytes, memory_budget_mb, workers)
+    return chunk_list(items, max(workers, -(-len(items) // per_chunk)))
+
+
+def column_windows(n_columns, column_bytes, memory_budget_mb=None, min_columns=1):
+    # Slices of consecutive columns (e.g. wavelengths) of at most budget_items() columns each,
+    # but never fewer than min_columns (a short last window is merged into the one before)
+    per_window = max(min_columns, budget_items(column_bytes, memory_budget_mb))
+    starts = list(range(0, n_columns, per_window))
+    if len(starts) > 1 and n_columns - starts[-1] < min_columns:
+        starts.pop()
+    return [slice(start, stop) for start, stop in zip(starts, starts[1:] + [n_columns])]
@@ -0,0 +1,170 @@
+from collections import namedtuple
+
+import os
+import re
+
+import numpy as np
+
+from calibration import fit_calibration
+from smoothing import smoothing_setting, value_label
+from wavelength_grid import get_grid
+
+# Full-spectrum calibration models used by linear_fit.py (calibration_mode = 'cls' / 'pls').
+#
+# Both methods use every wavelength of a window instead of a single "best" one and reduce
+# to a linear map   concentration = absorbance[window] @ coef + intercept,
+# so predicting thousands of spectra is one matrix multiply.
+#
+#   'cls'  classical least squares: absorbance = k * c + a0 is fitted at every wavelength
+#          (closed form, see calibration.py); a spectrum is then converted with the least
+#          squares solution over the window, c = (a - a0) . k / (k . k)
+#   'pls'  partial least squares (PLS1, NIPALS) with n_components latent variables; copes
+#          with overlapping bands and baseline drift better than 'cls'
+#
+# Models are stored as small .npz files (the window wavelengths, coef and intercept). A
+# single-wavelength line from linear_fit.py is the same map with one coefficient ('single').
+# Both kinds of stored calibration keep the Savitzky-Golay `smoothing` the spectra were
+# filtered with (None = raw spectra), and concentration_series.py filters the spectra to
+# predict the same way. Files written before the setting was stored load as raw spectra.
+
+CalibrationModel = namedtuple('CalibrationModel', ['method', 'wavelengths', 'coef', 'intercept', 'n_components',
+                                                   'smoothing'], defaults=[None])
+
+MODEL_METHODS = ('cls', 'pls')
+
+# Column written by linear_fit.py for the best wavelength, e.g. 'Absorbance at 411.900 nm' or,
+# with smoothing, '1st derivative of absorbance at 411.900 nm (smoothing 21, 2, 1)'
+BEST_WAVELENGTH_COLUMN = re.compile(r'(?:Absorbance|(?:1st|2nd) derivative of absorbance) at ([0-9.]+) nm'
+                                    r'(?: \(smoothing ([0-9]+), ([0-9]+), ([0-9]+)\))?')
+
+
+def _fit_cls(x, A):
+    fit = fit_calibration(x, A)
+    # Wavelengths without a usable line (< 2 inliers) do not contribute
+    k = np.nan_to_num(fit.slope)
+    a0 = np.where(np.isnan(fit.slope), 0.0, fit.intercept)
+    kk = k @ k
+    if kk == 0:
+        raise ValueError("no wavelength in the window responds to the concentration")
+    return k / kk, -(a0 @ k) / kk
+
+
+def _fit_pls(x, A, n_components):
+    # PLS1 by NIPALS on mean-centred data; returns the regression vector, intercept and the
+    # number of components used (at most the rank of the data)
+    x_mean, a_mean = x.mean(), A.mean(axis=0)
+    X, y = A - a_mean, x - x_mean
+    n_components = min(n_components, np.linalg.matrix_rank(X))
+    W = np.zeros((A.shape[1], n_components))
+    P = np.zeros((A.shape[1], n_components))
+    q = np.zeros(n_components)
+    for i in range(n_components):
+        w = X.T @ y
+        w /= np.linalg.norm(w)
+        t = X @ w
+        tt = t @ t
+        P[:, i] = X.T @ t / tt
+        q[i] = y @ t / tt
+        W[:, i] = w
+        X = X - np.outer(t, P[:, i])
+        y = y - q[i] * t
+    coef = W @ np.linalg.solve(P.T @ W, q)
+    return coef, x_mean - a_mean @ coef, n_components
+
+
+def fit_model(concentrations, abs_matrix, wavelengths, window=None, method='pls', n_components=3, smoothing=None):
+    """Fit a full-spectrum model on (n_samples x n_wavelengths) absorbances.
+
+    window: (low, high) wavelength range to use (None = all wavelengths).
+    smoothing: the Savitzky-Golay setting abs_matrix was filtered with, kept with the model.
+    """
+    if method not in MODEL_METHODS:
+        raise ValueError(f"Unknown calibration method '{method}', expected one of {MODEL_METHODS}")
+    x = np.asarray(concentrations, dtype=float)
+    A = np.asarray(abs_matrix, dtype=float)
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    if window is not None:
+        selected = get_grid(wavelengths).mask(*window)
+        A, wavelengths = A[:, selected], wavelengths[selected]
+    if A.shape[1] == 0:
+        raise ValueError("no wavelength inside the calibration window")
+
+    if method == 'cls':
+        coef, intercept = _fit_cls(x, A)
+        n_components = 0
+    else:
+        coef, intercept, n_components = _fit_pls(x, A, n_components)
+    return CalibrationModel(method, wavelengths, coef, float(intercept), int(n_components),
+                            smoothing_setting(smoothing))
+
+
+def predict(model, abs_matrix, wavelengths=None):
+    """Concentrations of one spectrum (pixels,) or many (n_spectra x pixels).
+
+    wavelengths: axis of abs_matrix if it is not already the model window; spectra are then
+    taken (or interpolated) at the model wavelengths, see wavelength_grid.py.
+    """
+    coef = model.coef
+    if wavelengths is not None:
+        # The window selection / interpolation is folded into the coefficients, so the
+        # spectra are used as they are
+        coef = get_grid(wavelengths).resample_coefficients(coef, get_grid(model.wavelengths))
+    return np.asarray(abs_matrix, dtype=float) @ coef + model.intercept
+
+
+def cross_validate(concentrations, abs_matrix, wavelengths, window=None, method='pls', n_components=3):
+    # Leave-one-out predictions (one per sample), e.g. to compare methods or component counts
+    x = np.asarray(concentrations, dtype=float)
+    A = np.asarray(abs_matrix, dtype=float)
+    predictions = np.empty(len(x))
+    for i in range(len(x)):
+        keep = np.arange(len(x)) != i
+        model = fit_model(x[keep], A[keep], wavelengths, window, method, n_components)
+        predictions[i] = predict(model, A[i], wavelengths)
+    return predictions
+
+
+def single_wavelength_model(wavelength, slope, intercept, smoothing=None):
+    # absorbance = slope * c + intercept at one wavelength, as a model: c = (a - intercept) / slope
+    return CalibrationModel('single', np.array([float(wavelength)]), np.array([1.0 / slope]),
+                            -intercept / slope, 1, smoothing_setting(smoothing))
+
+
+def best_wavelength_column(wavelength, smoothing=None):
+    # Value column of the best-wavelength CSV (parsed back by BEST_WAVELENGTH_COLUMN)
+    column = '{} at {:.3f} nm'.format(value_label(smoothing), wavelength)
+    if smoothing is not None:
+        column += ' (smoothing {}, {}, {})'.format(*smoothing_setting(smoothing))
+    return column
+
+
+def save_model(model, path):
+    # smoothing is saved as an empty array for raw spectra
+    np.savez(path, method=model.method, wavelengths=model.wavelengths, coef=model.coef,
+             intercept=model.intercept, n_components=model.n_components,
+             smoothing=np.array(model.smoothing or (), dtype=int))
+
+
+def load_model(path):
+    with np.load(path) as data:
+        smoothing = data['smoothing'] if 'smoothing' in data.files else ()
+        return CalibrationModel(str(data['method']), data['wavelengths'], data['coef'],
+                                float(data['intercept']), int(data['n_components']),
+                                smoothing_setting(smoothing) if len(smoothing) else None)
+
+
+def load_calibration(path):
+    # A stored calibration: a model file (.npz) or the best-wavelength CSV written by
+    # linear_fit.py, whose inlier points are refitted to a line
+    if os.path.splitext(path)[1].lower() == '.npz':
+        return load_model(path)
+
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    match = BEST_WAVELENGTH_COLUMN.fullmatch(df.columns[1])
+    if match is None:
+        raise ValueError(f"{path}: expected the best-wavelength CSV of linear_fit.py, found columns {list(df.columns)}")
+    slope, intercept = np.polyfit(df.iloc[:, 0].to_numpy(float), df.iloc[:, 1].to_numpy(float), 1)
+    smoothing = tuple(int(v) for v in match.groups()[1:]) if match.group(2) else None
+    return single_wavelength_model(float(match.group(1)), slope, intercept, smoothing)
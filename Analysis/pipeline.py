@@ -0,0 +1,212 @@
+import os
+
+import numpy as np
+
+from manifest import spectrum_digests
+from result_cache import DEFAULT_MAX_BYTES, cached, open_result_cache
+from settings import apply_settings
+from spectrum_cube import has_group, list_groups, list_spectrum_files, open_cube
+from spectrum_sets import SpectrumSet, load_group, log_ratio, write_set
+from wavelength_grid import get_grid
+
+# Fused in-memory pipeline:
+#   dark subtraction -> replicate average -> absorbance -> baseline correction
+#
+# Same math as analysis_eliminate_dark_background.py, data_avg.py, log_calculation.py and
+# plot_normalization.py, but every stage works on a (files x pixels) NumPy matrix held in
+# memory, and only the output of the last enabled stage is written to disk (plus, optionally,
+# every intermediate for debugging).
+#
+# Expected layout (the same as the chain of scripts):
+#   background_folder/<replicate>/<concentration>.csv
+#   sample_folder/<replicate>/<concentration>.csv
+# With averaging enabled the replicates are merged and the output folder is flat;
+# otherwise every replicate is processed on its own and written to its own subfolder.
+
+# ======== Paths ========
+background_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110-modified/600s/back'
+sample_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110-modified/600s/sample'
+output_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110-modified/600s/pipeline'
+
+# ======== Stages to run ========
+run_dark_subtraction = True   # sample - background (negative values set to 0)
+run_average = True            # mean over the replicate subfolders
+run_absorbance = True         # log10(reference / sample), reference = REFERENCE_FILENAME
+run_baseline = True           # subtract the mean inside [baseline_min, baseline_max]
+
+REFERENCE_FILENAME = '0.csv'
+baseline_min = 570
+baseline_max = 740
+
+# Also write the output of every stage to output_folder/_intermediate/<stage>/ (debugging)
+dump_intermediates = False
+
+# Optional cubes built from the two input folders (see spectrum_cube.py; None = read CSVs)
+background_cube_folder = None
+sample_cube_folder = None
+
+# Optional result cache (see result_cache.py): every stage result is stored under a hash of
+# its inputs and settings, so a rerun with e.g. another baseline range only redoes the
+# baseline stage. None = no cache (the input files are then not hashed either)
+result_cache_folder = None
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+def group_inputs(folder, group, cube=None):
+    # [(filename, content hash)] of one group: the cache input of the group's spectra
+    return sorted(spectrum_digests(folder, group, list_spectrum_files(folder, group, cube), cube).items())
+
+
+def dark_subtract(sample_set, background_set):
+    # Sample - Background for the filenames present in both sets, negatives set to 0
+    background_rows = {name: i for i, name in enumerate(background_set.filenames)}
+    paired = [(i, background_rows[name]) for i, name in enumerate(sample_set.filenames) if name in background_rows]
+    missing = [name for name in sample_set.filenames if name not in background_rows]
+    if missing:
+        print(f"⚠️ Missing background for {len(missing)} files: {', '.join(missing)}")
+    sample_idx = [i for i, _ in paired]
+    background_idx = [j for _, j in paired]
+    # A background recorded on another wavelength grid is resampled onto the sample grid
+    background_values = get_grid(background_set.wavelengths).resample(
+        background_set.values[background_idx], get_grid(sample_set.wavelengths))
+    diff = sample_set.values[sample_idx] - background_values
+    np.maximum(diff, 0, out=diff)
+    return sample_set._replace(filenames=[sample_set.filenames[i] for i in sample_idx], values=diff)
+
+
+def average_replicates(replicate_sets):
+    # Mean over replicates for every filename found in any replicate (as data_avg.py); a
+    # replicate that lacks a file is left out of that file's mean, and replicates recorded on
+    # another wavelength grid are resampled onto the grid of the first one
+    replicate_sets = [s for s in replicate_sets if s is not None]
+    first = replicate_sets[0]
+    grid = get_grid(first.wavelengths)
+    filenames = list(dict.fromkeys(name for s in replicate_sets for name in s.filenames))
+    rows = {name: i for i, name in enumerate(filenames)}
+    stack = np.full((len(replicate_sets), len(filenames), len(first.wavelengths)), np.nan)
+    for r, replicate in enumerate(replicate_sets):
+        replicate_grid = get_grid(replicate.wavelengths)
+        if replicate_grid is not grid:
+            print(f"ℹ️ Replicate {r + 1} resampled onto the wavelength grid of the first replicate")
+        stack[r, [rows[name] for name in replicate.filenames]] = replicate_grid.resample(replicate.values, grid)
+        present = set(replicate.filenames)
+        for name in filenames:
+            if name not in present:
+                print(f"Warning: {name} not found in replicate {r + 1}")
+    with np.errstate(invalid='ignore'):
+        mean = np.nanmean(stack, axis=0)
+    return SpectrumSet('Wavelength (nm)', 'Mean Intensity (a.u.)', first.wavelengths, filenames, mean)
+
+
+def absorbance(spectrum_set, reference_filename=REFERENCE_FILENAME):
+    # log10(reference / sample) for the whole set in one matrix operation (as log_calculation.py);
+    # invalid ratios give 0 and the reference row itself becomes 0
+    if reference_filename not in spectrum_set.filenames:
+        print(f"⚠️ Warning: Reference file '{reference_filename}' not found. Skipping this group.")
+        return None
+    ref_values = spectrum_set.values[spectrum_set.filenames.index(reference_filename)]
+    result = log_ratio(ref_values, spectrum_set.values)
+    result[spectrum_set.filenames.index(reference_filename)] = 0.0
+    return spectrum_set._replace(values=result)
+
+
+def baseline_correct(spectrum_set, baseline_min=baseline_min, baseline_max=baseline_max):
+    # Subtract each spectrum's mean inside the baseline window (as plot_normalization.py)
+    mask = (spectrum_set.wavelengths >= baseline_min) & (spectrum_set.wavelengths <= baseline_max)
+    baseline_mean = spectrum_set.values[:, mask].mean(axis=1, keepdims=True)
+    return spectrum_set._replace(value_column=f"{spectrum_set.value_column} (baseline corrected)",
+                                 values=spectrum_set.values - baseline_mean)
+
+
+def run_pipeline(background_folder, sample_folder, output_folder,
+                 dark_subtraction=True, average=True, absorbance_stage=True, baseline=True,
+                 reference_filename=REFERENCE_FILENAME, baseline_range=(baseline_min, baseline_max),
+                 dump_intermediates=False, background_cube_folder=None, sample_cube_folder=None,
+                 result_cache_folder=None, result_cache_max_bytes=DEFAULT_MAX_BYTES):
+    """Run the enabled stages in memory and write only the final spectra.
+
+    Returns {output subfolder ('' when averaged): SpectrumSet}.
+    """
+    background_cube = open_cube(background_cube_folder)
+    sample_cube = open_cube(sample_cube_folder)
+    cache = open_result_cache(result_cache_folder, result_cache_max_bytes)
+
+    def dump(stage, group, spectrum_set):
+        if dump_intermediates and spectrum_set is not None:
+            write_set(spectrum_set, os.path.join(output_folder, '_intermediate', stage, group))
+
+    # 1. Load (and dark-subtract) every replicate group; the spectra are only read when the
+    #    result is not in the cache
+    replicates = {}
+    for group in sorted(list_groups(sample_folder, sample_cube)):
+        if not list_spectrum_files(sample_folder, group, sample_cube):
+            print(f"⚠ No CSV files found in subfolder {group}, skipping.")
+            continue
+        if dark_subtraction:
+            if not has_group(background_folder, group, background_cube):
+                print(f"⚠️ Warning: Background folder '{group}' is missing. Skipping this group.")
+                continue
+
+            def compute():
+                sample_set = load_group(sample_folder, group, sample_cube)
+                background_set = load_group(background_folder, group, background_cube)
+                if sample_set is None or background_set is None:
+                    return None
+                return dark_subtract(sample_set, background_set)
+
+            key, spectrum_set = cached(cache, 'dark_subtraction', None,
+                                       lambda: [group_inputs(sample_folder, group, sample_cube),
+                                                group_inputs(background_folder, group, background_cube)],
+                                       compute)
+            dump('dark_subtraction', group, spectrum_set)
+        else:
+            key, spectrum_set = cached(cache, 'load', None, lambda: [group_inputs(sample_folder, group, sample_cube)],
+                                       lambda: load_group(sample_folder, group, sample_cube))
+        if spectrum_set is not None:
+            replicates[group] = (key, spectrum_set)
+
+    if not replicates:
+        print("⚠️ Nothing to process.")
+        return {}
+
+    # 2. Replicate average (merges all groups into one set)
+    if average:
+        key, spectrum_set = cached(cache, 'average', None, [key for key, _ in replicates.values()],
+                                   lambda: average_replicates([s for _, s in replicates.values()]))
+        sets = {'': (key, spectrum_set)}
+        dump('average', '', spectrum_set)
+    else:
+        sets = replicates
+
+    # 3. Absorbance and 4. baseline correction, per remaining set
+    results = {}
+    for group, (key, spectrum_set) in sets.items():
+        if absorbance_stage:
+            key, spectrum_set = cached(cache, 'absorbance', {'reference_filename': reference_filename}, [key],
+                                       lambda: absorbance(spectrum_set, reference_filename))
+            if spectrum_set is None:
+                continue
+            dump('absorbance', group, spectrum_set)
+        if baseline:
+            key, spectrum_set = cached(cache, 'baseline', {'baseline_range': baseline_range}, [key],
+                                       lambda: baseline_correct(spectrum_set, *baseline_range))
+        write_set(spectrum_set, os.path.join(output_folder, group))
+        results[group] = spectrum_set
+        print(f"🎉 '{group or 'average'}': {len(spectrum_set.filenames)} spectra written.")
+
+    if cache is not None:
+        print(f"♻️ Result cache: {cache.hits} stage results reused, {cache.misses} computed.")
+    return results
+
+
+if __name__ == '__main__':
+    print("--- 🚀 Running the in-memory pipeline ---")
+    run_pipeline(background_folder, sample_folder, output_folder,
+                 dark_subtraction=run_dark_subtraction, average=run_average,
+                 absorbance_stage=run_absorbance, baseline=run_baseline,
+                 reference_filename=REFERENCE_FILENAME, baseline_range=(baseline_min, baseline_max),
+                 dump_intermediates=dump_intermediates,
+                 background_cube_folder=background_cube_folder, sample_cube_folder=sample_cube_folder,
+                 result_cache_folder=result_cache_folder)
+    print("\n=== ✨ Pipeline complete! ===")
@@ -1,70 +1,117 @@
 import os
-import pandas as pd
+
+from baseline import estimate_baseline
+from batch_executor import default_workers, run_groups
+from profiling import profiled
+from result_cache import open_result_cache, read_group_cached
+from settings import apply_settings
+from spectrum_cube import list_groups, list_spectrum_files, open_cube
 
 # ===== Root input folder to process (contains multiple subfolders) =====
 input_root_folder = '/Users/yang/Desktop/EPoN Spectrometer/CCS100 Spectrum Data_R110+citric/analysis/100000'
 output_root_folder = '/Users/yang/Desktop/EPoN Spectrometer/R110+citric_normal/100000'
 
-os.makedirs(output_root_folder, exist_ok=True)
+# Optional: binary spectrum cube built from input_root_folder with
+# `python spectrum_cube.py <input_root_folder> <cube folder>` (None = read the CSV files)
+input_cube_folder = None
 
 # ===== Baseline range =====
 baseline_min = 570
 baseline_max = 740
 
-# ===== Iterate over all subfolders in the root folder =====
-subfolders = [
-    name for name in os.listdir(input_root_folder)
-    if os.path.isdir(os.path.join(input_root_folder, name)) and not name.startswith(".")
-]
+# ===== Baseline mode (see baseline.py) =====
+# 'window_mean': subtract the mean intensity inside [baseline_min, baseline_max] (flat baselines)
+# 'als':         asymmetric least squares baseline, for sloping / curved baselines
+#                (e.g. scattering MOF suspensions)
+# 'polynomial':  iterative polynomial baseline of degree polynomial_degree
+baseline_mode = 'window_mean'
+als_lambda = 1e9        # ALS smoothness (larger = stiffer baseline)
+als_p = 0.001           # ALS asymmetry (weight of the points above the baseline)
+als_iterations = 10
+polynomial_degree = 3
+
+# ===== Optional result cache (see result_cache.py; None = no cache) =====
+# Parsed input spectra are cached by content, so a rerun with another baseline range
+# does not parse the CSV files again
+result_cache_folder = None
+
+# ===== Number of worker processes (1 = process subfolders one after another) =====
+n_workers = default_workers()
 
-print("📁 Detected subfolders:")
-for s in subfolders:
-    print(" -", s)
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
 
-print("\nStarting processing...\n")
 
-# ========== Main loop: process each subfolder ==========
-for sub in subfolders:
+# ========== Process one subfolder (runs in a worker process, see batch_executor.py) ==========
+def process_subfolder(sub, input_root_folder, output_root_folder, baseline_min, baseline_max,
+                      input_cube_folder=None, result_cache_folder=None, baseline_mode='window_mean',
+                      baseline_options=None):
+    # baseline_options: keyword arguments of baseline.estimate_baseline (lam, p, n_iter, degree)
+    import pandas as pd
+
+    input_cube = open_cube(input_cube_folder)
+    cache = open_result_cache(result_cache_folder)
 
-    input_folder = os.path.join(input_root_folder, sub)
     output_folder = os.path.join(output_root_folder, sub)
     os.makedirs(output_folder, exist_ok=True)
 
     # Get all CSV files in the current subfolder
-    files = [f for f in os.listdir(input_folder) if f.endswith('.csv')]
+    files = list_spectrum_files(input_root_folder, sub, input_cube)
 
     if not files:
         print(f"⚠ No CSV files found in subfolder {sub}, skipping.")
-        continue
+        return 0
 
     print(f"\n🔷 Processing subfolder: {sub}")
 
-    for fname in files:
-
-        fpath = os.path.join(input_folder, fname)
-        df = pd.read_csv(fpath)
+    # One matrix of all spectra of the subfolder (files on another wavelength grid resampled
+    # onto the subfolder's grid, unreadable files reported and skipped)
+    _, spectrum_set = read_group_cached(cache, input_root_folder, sub, files, input_cube)
+    if spectrum_set is None:
+        print(f"⚠ No readable spectra in subfolder {sub}, skipping.")
+        return 0
 
-        # Assume first column is wavelength, second column is intensity
-        wavelength = df.iloc[:, 0]
-        intensity = df.iloc[:, 1]
+    # Baselines of all spectra are estimated in one batch
+    baselines = estimate_baseline(spectrum_set.wavelengths, spectrum_set.values, baseline_mode,
+                                  (baseline_min, baseline_max), **(baseline_options or {}))
 
-        # Calculate baseline mean
-        mask = (wavelength >= baseline_min) & (wavelength <= baseline_max)
-        baseline_mean = intensity[mask].mean()
+    for fname, intensity, baseline in zip(spectrum_set.filenames, spectrum_set.values, baselines):
 
         # Baseline correction
-        corrected_intensity = intensity - baseline_mean
+        corrected_intensity = intensity - baseline
 
         # Build new DataFrame
         corrected_df = pd.DataFrame({
-            df.columns[0]: wavelength,
-            f"{df.columns[1]} (baseline corrected)": corrected_intensity
+            spectrum_set.wavelength_column: spectrum_set.wavelengths,
+            f"{spectrum_set.value_column} (baseline corrected)": corrected_intensity
         })
 
         # Save to the corresponding output subfolder
         save_path = os.path.join(output_folder, fname)
-        corrected_df.to_csv(save_path, index=False)
+        with profiled('writing', written=[save_path]):
+            corrected_df.to_csv(save_path, index=False)
+
+        print(f"  ✔ Processed {fname} | baseline mean = {baseline.mean():.4f}")
+
+    return len(spectrum_set.filenames)
+
+
+if __name__ == '__main__':
+    os.makedirs(output_root_folder, exist_ok=True)
+
+    # ===== Iterate over all subfolders in the root folder =====
+    subfolders = list_groups(input_root_folder, open_cube(input_cube_folder))
+
+    print("📁 Detected subfolders:")
+    for s in subfolders:
+        print(" -", s)
+
+    print("\nStarting processing...\n")
 
-        print(f"  ✔ Processed {fname} | baseline mean = {baseline_mean:.4f}")
+    # ========== Main loop: process each subfolder (in parallel, reported in order) ==========
+    run_groups(process_subfolder, subfolders,
+               args=(input_root_folder, output_root_folder, baseline_min, baseline_max, input_cube_folder,
+                     result_cache_folder, baseline_mode,
+                     dict(lam=als_lambda, p=als_p, n_iter=als_iterations, degree=polynomial_degree)),
+               workers=n_workers)
 
-print("\n🎉 All files have been processed!")
+    print("\n🎉 All files have been processed!")
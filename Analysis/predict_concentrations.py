@@ -0,0 +1,36 @@
+from concentration_series import predict_time_series
+from multivariate_calibration import load_calibration
+from profiling import profiled
+from settings import apply_settings
+
+# Batch concentration prediction for a kinetics campaign.
+#
+# Expected layout: one subfolder per time point, holding one absorbance spectrum per replicate
+#   absorbance_root/<time point>/<replicate>.csv      e.g. 30s/1.csv, 30s/2.csv, 360s/1.csv ...
+# Every spectrum is converted with a stored calibration (the model file of linear_fit.py in
+# 'cls' / 'pls' mode, or its best-wavelength CSV); all spectra of a time point are read in one
+# batch and predicted with one matrix multiply. The result is the time x replicate table that
+# concentration_vs_time_plot.py reads: one column per time point, one row per replicate
+# (see concentration_series.py).
+
+# ======== Paths ========
+absorbance_root = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/absorbance/NH2_3'
+calibration_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/best_wavelength.csv'
+output_file = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat/analysis/NH2_3_time-conc.csv'
+
+# The spectra are filtered with the Savitzky-Golay smoothing stored with the calibration.
+# Optional check: a setting here that differs from the stored one stops the run (None = no check)
+smoothing = None
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
+if __name__ == '__main__':
+    model = load_calibration(calibration_file)
+    print(f"📈 Calibration loaded: {model.method} ({len(model.wavelengths)} wavelengths, "
+          f"smoothing = {model.smoothing})")
+
+    table = predict_time_series(absorbance_root, model, smoothing)
+    with profiled('writing', written=[output_file]):
+        table.to_csv(output_file, index=False)
+    print(f"🎉 Concentration table ({table.shape[0]} replicates x {table.shape[1]} time points) saved: {output_file}")
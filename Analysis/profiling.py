@@ -0,0 +1,232 @@
+import atexit
+import contextlib
+import cProfile
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Profiling mode shared by all Analysis scripts.
+#
+# Enable it with environment variables, no script changes needed:
+#   UVVIS_PROFILE=report.json python data_avg.py
+#   UVVIS_PROFILE=report.json UVVIS_PROFILE_CPROFILE=slowest.prof python log_calculation.py
+#
+# The shared helpers time their work per stage: 'listing' (directory listing), 'parsing'
+# (reading spectra), 'writing' (output CSVs) and 'plotting'; with the number of files and
+# bytes read / written. Everything else a group does (the arithmetic) is reported as
+# 'compute_seconds'. Each subfolder group run by batch_executor.run_groups() gets its own
+# record with its wall time; work outside the groups goes to the '(main)' record. The JSON
+# report is written when the script exits.
+#
+# Peak memory is measured with tracemalloc (Python and NumPy allocations, in MB): every
+# stage entry and every group record gets the highest traced memory while it ran
+# ('peak_memory_mb', the largest over the calls of a stage), so a group run after a bigger
+# one in the same process still reports its own peak. Tracing slows allocation-heavy code
+# down somewhat. 'process_peak_rss_mb' of the report is the lifetime high-water mark of the
+# main process's resident memory (not per group).
+#
+# With UVVIS_PROFILE_CPROFILE every group runs under cProfile (slower) and the stats of the
+# slowest group are kept (open with `python -m pstats slowest.prof`).
+
+PROFILE_ENV = 'UVVIS_PROFILE'
+CPROFILE_ENV = 'UVVIS_PROFILE_CPROFILE'
+
+STAGES = ('listing', 'parsing', 'writing', 'plotting')
+
+_records = []        # finished group records (main process)
+_current = None      # record the running code reports to
+_active_stage = None
+
+
+def enabled():
+    return bool(os.environ.get(PROFILE_ENV))
+
+
+def _new_record(group):
+    return {'group': group, 'wall_seconds': 0.0, 'compute_seconds': 0.0, 'peak_memory_mb': None,
+            'stages': {}}
+
+
+def _stage_entry(record, stage):
+    return record['stages'].setdefault(stage, {'seconds': 0.0, 'calls': 0, 'files_read': 0, 'bytes_read': 0,
+                                               'files_written': 0, 'bytes_written': 0, 'peak_memory_mb': 0.0})
+
+
+def _file_sizes(paths):
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            pass
+    return sizes
+
+
+# tracemalloc has a single peak counter, reset at the start of every measured block. Each
+# open block keeps the highest peak seen before its inner blocks reset the counter
+_peak_frames = []
+
+
+def _begin_peak():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    peak = tracemalloc.get_traced_memory()[1]
+    if _peak_frames:
+        _peak_frames[-1] = max(_peak_frames[-1], peak)
+    _peak_frames.append(0)
+    tracemalloc.reset_peak()
+
+
+def _end_peak():
+    # Peak traced memory (MB) of the block started by the matching _begin_peak()
+    peak = max(_peak_frames.pop(), tracemalloc.get_traced_memory()[1])
+    if _peak_frames:
+        _peak_frames[-1] = max(_peak_frames[-1], peak)
+    return round(peak / 1024 ** 2, 1)
+
+
+def _process_peak_rss_mb():
+    # Lifetime peak resident memory of this process (None where the resource module is missing)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+@contextlib.contextmanager
+def profiled(stage, read=(), written=()):
+    """Time a block as one of STAGES; `read` / `written` are the files it reads / writes.
+
+    Does nothing unless profiling is enabled. Nested blocks only add their file counts,
+    so time is never counted twice.
+    """
+    global _active_stage
+    if _current is None:
+        yield
+        return
+    entry = _stage_entry(_current, stage)
+    sizes = _file_sizes(read)
+    entry['files_read'] += len(sizes)
+    entry['bytes_read'] += sum(sizes)
+    outer = _active_stage is None
+    if outer:
+        _active_stage = stage
+        _begin_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if outer:
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            entry['peak_memory_mb'] = max(entry['peak_memory_mb'], _end_peak())
+            _active_stage = None
+        sizes = _file_sizes(written)
+        entry['files_written'] += len(sizes)
+        entry['bytes_written'] += sum(sizes)
+
+
+def group_label(group):
+    # Readable name of a group (chunks of files are shown by their first and last file)
+    if isinstance(group, (list, tuple)):
+        return f"{group[0]} .. {group[-1]} ({len(group)} files)" if group else '(empty)'
+    return str(group)
+
+
+@contextlib.contextmanager
+def group_profile(group):
+    # Profile one run_groups() call; yields the record, which is complete after the block
+    global _current
+    previous = _current
+    record = _new_record(group_label(group))
+    _current = record
+    profiler = cProfile.Profile() if os.environ.get(CPROFILE_ENV) else None
+    _begin_peak()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            fd, path = tempfile.mkstemp(prefix='uvvis_group_', suffix='.prof')
+            os.close(fd)
+            profiler.dump_stats(path)
+            record['cprofile_file'] = path
+        record['wall_seconds'] = time.perf_counter() - start
+        record['compute_seconds'] = max(0.0, record['wall_seconds'] - sum(
+            s['seconds'] for s in record['stages'].values()))
+        record['peak_memory_mb'] = _end_peak()
+        _current = previous
+
+
+def add_group_record(record):
+    # Called in the main process with the record of every finished group
+    if record is not None:
+        _records.append(record)
+
+
+def _totals(records):
+    totals = {}
+    for record in records:
+        for stage, entry in record['stages'].items():
+            total = totals.setdefault(stage, dict.fromkeys(entry, 0))
+            for k, v in entry.items():
+                # Peaks are not additive: the total is the largest one
+                total[k] = max(total[k], v) if k == 'peak_memory_mb' else total[k] + v
+    return totals
+
+
+def write_report(path, main_record, started):
+    main_record['wall_seconds'] = time.perf_counter() - started
+    main_record['peak_memory_mb'] = _end_peak()
+    # The main process mostly waits for the groups, so its remainder is not meaningful
+    main_record['compute_seconds'] = None
+    groups = list(_records)
+
+    # Keep the cProfile stats of the slowest group only
+    slowest = max(groups, key=lambda r: r['wall_seconds'], default=None)
+    cprofile_path = None
+    for record in groups:
+        tmp = record.pop('cprofile_file', None)
+        if tmp is None:
+            continue
+        if record is slowest:
+            cprofile_path = os.environ[CPROFILE_ENV]
+            shutil.move(tmp, cprofile_path)
+        else:
+            os.remove(tmp)
+
+    report = {
+        'script': os.path.abspath(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - main_record['wall_seconds'])),
+        'wall_seconds': main_record['wall_seconds'],
+        'peak_memory_mb': max(r['peak_memory_mb'] or 0 for r in groups + [main_record]),
+        'process_peak_rss_mb': _process_peak_rss_mb(),
+        'n_groups': len(groups),
+        'slowest_group': slowest['group'] if slowest else None,
+        'cprofile': cprofile_path,
+        'totals': _totals(groups + [main_record]),
+        'main': main_record,
+        'groups': groups,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Profiling report written: {path}")
+
+
+# Main process with profiling enabled: collect into the '(main)' record and write the report at exit
+# (worker processes only fill group records, which are sent back with their results)
+if enabled() and multiprocessing.parent_process() is None:
+    _current = _new_record('(main)')
+    _begin_peak()
+    atexit.register(write_report, os.environ[PROFILE_ENV], _current, time.perf_counter())
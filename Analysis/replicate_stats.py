@@ -0,0 +1,146 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Replicate statistics for data_avg.py.
+#
+# RunningStats keeps a running mean and variance per pixel (Welford's algorithm), so
+# replicates are read one at a time and memory does not grow with the number of
+# replicates. NaN pixels are ignored, like pandas' mean(skipna=True), so the count n
+# is kept per pixel.
+
+
+class RunningStats:
+    """Streaming per-pixel mean / variance over replicate spectra."""
+
+    def __init__(self):
+        self.n = None
+        self.mean = None
+        self._m2 = None
+
+    def add(self, values):
+        x = np.asarray(values, dtype=float)
+        if self.n is None:
+            self.n = np.zeros(x.shape, dtype=np.int64)
+            self.mean = np.zeros(x.shape)
+            self._m2 = np.zeros(x.shape)
+        ok = ~np.isnan(x)
+        self.n += ok
+        delta = np.where(ok, x - self.mean, 0.0)
+        self.mean += np.where(ok, delta / np.maximum(self.n, 1), 0.0)
+        self._m2 += np.where(ok, delta * (x - self.mean), 0.0)
+
+    def variance(self, ddof=1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.n > ddof, self._m2 / (self.n - ddof), np.nan)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def result_mean(self):
+        # Mean with NaN where no replicate had a value
+        return np.where(self.n > 0, self.mean, np.nan)
+
+    def ci95(self):
+        # Half-width of the t-based 95% confidence interval of the mean (NaN for n < 2)
+        from confidence_intervals import t_critical
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return t_critical(self.n, 0.95) * self.std() / np.sqrt(self.n)
+
+
+# === Robust combination of a (replicates x files x pixels) stack ===
+#
+# One saturated or bubble-contaminated replicate skews the plain mean. The robust modes
+# below work on the whole stack at once. The stack is sorted once along the replicate axis
+# (NaN = missing replicate, sorted last); every clipping rule keeps the values inside
+# [center - k, center + k], which is a contiguous range [lo, hi) of the sorted values, so
+# medians are index lookups and means/stds come from prefix sums. Each clipping iteration is
+# therefore a few vectorized passes, with no Python loop over files or pixels.
+
+RobustCombination = namedtuple('RobustCombination', ['combined', 'n_used', 'rejected'])
+
+COMBINE_METHODS = ('median', 'sigma_clip', 'mad')
+
+
+def _take(sorted_values, index):
+    # sorted_values[index[f, p], f, p]
+    return np.take_along_axis(sorted_values, index[None], axis=0)[0]
+
+
+def _range_median(sorted_values, lo, hi):
+    m = hi - lo
+    last = sorted_values.shape[0] - 1
+    low = _take(sorted_values, np.clip(lo + (m - 1) // 2, 0, last))
+    high = _take(sorted_values, np.clip(lo + m // 2, 0, last))
+    return np.where(m > 0, (low + high) / 2, np.nan)
+
+
+def _range_sums(prefix, lo, hi):
+    return _take(prefix, hi) - _take(prefix, lo)
+
+
+def _count_below(sorted_values, threshold, inclusive=False):
+    # Number of values < threshold (<= if inclusive) per pixel; NaN compares False
+    if inclusive:
+        return (sorted_values <= threshold[None]).sum(axis=0)
+    return (sorted_values < threshold[None]).sum(axis=0)
+
+
+def combine_replicates(stack, method='sigma_clip', sigma=3.0, max_iters=5):
+    """Robust per-pixel combination over axis 0 of a (replicates x files x pixels) stack.
+
+    method: 'median'     - median of the replicates (nothing is rejected)
+            'sigma_clip' - iterative sigma-clipped mean: reject |x - median| > sigma * std
+                           of the kept values until nothing changes (or max_iters)
+            'mad'        - mean of the values with |x - median| <= sigma * 1.4826 * MAD
+    NaN marks a missing replicate. Returns RobustCombination(combined, n_used, rejected),
+    each of shape (files x pixels).
+    """
+    if method not in COMBINE_METHODS:
+        raise ValueError(f"Unknown combine method '{method}', expected one of {COMBINE_METHODS}")
+
+    stack = np.asarray(stack, dtype=float)
+    sorted_values = np.sort(stack, axis=0)
+    n_valid = (~np.isnan(stack)).sum(axis=0)
+    lo = np.zeros_like(n_valid)
+    hi = n_valid.copy()
+
+    median = _range_median(sorted_values, lo, hi)
+    if method == 'median':
+        return RobustCombination(median, n_valid, np.zeros_like(n_valid))
+
+    # Prefix sums of the values shifted by the median (keeps the variance numerically stable)
+    shifted = np.nan_to_num(sorted_values - median[None])
+    zeros = np.zeros((1,) + shifted.shape[1:])
+    prefix1 = np.concatenate([zeros, np.cumsum(shifted, axis=0)])
+    prefix2 = np.concatenate([zeros, np.cumsum(shifted ** 2, axis=0)])
+
+    if method == 'mad':
+        abs_dev = np.sort(np.abs(stack - median[None]), axis=0)
+        mad = 1.4826 * _range_median(abs_dev, lo, hi)
+        # MAD = 0 (e.g. identical replicates) would reject everything off the median: keep all
+        half_width = np.where(mad > 0, sigma * mad, np.inf)
+        lo = np.maximum(lo, _count_below(sorted_values, median - half_width))
+        hi = np.minimum(hi, _count_below(sorted_values, median + half_width, inclusive=True))
+    else:
+        for _ in range(max_iters):
+            m = np.maximum(hi - lo, 1)
+            s1 = _range_sums(prefix1, lo, hi)
+            s2 = _range_sums(prefix2, lo, hi)
+            std = np.sqrt(np.maximum(s2 / m - (s1 / m) ** 2, 0.0))
+            center = _range_median(sorted_values, lo, hi)
+            new_lo = np.maximum(lo, _count_below(sorted_values, center - sigma * std))
+            new_hi = np.minimum(hi, _count_below(sorted_values, center + sigma * std, inclusive=True))
+            # Never reject every value of a pixel
+            keep_old = new_hi <= new_lo
+            new_lo = np.where(keep_old, lo, new_lo)
+            new_hi = np.where(keep_old, hi, new_hi)
+            if np.array_equal(new_lo, lo) and np.array_equal(new_hi, hi):
+                break
+            lo, hi = new_lo, new_hi
+
+    n_used = hi - lo
+    with np.errstate(divide='ignore', invalid='ignore'):
+        combined = np.where(n_used > 0, _range_sums(prefix1, lo, hi) / n_used + median, np.nan)
+    return RobustCombination(combined, n_used, n_valid - n_used)
@@ -0,0 +1,171 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+# Content-addressed cache of stage results on local disk.
+#
+# The key of a result is a hash of the stage name and code version, the stage parameters
+# and the content hashes of its inputs (input files, see manifest.py, or the keys of
+# upstream stage results).
+# Changing a parameter only changes the keys of the stages that depend on it, so a rerun
+# reuses every unaffected intermediate and recomputes the rest.
+#
+# Entries are pickles stored as <cache_folder>/<key[:2]>/<key>.pkl. Reading an entry touches
+# its mtime; when the cache grows above max_bytes the least recently used entries are
+# deleted first. The cache is local and written by our own scripts only (pickle is not
+# safe for files from untrusted sources).
+
+# Size limit of a cache folder (all scripts)
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Version of the code behind every cached stage, part of its keys: bump a stage's number
+# whenever what it computes (or the layout of its result) changes, so that caches written
+# by older code are not reused. CACHE_FORMAT covers the entry format itself
+CACHE_FORMAT = 1
+STAGE_VERSIONS = {
+    'read_spectra': 2,
+    'load': 2,
+    'dark_subtraction': 2,
+    'average': 2,
+    'absorbance': 1,
+    'baseline': 1,
+    'calibration_fit': 2,
+}
+
+
+def stage_key(stage, params=None, inputs=()):
+    # Key of one stage result; params must be JSON-serializable (tuples become lists).
+    # Every stage needs an entry in STAGE_VERSIONS
+    if stage not in STAGE_VERSIONS:
+        raise KeyError(f"No version for cache stage '{stage}': add it to STAGE_VERSIONS")
+    version = [CACHE_FORMAT, STAGE_VERSIONS[stage]]
+    payload = json.dumps([stage, version, params, list(inputs)], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of stage results, shared by all scripts and worker processes."""
+
+    def __init__(self, cache_folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_folder, key[:2], key + '.pkl')
+
+    def _entries(self):
+        # (last use, size, path) of every entry
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_folder):
+            for f in filenames:
+                if f.endswith('.pkl'):
+                    try:
+                        st = os.stat(os.path.join(dirpath, f))
+                    except FileNotFoundError:
+                        continue   # evicted by another process
+                    entries.append((st.st_mtime_ns, st.st_size, os.path.join(dirpath, f)))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            # Missing, partly deleted or unreadable entry (e.g. written by an older version)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so readers never see half an entry
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Delete least recently used entries until the cache fits in max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+
+@functools.lru_cache(maxsize=None)
+def open_result_cache(cache_folder, max_bytes=DEFAULT_MAX_BYTES):
+    # ResultCache, or None when no cache folder is configured (one per folder and process)
+    return ResultCache(cache_folder, max_bytes) if cache_folder else None
+
+
+_MISSING = object()
+
+
+def cached(cache, stage, params, inputs, compute):
+    """(key, result) of one stage: from the cache if present, else compute() and store it.
+
+    `inputs` may be a callable returning them, so that e.g. the content hashes of input
+    files are only computed when there is a cache. `cache` may be None (caching disabled):
+    compute() is then simply called, and the key is None.
+    """
+    if cache is None:
+        return None, compute()
+    key = stage_key(stage, params, inputs() if callable(inputs) else inputs)
+    result = cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = compute()
+        cache.put(key, result)
+    return key, result
+
+
+def read_group_cached(cache, folder, group, filenames, cube=None, digests=None):
+    # (key, SpectrumSet) for the given files of one group, read with the batch reader (see
+    # spectrum_sets.load_group; None if no file could be read). Unreadable files are left out
+    # and reported; the files are only parsed when the cache has no entry for their current
+    # content. digests: the {filename: content hash} of the files when the caller already has
+    # them (the files are only hashed when there is a cache)
+    from manifest import spectrum_digests
+    from spectrum_sets import load_group
+
+    def inputs():
+        hashes = digests if digests is not None else spectrum_digests(folder, group, filenames, cube)
+        return [(f, hashes[f]) for f in filenames]
+
+    return cached(cache, 'read_spectra', None, inputs, lambda: load_group(folder, group, cube, filenames))
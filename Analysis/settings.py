@@ -0,0 +1,94 @@
+import json
+import os
+import types
+
+# Paths and parameters of the Analysis scripts from a JSON config file, so runs do not need
+# source edits. The file has one section per uvvis.py command (see COMMANDS), holding
+# values for the configuration variables at the top of that script, e.g.
+#
+#   {
+#     "dark":    {"main_background_folder": "/data/600s/back",
+#                 "main_sample_folder": "/data/600s/sample",
+#                 "main_output_folder": "/data/600s/analysis", "n_workers": 4},
+#     "fit":     {"data_folder": "/data/UiO_66-1", "target_range": [400, 420]}
+#   }
+#
+# Every script calls apply_settings(globals()) right after its configuration block. It only
+# acts when the script is the program being run, and reads the config file named by
+# UVVIS_CONFIG plus the single values in UVVIS_SETTINGS (a JSON object, set by
+# `uvvis.py --set`), so worker processes started by batch_executor.py see the same values.
+# Without these variables the values written in the script are used, as before.
+
+CONFIG_ENV = 'UVVIS_CONFIG'
+SETTINGS_ENV = 'UVVIS_SETTINGS'
+
+# uvvis.py command -> (script path relative to Analysis/, description)
+COMMANDS = {
+    'dark': ('analysis_eliminate_dark_background.py', "Sample - Background dark subtraction"),
+    'average': ('data_avg.py', "Average (or robustly combine) the replicate subfolders"),
+    'absorbance': ('log_calculation.py', "Absorbance log10(reference / sample)"),
+    'normalize': ('plot_normalization.py', "Baseline correction"),
+    'pipeline': ('pipeline.py', "Dark subtraction -> average -> absorbance -> baseline in memory"),
+    'fit': ('linear_fit.py', "Calibration fit (best wavelength, CLS or PLS)"),
+    'explore': ('calibration_explorer.py', "Browse saved per-wavelength calibration fits"),
+    'predict': ('predict_concentrations.py', "Concentrations of a time-point tree of spectra"),
+    'kinetics': ('concentration_vs_time_plot.py', "Concentration vs time plot"),
+    'rates': ('kinetics.py', "Zero / first / second-order rate constants of many traces"),
+    'plot': ('spectra_or_absorbances_plot.py', "Plot (or export) the spectra of a folder"),
+    'acquire': ('live_acquisition.py', "Live absorbance kinetics (simulated CCS100 by default)"),
+    'cube': ('spectrum_cube.py', "Build a binary spectrum cube: cube <CSV root> <cube folder>"),
+    'synthetic': ('synthetic_data.py', "Synthetic dataset: synthetic <root> [replicates] [concentrations]"),
+    'benchmark': (os.path.join('benchmarks', 'benchmark_stages.py'), "Stage benchmark suite"),
+}
+
+
+def command_for_script(path):
+    # uvvis.py command that runs the script at `path` (None if it has none)
+    name = os.path.basename(path)
+    return next((command for command, (script, _) in COMMANDS.items() if os.path.basename(script) == name), None)
+
+
+def load_config(path):
+    # {command: {name: value}} from a JSON config file
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict) or not all(isinstance(v, dict) for v in config.values()):
+        raise SystemExit(f"❌ {path}: expected a JSON object with one object per command")
+    unknown = sorted(set(config) - set(COMMANDS))
+    if unknown:
+        raise SystemExit(f"❌ {path}: unknown command sections {unknown}, expected some of {sorted(COMMANDS)}")
+    return config
+
+
+def script_settings(command):
+    # Values for one command: its config file section, then the UVVIS_SETTINGS values
+    settings = {}
+    if os.environ.get(CONFIG_ENV):
+        settings.update(load_config(os.environ[CONFIG_ENV]).get(command, {}))
+    if os.environ.get(SETTINGS_ENV):
+        settings.update(json.loads(os.environ[SETTINGS_ENV]))
+    return settings
+
+
+def _is_setting(namespace, name):
+    # Configuration variables are the plain values defined at the top of a script
+    value = namespace.get(name)
+    return (name in namespace and not name.startswith('_')
+            and not callable(value) and not isinstance(value, types.ModuleType))
+
+
+def apply_settings(namespace):
+    """Override the configuration variables of a running script (pass its globals())."""
+    if namespace.get('__name__') not in ('__main__', '__mp_main__'):
+        return
+    command = command_for_script(namespace.get('__file__', ''))
+    if command is None:
+        return
+    for name, value in script_settings(command).items():
+        if not _is_setting(namespace, name):
+            raise SystemExit(f"❌ Unknown setting '{name}' for '{command}' "
+                             f"({COMMANDS[command][0]} has no configuration variable of that name)")
+        # JSON has no tuples: keep e.g. target_range = (400, 420) a tuple
+        if isinstance(namespace[name], tuple) and isinstance(value, list):
+            value = tuple(value)
+        namespace[name] = value
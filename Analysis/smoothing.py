@@ -0,0 +1,109 @@
+import functools
+import math
+
+import numpy as np
+
+from wavelength_grid import get_grid
+
+# Savitzky-Golay smoothing and derivative spectra for linear_fit.py, predict_concentrations.py
+# and spectra_or_absorbances_plot.py (setting `smoothing`).
+#
+# Every pixel is replaced by the value (or derivative) at that pixel of a polynomial of order
+# `polyorder` fitted by least squares to the `window_length` pixels around it. The fit is a
+# fixed linear filter, so the whole (spectra x pixels) stack is filtered with one
+# scipy.ndimage.correlate1d call. The first / last window_length // 2 pixels use the
+# polynomial of the first / last full window (as scipy.signal.savgol_filter, mode='interp').
+# Filter coefficients are computed once per (window_length, polyorder, deriv).
+#
+# Derivatives are taken with respect to wavelength (per nm, on the slightly non-uniform
+# CCS100 axis), which removes constant (1st) or linear (2nd derivative) baseline offsets and
+# separates overlapping bands. A calibration must be predicted with the smoothing it was
+# fitted with, so linear_fit.py stores the setting with the calibration (see
+# multivariate_calibration.py).
+
+MAX_DERIV = 2
+
+
+@functools.lru_cache(maxsize=32)
+def savgol_coefficients(window_length, polyorder, deriv=0):
+    """(center, left, right) filter coefficients, per pixel spacing.
+
+    center: (window_length,) weights of the window around a pixel;
+    left / right: (window_length // 2, window_length) weights of the first / last full window
+    for the first / last window_length // 2 pixels.
+    """
+    if window_length % 2 != 1 or window_length < 3:
+        raise ValueError(f"window_length must be an odd number >= 3, got {window_length}")
+    if not 0 <= polyorder < window_length:
+        raise ValueError(f"polyorder must be in [0, window_length), got {polyorder}")
+    if not 0 <= deriv <= min(polyorder, MAX_DERIV):
+        raise ValueError(f"deriv must be in [0, min(polyorder, {MAX_DERIV})], got {deriv}")
+
+    half = window_length // 2
+    offsets = np.arange(-half, half + 1, dtype=float)
+    # Polynomial coefficients (constant term first) = fit @ window values
+    fit = np.linalg.pinv(np.vander(offsets, polyorder + 1, increasing=True))
+
+    def weights_at(t):
+        # d^deriv/dt^deriv of the fitted polynomial at offset t, as weights of the window values
+        powers = np.array([math.perm(k, deriv) * t ** (k - deriv) if k >= deriv else 0.0
+                           for k in range(polyorder + 1)])
+        return powers @ fit
+
+    center = weights_at(0.0)
+    left = np.array([weights_at(t) for t in range(-half, 0)])
+    right = np.array([weights_at(t) for t in range(1, half + 1)])
+    for array in (center, left, right):
+        array.flags.writeable = False
+    return center, left, right
+
+
+def savgol(values, window_length, polyorder=2, deriv=0):
+    """Savitzky-Golay filter along the last axis (per pixel, for evenly spaced pixels)."""
+    from scipy.ndimage import correlate1d
+
+    values = np.asarray(values, dtype=float)
+    if values.shape[-1] < window_length:
+        raise ValueError(f"window_length {window_length} is longer than the spectra ({values.shape[-1]} pixels)")
+    center, left, right = savgol_coefficients(int(window_length), int(polyorder), int(deriv))
+    result = correlate1d(values, center, axis=-1, mode='constant')
+    half = window_length // 2
+    result[..., :half] = values[..., :window_length] @ left.T
+    result[..., -half:] = values[..., -window_length:] @ right.T
+    return result
+
+
+def smoothing_setting(smoothing):
+    # A `smoothing` setting as a full (window length, polynomial order, derivative order)
+    # tuple of ints with the defaults filled in, or None for raw spectra
+    if smoothing is None:
+        return None
+    values = [int(v) for v in smoothing]
+    return tuple(values + [2, 0][len(values) - 1:])
+
+
+def value_label(smoothing, name='Absorbance'):
+    # Name of the filtered values, e.g. '1st derivative of absorbance' for deriv = 1
+    deriv = 0 if smoothing is None else smoothing_setting(smoothing)[2]
+    return name if deriv == 0 else f"{('1st', '2nd')[deriv - 1]} derivative of {name.lower()}"
+
+
+def smooth(wavelengths, values, window_length, polyorder=2, deriv=0):
+    """Smoothed (deriv=0) or derivative spectra (per nm) of values (last axis = pixels)."""
+    grid = get_grid(wavelengths)
+    y = grid.sort(np.asarray(values, dtype=float))
+    result = savgol(y, window_length, polyorder, deriv)
+    if deriv:
+        # Chain rule from pixel index to wavelength: dλ/di and d²λ/di² of the axis itself
+        x = grid.sorted_wavelengths
+        dx = savgol(x, window_length, polyorder, 1)
+        if deriv == 1:
+            result = result / dx
+        else:
+            d2x = savgol(x, window_length, polyorder, 2)
+            result = (result - savgol(y, window_length, polyorder, 1) * d2x / dx) / dx ** 2
+    if not grid.is_sorted:
+        unsorted = np.empty_like(result)
+        unsorted[..., grid.order] = result
+        result = unsorted
+    return result
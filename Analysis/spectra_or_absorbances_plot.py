@@ -1,11 +1,48 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+import numpy as np
+import matplotlib
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from batch_executor import default_workers, run_groups
+from profiling import profiled
+from settings import apply_settings
+from smoothing import smooth
+from spectrum_cube import read_spectrum
+from spectrum_reader import print_malformed, read_spectra
+from wavelength_grid import get_grid
 
 # ==== Modify to your CSV folder path ====
 folder_path = '/Users/yang/Desktop/MOF Cat data/CCS100 Spectrum Data MOFCat Calibration/analysis/UiO_66-1'
 
+# ==== Plot settings ====
+title = "Absorbance Plot for All Samples"
+# title = "Absorbance vs Wavelength for Different Concentrations"
+y_label = "Absorbance"
+x_range = (400, 420)   # only this wavelength window is read into the plot
+y_range = (0, 1.5)
+figure_size = (12, 6)
+dpi = 100
+
+# Optional Savitzky-Golay smoothing / derivative spectra (see smoothing.py):
+# (window length, polynomial order, derivative order), e.g. (21, 2, 0); None = raw spectra
+smoothing = None
+
+# Each trace is reduced to the min and max of every horizontal pixel of the axes, which
+# looks the same as the full-resolution line (False = plot every point)
+decimate = True
+
+# ==== Headless batch export (no windows) ====
+# List of folders to export as one image each, e.g. ['.../UiO_66-1', '.../UiO_66-2'];
+# None = show folder_path in a window
+export_folders = None
+export_folder = '/Users/yang/Desktop/MOF Cat data/plots'
+export_format = 'png'  # 'png' or 'svg'
+n_workers = default_workers()
+
+apply_settings(globals())  # values from the config file / uvvis.py, see settings.py
+
+
 # Get all CSV files named with numeric values
 def is_number(s):
     try:
@@ -14,52 +51,111 @@ def is_number(s):
     except ValueError:
         return False
 
-files = [f for f in os.listdir(folder_path) if f.endswith('.csv') and is_number(f[:-4])]
 
-files.sort(key=lambda x: float(x[:-4]))  # Sort by concentration
+def load_window(folder, x_range, smoothing=None):
+    # Concentrations and (traces x points) wavelengths / values inside x_range (plus one point on
+    # each side, so lines reach the axes), sorted by concentration; spectra are smoothed over
+    # their full range before the window is cut
+    files = [f for f in os.listdir(folder) if f.endswith('.csv') and is_number(f[:-4])]
+    files.sort(key=lambda x: float(x[:-4]))  # Sort by concentration
+
+    batch = read_spectra([os.path.join(folder, f) for f in files])
+    traces = []
+    if batch.paths:
+        traces.append(([os.path.basename(p) for p in batch.paths], batch.wavelengths, batch.values))
+    # Files outside the batch layout (e.g. another wavelength grid) are read one by one;
+    # files that cannot be read at all are skipped and listed in one summary
+    malformed = []
+    for path, reason in batch.malformed:
+        try:
+            spectrum = read_spectrum(folder, '', os.path.basename(path))
+            values = np.atleast_2d(np.asarray(spectrum.values, dtype=float))
+        except Exception:
+            malformed.append((path, reason))
+            continue
+        traces.append(([os.path.basename(path)], np.asarray(spectrum.wavelengths, dtype=float), values))
+    print_malformed(malformed)
+
+    names, wavelengths, values = [], [], []
+    for block_files, block_wavelengths, block_values in traces:
+        grid = get_grid(block_wavelengths)
+        window = grid.window(*x_range)
+        start, stop = max(window.start - 1, 0), min(window.stop + 1, len(grid))
+        if smoothing is not None:
+            block_values = smooth(block_wavelengths, block_values, *smoothing)
+        names += block_files
+        wavelengths += [grid.sorted_wavelengths[start:stop]] * len(block_files)
+        values += list(grid.sort(block_values)[:, start:stop])
+
+    order = np.argsort([float(name[:-4]) for name in names], kind='stable')
+    return ([float(names[i][:-4]) for i in order], [wavelengths[i] for i in order], [values[i] for i in order])
 
-# Get concentration values
-concentrations = [float(f[:-4]) for f in files]
-vmin, vmax = min(concentrations), max(concentrations)
 
-# Custom red gradient colormap (gradually increasing saturation)
-colors = [(1.0, 0.8 - 0.6 * (i / (len(concentrations)-1)), 0.8 - 0.6 * (i / (len(concentrations)-1)))
-          for i in range(len(concentrations))]
+def min_max_decimate(x, y, n_bins):
+    # Keep the minimum and maximum of y in each of n_bins consecutive bins (in x order)
+    n = len(y)
+    if n <= 2 * n_bins:
+        return x, y
+    size = -(-n // n_bins)
+    pad = size * (-(-n // size)) - n
+    y_bins = np.concatenate([y, np.full(pad, y[-1])]).reshape(-1, size)
+    offsets = np.arange(0, n + pad, size)
+    lo = offsets + np.argmin(y_bins, axis=1)
+    hi = offsets + np.argmax(y_bins, axis=1)
+    idx = np.minimum(np.stack([np.minimum(lo, hi), np.maximum(lo, hi)], axis=1).ravel(), n - 1)
+    return x[idx], y[idx]
 
-# Alternatively, use the Reds colormap from matplotlib (remove the lightest part)
-from matplotlib.cm import get_cmap
-cmap = get_cmap("Reds")
-custom_cmap = [cmap(0.3 + 0.7 * (i / (len(concentrations)-1))) for i in range(len(concentrations))]
 
-# Start plotting
-plt.figure(figsize=(12, 6))
+def draw_spectra(ax, concentrations, wavelengths, values):
+    # All traces as one LineCollection, colored from light to dark red by concentration
+    cmap = matplotlib.colormaps["Reds"]
+    n = max(len(concentrations) - 1, 1)
+    colors = [cmap(0.3 + 0.7 * (i / n)) for i in range(len(concentrations))]
 
-for i, fname in enumerate(files):
-    conc = float(fname[:-4])
-    filepath = os.path.join(folder_path, fname)
-    df = pd.read_csv(filepath)
+    # Plot formatting, then the layout, so the width of the axes in pixels is final
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel("Wavelength (nm)")
+    ax.set_ylabel(y_label)
+    ax.set_xlim(*x_range)
+    ax.set_ylim(*y_range)
+    ax.figure.tight_layout()
+    n_bins = max(int(ax.bbox.width), 1)
 
-    wavelength = df.iloc[:, 0]
-    intensity = df.iloc[:, 1]
+    segments = []
+    for x, y in zip(wavelengths, values):
+        if decimate:
+            x, y = min_max_decimate(x, y, n_bins)
+        segments.append(np.column_stack([x, y]))
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=0.8))
 
-    color = custom_cmap[i]
-    plt.plot(wavelength, intensity, color=color, linewidth=0.8, label=f"{conc:g} µM")
 
-# Plot formatting
-# plt.title("Absorbance vs Wavelength for Different Concentrations", fontsize=14)
-plt.title("Absorbance Plot for All Samples", fontsize=14)
+def export_plot(folder, export_folder, export_format):
+    # Render one folder to <export_folder>/<folder name>.<format> without a window
+    concentrations, wavelengths, values = load_window(folder, x_range, smoothing)
+    if not concentrations:
+        print(f"⚠️ No numeric CSV files in {folder}, skipping.")
+        return None
+    fig = Figure(figsize=figure_size, dpi=dpi)
+    ax = fig.add_subplot()
+    with profiled('plotting'):
+        draw_spectra(ax, concentrations, wavelengths, values)
+    save_path = os.path.join(export_folder, f"{os.path.basename(os.path.normpath(folder))}.{export_format}")
+    with profiled('writing', written=[save_path]):
+        fig.savefig(save_path)
+    print(f"✅ {len(concentrations)} spectra plotted: {save_path}")
+    return save_path
 
-plt.xlabel("Wavelength (nm)")
-plt.ylabel("Absorbance")
-plt.xlim(400, 420)
-plt.ylim(0, 1.5)
 
-# # Show only part of the legend (e.g., every 5 concentrations)
-# if len(concentrations) > 20:
-#     handles, labels = plt.gca().get_legend_handles_labels()
-#     plt.legend(handles[::5], labels[::5], title="Concentration", bbox_to_anchor=(1.05, 1), loc='upper left')
-# else:
-#     plt.legend(title="Concentration", bbox_to_anchor=(1.05, 1), loc='upper left')
+if __name__ == '__main__':
+    if export_folders:
+        os.makedirs(export_folder, exist_ok=True)
+        run_groups(export_plot, export_folders, args=(export_folder, export_format), workers=n_workers)
+        print("🎉 All plots exported!")
+    else:
+        import matplotlib.pyplot as plt
 
-plt.tight_layout()
-plt.show()
+        concentrations, wavelengths, values = load_window(folder_path, x_range, smoothing)
+        fig, ax = plt.subplots(figsize=figure_size, dpi=dpi)
+        with profiled('plotting'):
+            draw_spectra(ax, concentrations, wavelengths, values)
+        plt.show()
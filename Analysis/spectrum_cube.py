@@ -0,0 +1,236 @@
+import csv
+import functools
+import json
+import os
+import sys
+
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import profiled
+
+# Binary on-disk format for a folder tree of CCS100 CSV spectra.
+#
+# A cube folder contains:
+#   spectra.f32      float32 matrix (spectra x pixels), row-major, memory-mapped when read
+#   wavelengths.npy  shared wavelength vector (pixels,)
+#   index.csv        one line per row of spectra.f32: group, filename, value column name
+#   meta.json        shape, dtype and the wavelength column name
+#
+# "group" is the subfolder of the CSV file relative to the ingested root folder
+# ('' for files directly inside the root), so a cube built from e.g. the `sample/`
+# folder has one group per subfolder, exactly like the CSV layout the scripts expect.
+# Rows of the same group are stored contiguously, so a whole group can be sliced
+# without copying.
+
+SPECTRA_FILE = 'spectra.f32'
+WAVELENGTHS_FILE = 'wavelengths.npy'
+INDEX_FILE = 'index.csv'
+META_FILE = 'meta.json'
+
+
+# One spectrum as used by the Analysis scripts: first column = wavelength, second = value
+Spectrum = namedtuple('Spectrum', ['wavelength_column', 'value_column', 'wavelengths', 'values'])
+
+
+class SpectrumCube:
+    """Read-only view of a cube folder written by build_cube()."""
+
+    def __init__(self, cube_folder):
+        self.cube_folder = cube_folder
+        with open(os.path.join(cube_folder, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.wavelength_column = self.meta['wavelength_column']
+        self.wavelengths = np.load(os.path.join(cube_folder, WAVELENGTHS_FILE))
+
+        n_spectra, n_pixels = self.meta['shape']
+        if n_spectra:
+            self.spectra = np.memmap(os.path.join(cube_folder, SPECTRA_FILE), dtype=np.float32,
+                                     mode='r', shape=(n_spectra, n_pixels))
+        else:
+            self.spectra = np.empty((0, n_pixels), dtype=np.float32)
+
+        # Row index: (group, filename) -> row, plus the contiguous row range of each group
+        self.value_columns = []
+        self._rows = {}
+        self._group_ranges = {}
+        self._group_files = {}
+        with open(os.path.join(cube_folder, INDEX_FILE), newline='') as f:
+            for row, (group, filename, value_column) in enumerate(csv.reader(f)):
+                if row == 0:
+                    continue  # header line
+                row -= 1
+                self._rows[(group, filename)] = row
+                self.value_columns.append(value_column)
+                start, _ = self._group_ranges.get(group, (row, row))
+                self._group_ranges[group] = (start, row + 1)
+                self._group_files.setdefault(group, []).append(filename)
+
+    def __len__(self):
+        return self.spectra.shape[0]
+
+    def groups(self):
+        return list(self._group_ranges)
+
+    def has_group(self, group):
+        return group in self._group_ranges
+
+    def filenames(self, group):
+        return list(self._group_files.get(group, []))
+
+    def row(self, group, filename):
+        # None if the spectrum is not in the cube
+        return self._rows.get((group, filename))
+
+    def spectrum(self, group, filename):
+        # View (no copy) of one spectrum
+        return self.spectra[self._rows[(group, filename)]]
+
+    def group_spectra(self, group):
+        # View (no copy) of all spectra of one group, in the order of filenames(group)
+        start, stop = self._group_ranges[group]
+        return self.spectra[start:stop]
+
+    def value_column(self, group, filename):
+        return self.value_columns[self._rows[(group, filename)]]
+
+
+# === Helpers used by the Analysis scripts to read either a CSV folder or a cube ===
+# `cube` is a SpectrumCube built from `folder` (or None to read the CSV files),
+# `group` is the subfolder name ('' for files directly inside `folder`).
+
+def list_groups(folder, cube=None):
+    # Non-hidden subfolders of `folder`
+    if cube is not None:
+        return [g for g in cube.groups() if g and '/' not in g]
+    with profiled('listing'):
+        return [
+            d for d in os.listdir(folder)
+            if os.path.isdir(os.path.join(folder, d)) and not d.startswith('.')
+        ]
+
+
+def has_group(folder, group, cube=None):
+    if cube is not None:
+        return cube.has_group(group)
+    return os.path.isdir(os.path.join(folder, group))
+
+
+def list_spectrum_files(folder, group='', cube=None):
+    # CSV filenames of one group
+    if cube is not None:
+        return cube.filenames(group)
+    with profiled('listing'):
+        return [f for f in os.listdir(os.path.join(folder, group)) if f.endswith('.csv')]
+
+
+def read_spectrum(folder, group, filename, cube=None):
+    # Spectrum tuple, or None if the file does not exist.
+    # Cube values are memory-mapped float32 views (no copy, read-only)
+    if cube is not None:
+        row = cube.row(group, filename)
+        if row is None:
+            return None
+        return Spectrum(cube.wavelength_column, cube.value_columns[row], cube.wavelengths, cube.spectra[row])
+
+    import pandas as pd
+
+    # Missing files are caught rather than checked first: one filesystem call per file
+    path = os.path.join(folder, group, filename)
+    try:
+        with profiled('parsing', read=[path]):
+            df = pd.read_csv(path)
+    except FileNotFoundError:
+        return None
+    if df.shape[1] < 2:
+        raise ValueError("fewer than 2 columns")
+    return Spectrum(df.columns[0], df.columns[1], df.iloc[:, 0].to_numpy(), df.iloc[:, 1].to_numpy())
+
+
+@functools.lru_cache(maxsize=None)
+def open_cube(cube_folder):
+    # SpectrumCube, or None when no cube folder is configured.
+    # Cached, so each (worker) process maps a cube only once; pass the folder path,
+    # not the SpectrumCube, to worker processes
+    return SpectrumCube(cube_folder) if cube_folder else None
+
+
+def _list_csv_tree(root_folder):
+    # (group, filename) pairs for every CSV below root_folder, grouped by subfolder
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root_folder):
+        # Skip hidden folders (e.g. .DS_Store style folders) and keep a stable order
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        group = os.path.relpath(dirpath, root_folder)
+        group = '' if group == '.' else group.replace(os.sep, '/')
+        entries.extend((group, f) for f in sorted(filenames) if f.endswith('.csv'))
+    return entries
+
+
+def build_cube(root_folder, cube_folder):
+    """Convert every CSV below root_folder into one cube folder. Returns the number of spectra written."""
+    from spectrum_reader import print_malformed, read_spectra_resampled
+    from wavelength_grid import get_grid
+
+    entries = _list_csv_tree(root_folder)
+    os.makedirs(cube_folder, exist_ok=True)
+
+    wavelengths = None
+    wavelength_column = None
+    index_rows = []
+    malformed = []
+
+    # Groups are read as batches with the fast reader and appended to the binary file
+    groups = {}
+    for group, filename in entries:
+        groups.setdefault(group, []).append(filename)
+
+    with open(os.path.join(cube_folder, SPECTRA_FILE), 'wb') as out:
+        for group, filenames in groups.items():
+            # (files on another grid than the rest of their group are resampled onto the group's grid)
+            batch = read_spectra_resampled([os.path.join(root_folder, group, f) for f in filenames], dtype=np.float32)
+            malformed += batch.malformed
+            if not batch.paths:
+                continue
+            if wavelengths is None:
+                # The first spectrum defines the shared wavelength vector
+                wavelengths = batch.wavelengths
+                wavelength_column = batch.wavelength_column
+            values = batch.values
+            if get_grid(batch.wavelengths) is not get_grid(wavelengths):
+                # Group recorded on another wavelength grid: resample onto the cube's grid
+                print(f"ℹ️ Group '{group}' resampled onto the wavelength grid of the cube")
+                values = get_grid(batch.wavelengths).resample(values, get_grid(wavelengths))
+
+            out.write(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+            index_rows += [(group, os.path.basename(path), batch.value_column) for path in batch.paths]
+
+    print_malformed(malformed)
+
+    if wavelengths is None:
+        wavelengths = np.empty(0)
+    np.save(os.path.join(cube_folder, WAVELENGTHS_FILE), wavelengths)
+
+    with open(os.path.join(cube_folder, INDEX_FILE), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['group', 'filename', 'value_column'])
+        writer.writerows(index_rows)
+
+    with open(os.path.join(cube_folder, META_FILE), 'w') as f:
+        json.dump({
+            'shape': [len(index_rows), len(wavelengths)],
+            'dtype': 'float32',
+            'wavelength_column': wavelength_column,
+        }, f, indent=2)
+
+    return len(index_rows)
+
+
+if __name__ == '__main__':
+    # Usage: python spectrum_cube.py <CSV root folder> <cube output folder>
+    if len(sys.argv) != 3:
+        print("Usage: python spectrum_cube.py <CSV root folder> <cube output folder>")
+        sys.exit(1)
+    n = build_cube(sys.argv[1], sys.argv[2])
+    print(f"✅ {n} spectra written to cube: {sys.argv[2]}")
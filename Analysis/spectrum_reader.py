@@ -0,0 +1,194 @@
+import csv
+import io
+import os
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from profiling import profiled
+
+# Fast batch reader for the CCS100 two-column CSV export:
+#
+#   Wavelength (nm),Intensity (a.u.)
+#   200.0,1100.07
+#   ...
+#
+# pd.read_csv() costs ~2 ms per file, mostly fixed per-call overhead. Here the header and
+# row count are checked once per batch on the raw bytes, the bodies of many files are joined
+# and parsed by a single call of the pandas C parser, and the values are copied straight
+# into one preallocated (files x pixels) array. Files that do not fit the batch layout are
+# reported in `malformed` instead of raising. Extra columns (e.g. the std / n / CI columns
+# written by data_avg.py) are ignored, as the scripts only use the first two.
+#
+# Numbers are parsed by the same parser as pd.read_csv, so the values are identical.
+
+SpectrumBatch = namedtuple('SpectrumBatch',
+                           ['wavelength_column', 'value_column', 'wavelengths', 'paths', 'values', 'malformed'])
+
+# Files parsed per pandas call (~65 kB each for 3648 pixels)
+CHUNK_SIZE = 256
+
+
+def _split_file(raw):
+    # (header line, body ending with exactly one newline, row count, fields per row)
+    header, _, body = raw.partition(b'\n')
+    body = body.rstrip(b'\r\n\t ')
+    first_line = body.split(b'\n', 1)[0]
+    if not body:
+        return header.rstrip(b'\r'), b'', 0, 0
+    return header.rstrip(b'\r'), body + b'\n', body.count(b'\n') + 1, first_line.count(b',') + 1
+
+
+def _parse_bodies(bodies, n_rows):
+    # One C-parser call for many bodies -> (n_files, n_rows, 2) array
+    import pandas as pd
+
+    table = pd.read_csv(io.BytesIO(b''.join(bodies)), header=None, usecols=[0, 1], dtype=np.float64, engine='c')
+    if table.shape != (len(bodies) * n_rows, 2):
+        raise ValueError(f"unexpected table shape {table.shape}")
+    return table.to_numpy().reshape(len(bodies), n_rows, 2)
+
+
+def _read_raw(path):
+    with open(path, 'rb') as f:
+        return _split_file(f.read())
+
+
+def read_spectra(paths, dtype=np.float64, chunk_size=CHUNK_SIZE):
+    """Read many two-column spectrum CSVs into one (files x pixels) array.
+
+    The header, row count and wavelength axis shared by most files of the first chunk define
+    the batch layout; files that differ, or fail to parse, are left out and listed in
+    `malformed` as (path, reason). `paths` of the result are the files actually read, in
+    input order. Only one chunk of raw text is held in memory at a time.
+    """
+    paths = list(paths)
+    with profiled('parsing', read=paths):
+        return _read_spectra(paths, dtype, chunk_size)
+
+
+def read_spectra_resampled(paths, dtype=np.float64, chunk_size=CHUNK_SIZE):
+    """read_spectra(), also keeping the files left out of the batch layout.
+
+    Every malformed file (e.g. recorded on another wavelength grid, or with another row
+    count) is read again on its own and resampled onto the batch grid (see
+    wavelength_grid.py); only files that cannot be read at all stay in `malformed`.
+    `paths` of the result keep the input order.
+    """
+    from wavelength_grid import get_grid
+
+    batch = read_spectra(paths, dtype, chunk_size)
+    if not batch.malformed:
+        return batch
+    rows = dict(zip(batch.paths, batch.values))
+    header = (batch.wavelength_column, batch.value_column)
+    grid = get_grid(batch.wavelengths) if batch.paths else None
+    malformed = []
+    for path, reason in batch.malformed:
+        single = read_spectra([path], dtype)
+        if not single.paths:
+            malformed.append((path, reason))
+            continue
+        if grid is None:
+            # Nothing fitted the batch layout: the first readable file defines the grid
+            grid = get_grid(single.wavelengths)
+            header = (single.wavelength_column, single.value_column)
+        rows[path] = get_grid(single.wavelengths).resample(single.values[0], grid).astype(dtype)
+    read_paths = [path for path in paths if path in rows]
+    wavelengths = grid.wavelengths if grid is not None else batch.wavelengths
+    values = np.array([rows[path] for path in read_paths], dtype=dtype).reshape(len(read_paths), len(wavelengths))
+    return SpectrumBatch(header[0], header[1], wavelengths, read_paths, values, malformed)
+
+
+def _read_spectra(paths, dtype, chunk_size):
+    malformed = []
+    layout = None
+    values = None
+    n_read = 0
+    read_paths = []
+    wavelengths = None
+
+    for start in range(0, len(paths), chunk_size):
+        # 1. Raw bytes of this chunk, layout checks on the bytes only
+        raws = []
+        for path in paths[start:start + chunk_size]:
+            try:
+                raws.append((path, _read_raw(path)))
+            except OSError as e:
+                malformed.append((path, f"cannot read file: {e}"))
+
+        if layout is None:
+            # Batch layout = most common (header, row count, field count) of the first chunk
+            layouts = Counter((r[0], r[2], r[3]) for _, r in raws if r[2] > 0)
+            if not layouts:
+                malformed += [(path, "empty file") for path, _ in raws]
+                continue
+            layout = layouts.most_common(1)[0][0]
+            values = np.empty((len(paths), layout[1]), dtype=dtype)
+        header, n_rows, n_fields = layout
+
+        good = []
+        for path, r in raws:
+            if r[2] == 0:
+                malformed.append((path, "empty file"))
+            elif r[3] < 2:
+                malformed.append((path, f"expected at least 2 columns, found {r[3]}"))
+            elif r[0] != header:
+                malformed.append((path, f"header differs: {r[0].decode(errors='replace')!r}"))
+            elif r[2] != n_rows:
+                malformed.append((path, f"row count mismatch ({n_rows} vs {r[2]})"))
+            elif r[3] != n_fields:
+                malformed.append((path, f"column count mismatch ({n_fields} vs {r[3]})"))
+            else:
+                good.append((path, r[1]))
+
+        # 2. One parser call for the whole chunk
+        try:
+            blocks = [(good, _parse_bodies([body for _, body in good], n_rows))] if good else []
+        except Exception:
+            # Something in this chunk is not numeric: parse file by file to find it
+            blocks = []
+            for path, body in good:
+                try:
+                    blocks.append(([(path, body)], _parse_bodies([body], n_rows)))
+                except Exception as e:
+                    malformed.append((path, f"parse error: {e}"))
+
+        # 3. Copy the value column into the preallocated array
+        for files, block in blocks:
+            if wavelengths is None:
+                wavelengths = block[0, :, 0].copy()
+            # Shared wavelength axis: every file must match the first one exactly
+            same_axis = (block[:, :, 0] == wavelengths).all(axis=1)
+            for (path, _), same in zip(files, same_axis):
+                if not same:
+                    malformed.append((path, "wavelength axis differs from the batch"))
+            kept = block[same_axis, :, 1]
+            values[n_read:n_read + len(kept)] = kept
+            n_read += len(kept)
+            read_paths += [path for (path, _), same in zip(files, same_axis) if same]
+
+    # Report malformed files in input order
+    order = {path: i for i, path in enumerate(paths)}
+    malformed.sort(key=lambda item: order[item[0]])
+
+    if layout is None:
+        return SpectrumBatch(None, None, np.empty(0), [], np.empty((0, 0), dtype=dtype), malformed)
+    columns = next(csv.reader([layout[0].decode('utf-8-sig')]))
+    if wavelengths is None:
+        wavelengths = np.empty(0)
+    return SpectrumBatch(columns[0], columns[1], wavelengths, read_paths, values[:n_read], malformed)
+
+
+def read_spectrum_folder(folder, dtype=np.float64):
+    # read_spectra() for every CSV of one folder, sorted by filename
+    paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith('.csv')]
+    return read_spectra(paths, dtype=dtype)
+
+
+def print_malformed(malformed):
+    # One summary instead of one warning per file
+    if malformed:
+        print(f"⚠️ {len(malformed)} malformed files skipped:")
+        for path, reason in malformed:
+            print(f"   - {path}: {reason}")
@@ -0,0 +1,66 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import profiled
+from spectrum_cube import list_spectrum_files
+from spectrum_reader import print_malformed, read_spectra_resampled
+
+# In-memory sets of spectra (a whole group as one matrix) and the absorbance math shared by
+# pipeline.py, analysis_eliminate_dark_background.py, log_calculation.py and
+# live_acquisition.py. A library module: importing it runs no script configuration.
+
+
+# A group of spectra sharing one wavelength axis: values is (len(filenames), len(wavelengths))
+SpectrumSet = namedtuple('SpectrumSet', ['wavelength_column', 'value_column', 'wavelengths', 'filenames', 'values'])
+
+
+def load_group(folder, group, cube=None, filenames=None):
+    # Read all CSVs of one group (or only `filenames`, known to exist) into a SpectrumSet with
+    # the fast batch reader (or from the cube); files on another wavelength grid are resampled
+    # onto the group's grid, unreadable files are skipped and listed in one summary
+    if cube is not None:
+        if not cube.has_group(group):
+            return None
+        if filenames is None:
+            filenames = cube.filenames(group)
+            values = cube.group_spectra(group)
+        else:
+            values = cube.spectra[[cube.row(group, f) for f in filenames]]
+        if not len(filenames):
+            return None
+        return SpectrumSet(cube.wavelength_column, cube.value_column(group, filenames[0]), cube.wavelengths,
+                           list(filenames), np.asarray(values, dtype=float))
+
+    if filenames is None:
+        filenames = sorted(list_spectrum_files(folder, group))
+    batch = read_spectra_resampled([os.path.join(folder, group, f) for f in filenames])
+    print_malformed(batch.malformed)
+    if not batch.paths:
+        return None
+    return SpectrumSet(batch.wavelength_column, batch.value_column, batch.wavelengths,
+                       [os.path.basename(p) for p in batch.paths], batch.values)
+
+
+def log_ratio(ref_values, values):
+    # log10(ref_values / values) for every row of values; invalid ratios give 0
+    values = np.asarray(values, dtype=float)
+    result = np.zeros_like(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = ref_values / values
+        valid = (values != 0) & (ratio > 0)
+        result[valid] = np.log10(ratio[valid])
+    return result
+
+
+def write_set(spectrum_set, folder):
+    # One two-column CSV per spectrum, same layout as the scripts write
+    import pandas as pd
+
+    os.makedirs(folder, exist_ok=True)
+    for name, values in zip(spectrum_set.filenames, spectrum_set.values):
+        save_path = os.path.join(folder, name)
+        with profiled('writing', written=[save_path]):
+            pd.DataFrame({spectrum_set.wavelength_column: spectrum_set.wavelengths,
+                          spectrum_set.value_column: values}).to_csv(save_path, index=False)
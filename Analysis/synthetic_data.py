@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+
+# Synthetic CCS100 datasets in the folder layout the Analysis scripts expect:
+#
+#   <root>/back/<replicate>/<concentration>.csv     dark / background spectra
+#   <root>/sample/<replicate>/<concentration>.csv   lamp spectrum through the sample + dark
+#
+# Spectra have 3648 pixels on a slightly non-linear 350-700 nm axis (like the CCS100).
+# The sample intensity follows Beer-Lambert: lamp * 10^(-c * epsilon(wavelength)), with
+# absorption peaks at 410 nm and 520 nm, on top of the dark level and Gaussian noise, so
+# every stage (dark subtraction, averaging, absorbance, normalization, best-wavelength fit)
+# gives meaningful results. Concentration 0 (0.csv) is the reference.
+
+N_PIXELS = 3648
+WAVELENGTH_COLUMN = 'Wavelength (nm)'
+VALUE_COLUMN = 'Intensity (a.u.)'
+
+# (center nm, width nm, absorbance per concentration unit at the peak)
+ABSORPTION_PEAKS = [(410.0, 12.0, 0.010), (520.0, 25.0, 0.004)]
+
+
+def ccs100_wavelengths(n_pixels=N_PIXELS):
+    # 350-700 nm, slightly denser at the blue end as on the real detector
+    x = np.linspace(0.0, 1.0, n_pixels)
+    return np.round(350.0 + 330.0 * x + 20.0 * x ** 2, 3)
+
+
+def lamp_spectrum(wavelengths):
+    # Broad source spectrum (counts scaled to ~1 at the maximum)
+    return 0.05 + 0.9 * np.exp(-0.5 * ((wavelengths - 560.0) / 90.0) ** 2)
+
+
+def molar_absorptivity(wavelengths, peaks=ABSORPTION_PEAKS):
+    return sum(height * np.exp(-0.5 * ((wavelengths - center) / width) ** 2) for center, width, height in peaks)
+
+
+def concentration_series(n_concentrations, max_concentration=100.0):
+    # Distinct concentrations starting at 0 (the reference); used as filenames
+    return np.round(np.linspace(0.0, max_concentration, n_concentrations), 3)
+
+
+def spectrum_csv(wavelengths, values):
+    # Bytes of one two-column CSV in the CCS100 export layout
+    lines = [f"{w:.3f},{v:.6f}" for w, v in zip(wavelengths, values)]
+    return (f"{WAVELENGTH_COLUMN},{VALUE_COLUMN}\n" + "\n".join(lines) + "\n").encode()
+
+
+def generate_dataset(root_folder, n_replicates=3, n_concentrations=10, n_pixels=N_PIXELS,
+                     max_concentration=100.0, dark_level=0.01, noise=0.002, seed=0):
+    """Write a back/ + sample/ tree of synthetic spectra. Returns the number of spectra written."""
+    rng = np.random.default_rng(seed)
+    wavelengths = ccs100_wavelengths(n_pixels)
+    lamp = lamp_spectrum(wavelengths)
+    epsilon = molar_absorptivity(wavelengths)
+    # Fixed-pattern dark signal shared by all spectra, as on a real detector
+    dark = dark_level * (1.0 + 0.2 * rng.standard_normal(n_pixels))
+
+    n_written = 0
+    for replicate in range(1, n_replicates + 1):
+        back_folder = os.path.join(root_folder, 'back', str(replicate))
+        sample_folder = os.path.join(root_folder, 'sample', str(replicate))
+        os.makedirs(back_folder, exist_ok=True)
+        os.makedirs(sample_folder, exist_ok=True)
+        # Small lamp drift between replicates
+        replicate_lamp = lamp * (1.0 + 0.01 * rng.standard_normal())
+        for c in concentration_series(n_concentrations, max_concentration):
+            filename = f"{c:g}.csv"
+            background = dark + noise * rng.standard_normal(n_pixels)
+            sample = dark + replicate_lamp * 10.0 ** (-c * epsilon) + noise * rng.standard_normal(n_pixels)
+            with open(os.path.join(back_folder, filename), 'wb') as f:
+                f.write(spectrum_csv(wavelengths, background))
+            with open(os.path.join(sample_folder, filename), 'wb') as f:
+                f.write(spectrum_csv(wavelengths, sample))
+            n_written += 2
+    return n_written
+
+
+if __name__ == '__main__':
+    # Usage: python synthetic_data.py <output root folder> [replicates] [concentrations]
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python synthetic_data.py <output root folder> [replicates] [concentrations]")
+        sys.exit(1)
+    n = generate_dataset(sys.argv[1], *(int(a) for a in sys.argv[2:]))
+    print(f"✅ {n} synthetic spectra written to: {sys.argv[1]}")
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from calibration import fit_calibration
+
+sklearn_linear_model = pytest.importorskip('sklearn.linear_model')
+
+
+def reference_fit(x, y):
+    # The per-wavelength loop linear_fit.py ran before: fit, drop |residual| > 2 std, refit
+    X = x.reshape(-1, 1)
+    model = sklearn_linear_model.LinearRegression().fit(X, y)
+    residuals = y - model.predict(X)
+    inliers = np.abs(residuals) <= 2 * np.std(residuals)
+    if inliers.sum() < 2:
+        return None
+    model = sklearn_linear_model.LinearRegression().fit(X[inliers], y[inliers])
+    return model.coef_[0], model.intercept_, model.score(X[inliers], y[inliers]), inliers
+
+
+def test_fit_calibration_matches_linear_regression():
+    rng = np.random.default_rng(0)
+    x = np.concatenate([[0.0], np.linspace(1, 50, 15)])
+    A = np.outer(x, rng.uniform(0.001, 0.02, 40)) + rng.normal(0, 0.005, (len(x), 40))
+    A[0] = 0.0                      # the (0, 0) point of linear_fit.py
+    A[5, 3] += 0.5                  # outliers that the residual filter drops
+    A[9, 10] -= 0.3
+    A[:, 20] = 0.1                  # constant column
+    A[4, 30] = np.nan               # a missing value: the column cannot be fitted
+    columns = np.ones(40, dtype=bool)
+    columns[35:] = False            # not fitted at all
+
+    fit = fit_calibration(x, A, columns=columns, memory_budget_mb=0.001)
+
+    for i in range(40):
+        expected = reference_fit(x, A[:, i]) if columns[i] and np.isfinite(A[:, i]).all() else None
+        if expected is None:
+            assert np.isnan(fit.slope[i]) and np.isnan(fit.intercept[i])
+            assert fit.r2[i] == 0 and fit.n_inliers[i] == 0 and fit.mean_abs[i] == 0
+            assert not fit.inlier_mask[:, i].any()
+            continue
+        slope, intercept, r2, inliers = expected
+        np.testing.assert_array_equal(fit.inlier_mask[:, i], inliers)
+        assert fit.n_inliers[i] == inliers.sum()
+        assert fit.slope[i] == pytest.approx(slope, rel=1e-9, abs=1e-12)
+        assert fit.intercept[i] == pytest.approx(intercept, rel=1e-9, abs=1e-12)
+        assert fit.r2[i] == pytest.approx(r2, rel=1e-9, abs=1e-12)
+        assert fit.mean_abs[i] == pytest.approx(A[inliers, i].mean(), rel=1e-12)
+    assert not fit.inlier_mask[5, 3] and not fit.inlier_mask[9, 10]
+    assert fit.r2[20] == 1.0 and fit.n_inliers[20] == len(x)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from kinetics import fit_kinetics, fit_orders
+
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_traces_with_too_few_points_get_nan(order):
+    # NaN-padded time x replicate table: a full trace, then traces with 0, 1 and 2 points
+    t = np.array([0.0, 30.0, 60.0, 120.0, 240.0, 480.0])
+    full = 0.2 + 0.8 * (1.0 - np.exp(-0.01 * t))
+    traces = np.full((4, len(t)), np.nan)
+    traces[0] = full
+    traces[2, 1] = full[1]
+    traces[3, :2] = full[:2]
+
+    fit = fit_kinetics(t, traces, order)
+
+    assert fit.n_points.tolist() == [6, 0, 1, 2]
+    assert fit.converged.tolist() == [True, False, False, False]
+    for field in ('k', 'k_err', 'y0', 'y0_err', 'y_inf', 'y_inf_err', 'r2', 'rmse', 'aic'):
+        assert np.isnan(getattr(fit, field)[1:]).all(), field
+    assert np.isfinite(fit.k[0]) and np.isfinite(fit.k_err[0])
+    if order == 1:
+        assert fit.k[0] == pytest.approx(0.01, rel=1e-6)
+
+
+def test_fit_orders_with_all_nan_trace():
+    t = np.array([0.0, 60.0, 120.0, 240.0])
+    traces = np.array([[1.0, 0.6, 0.35, 0.13], [np.nan] * 4])
+    fits, best = fit_orders(t, traces)
+    assert best[0] == 1
+    assert not any(fits[order].converged[1] for order in fits)
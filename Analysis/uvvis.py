@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import runpy
+import sys
+
+from settings import COMMANDS, CONFIG_ENV, SETTINGS_ENV, load_config
+
+# Single command-line entry point for the Analysis scripts, one command per script:
+#
+#   python uvvis.py dark
+#   python uvvis.py --config run1.json fit --set target_range=[400,420] --set calibration_mode=pls
+#   python uvvis.py synthetic /tmp/ccs100 3 10
+#
+# Paths and parameters come from the JSON config file (--config, default ./uvvis.json when it
+# exists; see settings.py for the format) and from --set NAME=VALUE, where VALUE is read as
+# JSON when possible (numbers, true/false/null, lists) and as a plain string otherwise.
+# Only the script of the chosen command is run, together with the helper modules it imports
+# at the top (NumPy and the small spectrum modules); pandas, scipy and matplotlib are imported
+# inside the functions that need them, so e.g. `dark` starts without loading any of them
+# until it writes its first CSV. The scripts still run on their own with `python <script>.py`
+# as well.
+
+DEFAULT_CONFIG = 'uvvis.json'
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_assignments(assignments):
+    # ['name=value', ...] -> {name: value}
+    settings = {}
+    for assignment in assignments:
+        name, sep, value = assignment.partition('=')
+        if not sep or not name:
+            raise SystemExit(f"❌ --set expects NAME=VALUE, got '{assignment}'")
+        settings[name.strip()] = parse_value(value)
+    return settings
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='uvvis', description="UV-Vis (CCS100) spectrum analysis")
+    parser.add_argument('-c', '--config', help=f"JSON config file (default: ./{DEFAULT_CONFIG} if it exists)")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+    for command, (script, description) in COMMANDS.items():
+        sub = commands.add_parser(command, help=description, description=f"{description} ({script})")
+        sub.add_argument('-s', '--set', dest='assignments', action='append', default=[], metavar='NAME=VALUE',
+                         help="override one configuration variable of the script")
+        sub.add_argument('args', nargs='*', help="arguments passed on to the script")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    config_file = args.config or (DEFAULT_CONFIG if os.path.isfile(DEFAULT_CONFIG) else None)
+    if config_file:
+        load_config(config_file)  # report a broken file before anything runs
+        os.environ[CONFIG_ENV] = os.path.abspath(config_file)
+    if args.assignments:
+        os.environ[SETTINGS_ENV] = json.dumps(parse_assignments(args.assignments))
+
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), COMMANDS[args.command][0])
+    sys.argv = [script_path] + args.args
+    runpy.run_path(script_path, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
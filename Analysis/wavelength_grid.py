@@ -0,0 +1,115 @@
+import hashlib
+
+import numpy as np
+
+# Registry of wavelength grids (the first column of the CSV spectra).
+#
+# Every file's wavelength axis is fingerprinted; files that share an axis share one
+# WavelengthGrid object, so the sort order, wavelength masks, window slices and
+# interpolation weights are computed once per grid instead of once per file.
+# Spectra on a different grid are resampled onto a reference grid with one batched
+# linear interpolation (same result as np.interp, edge values are held constant)
+# instead of being skipped.
+
+
+def fingerprint(wavelengths):
+    # Content hash of a wavelength axis
+    data = np.ascontiguousarray(wavelengths, dtype=np.float64)
+    return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest() + f"-{len(data)}"
+
+
+class WavelengthGrid:
+    """One wavelength axis plus everything derived from it."""
+
+    def __init__(self, wavelengths, key):
+        self.key = key
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        order = np.argsort(self.wavelengths, kind='stable')
+        self.is_sorted = bool(np.all(order == np.arange(len(order))))
+        self.order = None if self.is_sorted else order
+        self.sorted_wavelengths = self.wavelengths if self.is_sorted else self.wavelengths[order]
+        self._masks = {}
+        self._windows = {}
+        self._resamplers = {}
+
+    def __len__(self):
+        return len(self.wavelengths)
+
+    def sort(self, values):
+        # Values (last axis = pixels) in ascending wavelength order; no copy if already sorted
+        return values if self.is_sorted else np.asarray(values)[..., self.order]
+
+    def mask(self, low, high):
+        # Boolean mask of low <= wavelength <= high, in the grid's own pixel order
+        if (low, high) not in self._masks:
+            self._masks[(low, high)] = (self.wavelengths >= low) & (self.wavelengths <= high)
+        return self._masks[(low, high)]
+
+    def window(self, low, high):
+        # slice of the sorted grid covering low <= wavelength <= high (use with sort())
+        if (low, high) not in self._windows:
+            start = np.searchsorted(self.sorted_wavelengths, low, side='left')
+            stop = np.searchsorted(self.sorted_wavelengths, high, side='right')
+            self._windows[(low, high)] = slice(int(start), int(stop))
+        return self._windows[(low, high)]
+
+    def _resampler(self, target):
+        # Indices/weights that interpolate this grid (sorted) at the target's wavelengths
+        if target.key not in self._resamplers:
+            x = self.sorted_wavelengths
+            t = np.clip(target.wavelengths, x[0], x[-1])
+            right = np.clip(np.searchsorted(x, t, side='right'), 1, len(x) - 1)
+            left = right - 1
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weight = np.where(x[right] > x[left], (t - x[left]) / (x[right] - x[left]), 0.0)
+            self._resamplers[target.key] = (left, right, weight)
+        return self._resamplers[target.key]
+
+    def resample(self, values, target):
+        # Values on this grid (last axis = pixels, any number of spectra) -> values on the
+        # target grid, in the target's pixel order. Returned unchanged if the grids are the same
+        if target is self:
+            return values
+        left, right, weight = self._resampler(target)
+        values = self.sort(np.asarray(values, dtype=np.float64))
+        return values[..., left] * (1.0 - weight) + values[..., right] * weight
+
+    def resample_coefficients(self, coef, target):
+        # Coefficients on this grid (own pixel order) such that
+        # values @ result == resample(values, target) @ coef, i.e. a linear functional of the
+        # resampled spectra applied to the original spectra without resampling them
+        if target is self:
+            return coef
+        left, right, weight = self._resampler(target)
+        result = np.zeros(len(self))
+        np.add.at(result, left, (1.0 - weight) * coef)
+        np.add.at(result, right, weight * coef)
+        if self.is_sorted:
+            return result
+        unsorted = np.empty_like(result)
+        unsorted[self.order] = result
+        return unsorted
+
+
+class GridRegistry:
+    """Fingerprint -> WavelengthGrid, so each distinct axis is analysed once."""
+
+    def __init__(self):
+        self._grids = {}
+
+    def __len__(self):
+        return len(self._grids)
+
+    def grid(self, wavelengths):
+        key = fingerprint(wavelengths)
+        if key not in self._grids:
+            self._grids[key] = WavelengthGrid(wavelengths, key)
+        return self._grids[key]
+
+
+# Registry shared by the scripts of one process
+default_registry = GridRegistry()
+
+
+def get_grid(wavelengths):
+    return default_registry.grid(wavelengths)